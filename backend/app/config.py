@@ -1,9 +1,14 @@
 from __future__ import annotations
 
-from pydantic import BaseModel
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
 
 
-class Settings(BaseModel):
+@dataclass(frozen=True, slots=True)
+class Settings:
     # OpenRouter
     openrouter_api_key: str = ""
     openrouter_base_url: str = "https://openrouter.ai/api/v1"
@@ -16,6 +21,12 @@ class Settings(BaseModel):
     embedding_model: str = "qwen/qwen3-embedding-8b"
     embedding_dim: int = 4096
     embedding_dim_fast_mode: int = 1024  # MRL: use lower dimension in fast mode for speed
+    embedding_concurrency: int = 20  # max in-flight embedding batch requests during ingestion
+    embedding_batch_size: int = 32  # chunks per embedding request during ingestion
+    embedding_encoding_format: str = "base64"  # "base64" (packed float32) or "float" (JSON arrays)
+    # /chat query embeddings arriving within this window share one request (0 = off).
+    # Off by default: every chat would wait out the window even with nothing to merge.
+    query_embedding_batch_window_ms: int = 0
     embedding_query_use_instruction: bool = True
     embedding_query_include_raw: bool = True
     embedding_query_instruction_template: str = "Instruct: {task}\nQuery:{query}"
@@ -23,6 +34,15 @@ class Settings(BaseModel):
         "Given a question, retrieve relevant passages from the document that explicitly contain the answer."
     )
 
+    # Uploads larger than this are rejected with 413 (0 = no limit).
+    max_upload_bytes: int = 100 * 1024 * 1024
+
+    # Ingestion: parse/chunk worker processes (0 = threads in the server process).
+    # Each worker loads its own chunking models, so keep this small on low-memory servers.
+    ingest_workers: int = 1
+    # Background ingestions allowed to run at once; later uploads wait for a slot.
+    max_concurrent_ingests: int = 2
+
     # Chunking
     chunk_target_tokens: int = 6144
     chunk_overlap_tokens: int = 600
@@ -35,12 +55,21 @@ class Settings(BaseModel):
     # Query embedding aggregation decay factor (0.7 means each subsequent embedding has 0.7x weight)
     embedding_aggregation_decay: float = 0.7
 
+    # Vector index storage: "none" keeps fp32 vectors, "int8" scalar-quantizes them (~4x less RAM)
+    vector_quantization: str = "none"
+    # ANN index for large corpora: "ivfpq" (compact, re-scored) or "hnsw" (exact scores, more RAM)
+    vector_ann_index: str = "ivfpq"
+    # faiss OpenMP threads (0 = faiss default, one per core)
+    faiss_threads: int = 0
+
     # Retrieval (recall-oriented)
     query_fusion_enabled: bool = True
     query_variants_count: int = 6
     query_variants_max: int = 8
     hyde_enabled: bool = True
     hyde_max_words: int = 140
+    # Ask for variants and HyDE in one JSON call (chat_model_complex) instead of two.
+    query_aids_single_call: bool = False
 
     # Query drift filtering
     drift_filter_enabled: bool = True
@@ -57,79 +86,109 @@ class Settings(BaseModel):
     llm_rerank_model: str = ""  # default: use chat_model
     llm_rerank_candidate_pool: int = 30
     llm_rerank_max_chars: int = 900
+    # Per-passage cap in estimated tokens; when > 0 it replaces llm_rerank_max_chars.
+    llm_rerank_max_tokens_per_passage: int = 0
+    # Output-token cap for the rerank reply (0 = none). Dense ids tokenize
+    # poorly, so leave generous headroom when setting it.
+    llm_rerank_max_output_tokens: int = 0
+    # Skip the rerank call when every query retrieved the same rerank pool. Off by
+    # default: the fused order is kept, so rerank's reordering is given up.
+    llm_rerank_skip_unanimous: bool = False
+
+    # Exact-match cache for temperature-0 chat completions (0 entries = off).
+    # Process-wide and not tied to sessions: cached prompts/answers (built from
+    # uploaded text) outlive the session by up to llm_cache_ttl_seconds.
+    llm_cache_max_entries: int = 0
+    llm_cache_ttl_seconds: int = 3600
 
     # Sessions
     session_ttl_seconds: int = 60 * 30  # 30 minutes inactivity
     session_cleanup_interval_seconds: int = 30
+    # SSE log lines kept per session for replay (and per-stream queue bound)
+    log_history_max: int = 2000
 
     # Chat limits (approximate; we estimate tokens)
     chat_model_context_limit_tokens: int = 32768
 
 
+_TRUTHY = frozenset({"1", "true", "yes", "y", "on"})
+
+# KEY=value, optionally prefixed with `export`, with '...' / "..." quoting and
+# trailing ` # comment` support. Blank and comment-only lines do not match.
+_DOTENV_RE = re.compile(
+    r"""^\s*(?:export\s+)?([A-Za-z_][A-Za-z0-9_.]*)\s*=\s*"""
+    r"""(?:"([^"]*)"|'([^']*)'|(.*?))\s*(?:\s#.*)?$"""
+)
+
+
+def _parse_dotenv_line(line: str) -> tuple[str, str] | None:
+    m = _DOTENV_RE.match(line)
+    if m is None:
+        return None
+    key, double_quoted, single_quoted, bare = m.groups()
+    if double_quoted is not None:
+        return key, double_quoted
+    if single_quoted is not None:
+        return key, single_quoted
+    return key, bare or ""
+
+
+def _load_dotenv_file(path: Path) -> None:
+    """
+    Best-effort .env reader. Only sets variables not already in os.environ.
+    """
+    try:
+        content = path.read_text(encoding="utf-8")
+    except OSError:
+        return
+    for raw_line in content.splitlines():
+        parsed = _parse_dotenv_line(raw_line)
+        if parsed is None:
+            continue
+        key, value = parsed
+        os.environ.setdefault(key, value)
+
+
+def _try_load_dotenv() -> None:
+    # Containers that inject the full environment can skip the file probes.
+    if (os.getenv("ERR_SKIP_DOTENV") or "").strip().lower() in _TRUTHY:
+        return
+
+    # Optional explicit override, useful in tests / deployments.
+    explicit = (os.getenv("ENV_FILE") or "").strip()
+    candidates: list[Path] = []
+    if explicit:
+        candidates.append(Path(explicit))
+
+    # Typical dev usage from repo root: `backend/.env`
+    candidates.append(Path("backend/.env"))
+
+    # Also support running from within `backend/`
+    candidates.append(Path(".env"))
+
+    for candidate in candidates:
+        if candidate.is_file():
+            _load_dotenv_file(candidate)
+            break
+
+
+@lru_cache(maxsize=1)
 def load_settings() -> Settings:
     """
     Lightweight env loader without extra dependency.
-    """
 
-    import os
-    from pathlib import Path
-
-    def _parse_dotenv_line(line: str) -> tuple[str, str] | None:
-        stripped = line.strip()
-        if not stripped or stripped.startswith("#"):
-            return None
-        if stripped.startswith("export "):
-            stripped = stripped[len("export ") :].lstrip()
-        if "=" not in stripped:
-            return None
-        key, value = stripped.split("=", 1)
-        key = key.strip()
-        value = value.strip()
-        if not key:
-            return None
-
-        # Remove surrounding single or double quotes.
-        if len(value) >= 2 and value[0] == value[-1] and value[0] in {"'", '"'}:
-            value = value[1:-1]
-        return key, value
-
-    def _load_dotenv_file(path: Path) -> None:
-        """
-        Best-effort .env reader. Only sets variables not already in os.environ.
-        """
-        try:
-            content = path.read_text(encoding="utf-8")
-        except OSError:
-            return
-        for raw_line in content.splitlines():
-            parsed = _parse_dotenv_line(raw_line)
-            if parsed is None:
-                continue
-            key, value = parsed
-            os.environ.setdefault(key, value)
-
-    def _try_load_dotenv() -> None:
-        # Optional explicit override, useful in tests / deployments.
-        explicit = (os.getenv("ENV_FILE") or "").strip()
-        candidates: list[Path] = []
-        if explicit:
-            candidates.append(Path(explicit))
-
-        # Typical dev usage from repo root: `backend/.env`
-        candidates.append(Path("backend/.env"))
-
-        # Also support running from within `backend/`
-        candidates.append(Path(".env"))
-
-        for candidate in candidates:
-            if candidate.is_file():
-                _load_dotenv_file(candidate)
-                break
+    The result is cached for the lifetime of the process: `.env` and the
+    environment are read once, so later changes to `os.environ` are not picked
+    up. Call `reload_settings()` to take a fresh snapshot (e.g. in tests).
+    """
 
     _try_load_dotenv()
 
+    # Snapshot once; every lookup below is a plain dict read.
+    env = dict(os.environ)
+
     def getenv_int(name: str, default: int) -> int:
-        raw = os.getenv(name)
+        raw = env.get(name)
         if raw is None or raw.strip() == "":
             return default
         try:
@@ -138,7 +197,7 @@ def load_settings() -> Settings:
             return default
 
     def getenv_float(name: str, default: float) -> float:
-        raw = os.getenv(name)
+        raw = env.get(name)
         if raw is None or raw.strip() == "":
             return default
         try:
@@ -147,46 +206,65 @@ def load_settings() -> Settings:
             return default
 
     def getenv_bool(name: str, default: bool) -> bool:
-        raw = os.getenv(name)
+        raw = env.get(name)
         if raw is None or raw.strip() == "":
             return default
-        return raw.strip().lower() in {"1", "true", "yes", "y", "on"}
+        return raw.strip().lower() in _TRUTHY
 
     return Settings(
-        openrouter_api_key=os.getenv("OPENROUTER_API_KEY", ""),
-        openrouter_base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
-        openrouter_http_referer=os.getenv("OPENROUTER_HTTP_REFERER", "http://localhost:3000"),
-        openrouter_x_title=os.getenv("OPENROUTER_X_TITLE", "ERR-App"),
-        chat_model=os.getenv("OPENROUTER_CHAT_MODEL", "google/gemini-2.5-flash"),
-        chat_model_simple=os.getenv("OPENROUTER_CHAT_MODEL_SIMPLE", "google/gemini-2.5-flash-lite-preview-09-2025"),
-        chat_model_complex=os.getenv("OPENROUTER_CHAT_MODEL_COMPLEX", "google/gemini-2.5-flash-preview-09-2025"),
-        embedding_model=os.getenv("OPENROUTER_EMBEDDING_MODEL", "qwen/qwen3-embedding-8b"),
+        openrouter_api_key=env.get("OPENROUTER_API_KEY", ""),
+        openrouter_base_url=env.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+        openrouter_http_referer=env.get("OPENROUTER_HTTP_REFERER", "http://localhost:3000"),
+        openrouter_x_title=env.get("OPENROUTER_X_TITLE", "ERR-App"),
+        chat_model=env.get("OPENROUTER_CHAT_MODEL", "google/gemini-2.5-flash"),
+        chat_model_simple=env.get("OPENROUTER_CHAT_MODEL_SIMPLE", "google/gemini-2.5-flash-lite-preview-09-2025"),
+        chat_model_complex=env.get("OPENROUTER_CHAT_MODEL_COMPLEX", "google/gemini-2.5-flash-preview-09-2025"),
+        embedding_model=env.get("OPENROUTER_EMBEDDING_MODEL", "qwen/qwen3-embedding-8b"),
         embedding_dim=getenv_int("OPENROUTER_EMBEDDING_DIM", 4096),
         embedding_dim_fast_mode=getenv_int("ERR_EMBEDDING_DIM_FAST_MODE", 1024),
+        embedding_concurrency=max(1, getenv_int("ERR_EMBEDDING_CONCURRENCY", 20)),
+        embedding_batch_size=max(1, getenv_int("ERR_EMBEDDING_BATCH_SIZE", 32)),
+        embedding_encoding_format=(
+            "float"
+            if env.get("ERR_EMBEDDING_ENCODING_FORMAT", "").strip().lower() == "float"
+            else "base64"
+        ),
+        query_embedding_batch_window_ms=max(0, getenv_int("ERR_QUERY_EMBEDDING_BATCH_WINDOW_MS", 0)),
         embedding_query_use_instruction=getenv_bool(
             "ERR_EMBEDDING_QUERY_USE_INSTRUCTION", True
         ),
         embedding_query_include_raw=getenv_bool("ERR_EMBEDDING_QUERY_INCLUDE_RAW", True),
-        embedding_query_instruction_template=os.getenv(
+        embedding_query_instruction_template=env.get(
             "ERR_EMBEDDING_QUERY_INSTRUCTION_TEMPLATE",
             "Instruct: {task}\nQuery:{query}",
         ),
-        embedding_query_task=os.getenv(
+        embedding_query_task=env.get(
             "ERR_EMBEDDING_QUERY_TASK",
             "Given a question, retrieve relevant passages from the document that explicitly contain the answer.",
         ),
+        max_upload_bytes=max(0, getenv_int("ERR_MAX_UPLOAD_MB", 100)) * 1024 * 1024,
+        ingest_workers=max(0, getenv_int("ERR_INGEST_WORKERS", 1)),
+        max_concurrent_ingests=max(1, getenv_int("ERR_MAX_CONCURRENT_INGESTS", 2)),
         # Chunking params - keep small for low-memory servers (2G)
         chunk_target_tokens=512,
         chunk_overlap_tokens=50,
         semantic_chunking_enabled=True,
         semantic_chunking_threshold=0.5,
-        repack_strategy=os.getenv("ERR_REPACK_STRATEGY", "reverse"),
+        repack_strategy=env.get("ERR_REPACK_STRATEGY", "reverse"),
         embedding_aggregation_decay=getenv_float("ERR_EMBEDDING_AGGREGATION_DECAY", 0.7),
+        vector_quantization=(
+            "int8" if env.get("ERR_VECTOR_QUANTIZATION", "").strip().lower() == "int8" else "none"
+        ),
+        vector_ann_index=(
+            "hnsw" if env.get("ERR_VECTOR_ANN_INDEX", "").strip().lower() == "hnsw" else "ivfpq"
+        ),
+        faiss_threads=getenv_int("ERR_FAISS_THREADS", 0),
         query_fusion_enabled=getenv_bool("ERR_QUERY_FUSION_ENABLED", True),
         query_variants_count=getenv_int("ERR_QUERY_VARIANTS_COUNT", 6),
         query_variants_max=getenv_int("ERR_QUERY_VARIANTS_MAX", 8),
         hyde_enabled=getenv_bool("ERR_HYDE_ENABLED", True),
         hyde_max_words=getenv_int("ERR_HYDE_MAX_WORDS", 140),
+        query_aids_single_call=getenv_bool("ERR_QUERY_AIDS_SINGLE_CALL", False),
         drift_filter_enabled=getenv_bool("ERR_DRIFT_FILTER_ENABLED", True),
         drift_sim_threshold=getenv_float("ERR_DRIFT_SIM_THRESHOLD", 0.25),
         hyde_drift_sim_threshold=getenv_float("ERR_HYDE_DRIFT_SIM_THRESHOLD", 0.15),
@@ -194,14 +272,28 @@ def load_settings() -> Settings:
         fusion_per_query_top_k=getenv_int("ERR_FUSION_PER_QUERY_TOP_K", 50),
         fusion_max_candidates=getenv_int("ERR_FUSION_MAX_CANDIDATES", 120),
         llm_rerank_enabled=getenv_bool("ERR_LLM_RERANK_ENABLED", True),
-        llm_rerank_model=os.getenv("ERR_LLM_RERANK_MODEL", ""),
+        llm_rerank_model=env.get("ERR_LLM_RERANK_MODEL", ""),
         llm_rerank_candidate_pool=getenv_int("ERR_LLM_RERANK_CANDIDATE_POOL", 30),
         llm_rerank_max_chars=getenv_int("ERR_LLM_RERANK_MAX_CHARS", 900),
+        llm_rerank_max_tokens_per_passage=getenv_int("ERR_LLM_RERANK_MAX_TOKENS_PER_PASSAGE", 0),
+        llm_rerank_max_output_tokens=max(0, getenv_int("ERR_LLM_RERANK_MAX_OUTPUT_TOKENS", 0)),
+        llm_rerank_skip_unanimous=getenv_bool("ERR_LLM_RERANK_SKIP_UNANIMOUS", False),
+        llm_cache_max_entries=max(0, getenv_int("ERR_LLM_CACHE_MAX_ENTRIES", 0)),
+        llm_cache_ttl_seconds=max(0, getenv_int("ERR_LLM_CACHE_TTL_SECONDS", 3600)),
         session_ttl_seconds=getenv_int("ERR_SESSION_TTL_SECONDS", 60 * 30),
         session_cleanup_interval_seconds=getenv_int(
             "ERR_SESSION_CLEANUP_INTERVAL_SECONDS", 30
         ),
+        log_history_max=max(1, getenv_int("ERR_LOG_HISTORY_MAX", 2000)),
         chat_model_context_limit_tokens=getenv_int(
             "ERR_CHAT_MODEL_CONTEXT_LIMIT_TOKENS", 32768
         ),
     )
+
+
+def reload_settings() -> Settings:
+    """
+    Drop the cached snapshot and re-read `.env` + environment.
+    """
+    load_settings.cache_clear()
+    return load_settings()
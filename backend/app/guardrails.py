@@ -14,25 +14,15 @@ class GuardrailResult:
     reason: str | None = None
 
 
-_CITATION_RE = re.compile(r"\[(\d+)\]")
+# Inline citation marker "[n]"; shared with main.py so both parsers agree.
+CITATION_RE = re.compile(r"\[(\d+)\]")
 
 
 def extract_citation_numbers(text: str) -> list[int]:
-    nums: list[int] = []
-    for m in _CITATION_RE.finditer(text):
-        try:
-            nums.append(int(m.group(1)))
-        except ValueError:
-            continue
+    if "[" not in text:
+        return []
     # ordered unique
-    seen: set[int] = set()
-    ordered: list[int] = []
-    for n in nums:
-        if n in seen:
-            continue
-        seen.add(n)
-        ordered.append(n)
-    return ordered
+    return list(dict.fromkeys(int(m.group(1)) for m in CITATION_RE.finditer(text)))
 
 
 def enforce_strict_rag_answer(
@@ -53,23 +43,27 @@ def enforce_strict_rag_answer(
         return GuardrailResult(ok=False, answer=STRICT_NO_MENTION, reason="empty_answer")
 
     if raw == STRICT_NO_MENTION:
-        return GuardrailResult(ok=True, answer=raw)
-
-    nums = extract_citation_numbers(raw)
-
-    if require_citations and not nums:
+        # Hand back the module constant rather than the caller's copy.
+        return GuardrailResult(ok=True, answer=STRICT_NO_MENTION)
+
+    # Single pass: range-check citations as they are found.
+    has_citation = False
+    for m in CITATION_RE.finditer(raw):
+        n = int(m.group(1))
+        if n < 1 or n > context_size:
+            return GuardrailResult(
+                ok=False,
+                answer=STRICT_NO_MENTION,
+                reason="out_of_range_citations",
+            )
+        has_citation = True
+
+    if require_citations and not has_citation:
         return GuardrailResult(
             ok=False,
             answer=STRICT_NO_MENTION,
             reason="missing_citations",
         )
 
-    if any(n < 1 or n > context_size for n in nums):
-        return GuardrailResult(
-            ok=False,
-            answer=STRICT_NO_MENTION,
-            reason="out_of_range_citations",
-        )
-
     return GuardrailResult(ok=True, answer=raw)
 
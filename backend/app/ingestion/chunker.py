@@ -1,28 +1,72 @@
 from __future__ import annotations
 
+import hashlib
 import os
+import platform
 import re
-from typing import Any
+from typing import Any, Iterator
 from uuid import uuid4
 import numpy as np
 
 from ..models.chunk import ChunkModel
 from .file_parser import ParsedBlock
 
-try:
-    import spacy
-except ImportError:
-    spacy = None
+# spacy and sentence-transformers (which pulls in torch) are imported lazily
+# in _ensure_spacy/_ensure_embed_model so non-semantic paths never pay for them.
 
-try:
-    import jieba
-except ImportError:
-    jieba = None
 
-try:
-    from sentence_transformers import SentenceTransformer
-except ImportError:
-    SentenceTransformer = None
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]")
+_CJK_SENTENCE_RE = re.compile(r"[^。？！\n]*[。？！\n]|[^。？！\n]+")
+
+# Maps ASCII [A-Za-z0-9] to b"\x01" and every other byte to b"\x00", so Latin
+# runs can be counted in C with bytes.count() instead of a regex over str.
+_LATIN_TABLE = bytes(
+    1 if (0x30 <= i <= 0x39 or 0x41 <= i <= 0x5A or 0x61 <= i <= 0x7A) else 0
+    for i in range(256)
+)
+
+# Below this length the UTF-32 encode costs more than the byte-table scan it replaces.
+_TOKEN_ESTIMATE_NUMPY_MIN_CHARS = 4096
+# A semantic breakpoint only splits a chunk holding more than this many tokens.
+_SEMANTIC_MIN_CHUNK_TOKENS = 50
+
+
+def _token_start_marks(text: str) -> np.ndarray:
+    """
+    Per-codepoint int8 array with a 1 wherever `estimate_tokens` would count a
+    token: every CJK char, and the first char of every [A-Za-z0-9] run.
+    """
+    codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    is_cjk = (codes >= 0x4E00) & (codes <= 0x9FFF)
+    is_alnum = (
+        ((codes >= 0x30) & (codes <= 0x39))
+        | ((codes >= 0x41) & (codes <= 0x5A))
+        | ((codes >= 0x61) & (codes <= 0x7A))
+    )
+    # Each Latin run starts where an alnum codepoint follows a non-alnum one.
+    run_start = is_alnum.copy()
+    run_start[1:] &= ~is_alnum[:-1]
+    return is_cjk.view(np.int8) + run_start.view(np.int8)
+
+
+def _estimate_tokens_numpy(text: str) -> int:
+    return int(np.count_nonzero(_token_start_marks(text)))
+
+
+def estimate_tokens_bulk(texts: list[str]) -> np.ndarray:
+    """
+    `estimate_tokens` for many texts at once, as an int64 array aligned with `texts`.
+
+    The texts are joined with a newline (not alnum, so runs never merge across
+    texts) and scanned in one vectorized pass.
+    """
+    if not texts:
+        return np.zeros(0, dtype=np.int64)
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    # Trailing separator keeps every start offset in bounds, even for an empty last text.
+    marks = _token_start_marks("\n".join(texts) + "\n")
+    starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+    return np.add.reduceat(marks.astype(np.int64), starts)
 
 
 def estimate_tokens(text: str) -> int:
@@ -32,11 +76,53 @@ def estimate_tokens(text: str) -> int:
     - Latin words/numbers count as ~1 token each
     """
 
-    cjk = len(re.findall(r"[\u4e00-\u9fff]", text))
-    latin = len(re.findall(r"[A-Za-z0-9]+", text))
+    if len(text) > _TOKEN_ESTIMATE_NUMPY_MIN_CHARS:
+        return _estimate_tokens_numpy(text)
+    # "replace" keeps one non-alnum placeholder per non-ASCII char, so runs
+    # separated by CJK text are not merged.
+    flags = text.encode("ascii", "replace").translate(_LATIN_TABLE)
+    latin = flags.count(b"\x00\x01") + flags.startswith(b"\x01")
+    cjk = 0 if text.isascii() else len(_CJK_RE.findall(text))
     return cjk + latin
 
 
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Longest prefix of `text` that `estimate_tokens` counts as at most `max_tokens`.
+    """
+    if max_tokens <= 0:
+        return ""
+    # Every counted token starts on its own char, so short texts always fit.
+    if len(text) <= max_tokens:
+        return text
+    starts = np.flatnonzero(_token_start_marks(text))
+    if len(starts) <= max_tokens:
+        return text
+    return text[: int(starts[max_tokens])]
+
+
+def _env_truthy(name: str) -> bool:
+    raw = os.getenv(name)
+    return bool(raw) and raw.strip().lower() in {"1", "true", "yes", "y", "on"}
+
+
+def _load_onnx_int8_model(SentenceTransformer: Any) -> Any:
+    """
+    MiniLM through ONNX Runtime with the dynamically quantized int8 weights
+    published alongside the model (needs sentence-transformers>=3.2 and
+    optimum[onnxruntime]). Roughly 2x faster on CPU than the fp32 torch model,
+    with negligible drift in the cosine distances used for breakpoints.
+    """
+    machine = platform.machine().lower()
+    variant = "arm64" if machine in {"arm64", "aarch64"} else "avx512_vnni"
+    return SentenceTransformer(
+        "all-MiniLM-L6-v2",
+        device="cpu",
+        backend="onnx",
+        model_kwargs={"file_name": f"onnx/model_qint8_{variant}.onnx"},
+    )
+
+
 class Chunker:
     def __init__(
         self,
@@ -52,6 +138,7 @@ class Chunker:
         self.semantic_threshold = semantic_threshold
         
         self._spacy_nlp = None
+        self._spacy_failed = False
         self._embed_model = None
         self._embed_model_failed = False
 
@@ -75,33 +162,44 @@ class Chunker:
             os.environ.setdefault("REQUESTS_CA_BUNDLE", ca_bundle)
             os.environ.setdefault("SSL_CERT_FILE", ca_bundle)
 
-        raw_disable_ssl = os.getenv("ERR_HF_DISABLE_SSL_VERIFY")
-        if raw_disable_ssl and raw_disable_ssl.strip().lower() in {"1", "true", "yes", "y", "on"}:
+        if _env_truthy("ERR_HF_DISABLE_SSL_VERIFY"):
             os.environ.setdefault("HF_HUB_DISABLE_SSL_VERIFY", "1")
 
     def _ensure_spacy(self) -> None:
-        if self._spacy_nlp is not None:
+        if self._spacy_nlp is not None or self._spacy_failed:
             return
-        if spacy is None:
+        try:
+            import spacy
+        except ImportError:
             # Fallback if spacy not installed, though it should be
              print("Warning: spacy not installed, falling back to simple split")
+             self._spacy_failed = True
              return
         try:
              self._spacy_nlp = spacy.blank("en")
              self._spacy_nlp.add_pipe("sentencizer")
         except Exception as e:
             print(f"Error loading spacy: {e}")
+            self._spacy_failed = True
 
     def _ensure_embed_model(self) -> None:
         if self._embed_model is not None or self._embed_model_failed:
             return
-        if SentenceTransformer is None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
              print("Warning: sentence-transformers not installed")
              self._embed_model_failed = True
              return
         # lightweight model
         try:
             self._apply_hf_env()
+            if _env_truthy("ERR_HF_ONNX_INT8"):
+                try:
+                    self._embed_model = _load_onnx_int8_model(SentenceTransformer)
+                    return
+                except Exception as e:
+                    print(f"Warning: int8 ONNX embedding model unavailable, using default: {e}")
             self._embed_model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
         except Exception as e:
              print(f"Error loading embedding model: {e}")
@@ -113,22 +211,11 @@ class Chunker:
             return []
             
         # Hard check for CJK dominance -> use regex/jieba-like splitting
-        cjk_count = len(re.findall(r"[\u4e00-\u9fff]", text))
+        cjk_count = len(_CJK_RE.findall(text))
         if cjk_count > len(text) * 0.3:
              # Simple CJK splitter on punctuation
-             # Split by 。 ？ ！ \n
-             parts = re.split(r"([。？！\n])", text)
-             sentences = []
-             current = ""
-             for p in parts:
-                 current += p
-                 if p in "。？！\n":
-                     if current.strip():
-                         sentences.append(current.strip())
-                     current = ""
-             if current.strip():
-                 sentences.append(current.strip())
-             return sentences
+             # Split by 。 ？ ！ \n (each match is one sentence incl. its terminator)
+             return [s.strip() for s in _CJK_SENTENCE_RE.findall(text) if s.strip()]
 
         self._ensure_spacy()
         if self._spacy_nlp:
@@ -146,160 +233,191 @@ class Chunker:
         if not self._embed_model:
             return [0.0] * (len(sentences) - 1)
             
-        embeddings = self._embed_model.encode(sentences)
-        # Normalize
-        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-        embeddings = embeddings / (norms + 1e-12)
+        # encode() already length-sorts into batches internally; have it return
+        # unit vectors so no separate normalization pass is needed here.
+        embeddings = self._embed_model.encode(
+            sentences,
+            batch_size=64,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
         
-        # Calculate cosine similarity between adjacent (i, i+1)
-        sims = np.sum(embeddings[:-1] * embeddings[1:], axis=1)
+        # Calculate cosine similarity between adjacent (i, i+1) without
+        # materializing the (N-1, D) elementwise product.
+        sims = np.einsum("ij,ij->i", embeddings[:-1], embeddings[1:])
         # Distance = 1 - similarity
-        dists = 1 - sims
-        return dists.tolist()
-
-    def chunk(self, *, blocks: list[ParsedBlock]) -> list[ChunkModel]:
-        # Flatten blocks into a single stream of sentences, preserving block metadata per sentence if needed?
-        # Actually, simpler to just treat blocks as source of text.
-        # But we want to preserve rich text if possible. 
-        # For semantic chunking, we'll simplify: reconstruct full text, split to sentences, then grouping.
-        # This loses per-block rich text alignment, but that's a trade-off. 
-        # Alternatively, split each block into sentences and keeping track of parent block.
-
-        if not self.semantic_enabled:
-             # Use legacy logic or reimplement valid fixed-size logic here?
-             # For now, let's just use the semantic logic but with threshold=0 which equates to filling buffer?
-             # No, better to stick to pure semantic path if enabled.
-             pass
-
-        # 1. Flatten all text
-        all_sentences: list[dict[str, Any]] = [] # {text, rich, metadata}
-        
+        return (1.0 - sims).tolist()
+
+    def chunk(self, *, blocks: list[ParsedBlock], document_id: str | None = None) -> list[ChunkModel]:
+        return list(self.iter_chunks(blocks=blocks, document_id=document_id))
+
+    def iter_chunks(
+        self, *, blocks: list[ParsedBlock], document_id: str | None = None
+    ) -> Iterator[ChunkModel]:
+        """
+        Yield chunks in document order with prev/next content linked.
+
+        Only one finished chunk is held back (until its successor is known for
+        `next_content`), so consumers can process chunks as they are produced.
+
+        With a `document_id`, chunk ids are a digest of (document_id, index) and
+        stay stable across re-ingestion; otherwise they are random per call.
+        """
+        texts, metas, tokens = self._flatten_sentences(blocks=blocks)
+        if not texts:
+            return
+        distances = self._sentence_distances(texts, tokens)
+
+        # Otherwise one random prefix per document; chunk ids append the chunk index.
+        id_prefix = uuid4().hex
+        pending: ChunkModel | None = None
+        for index, (start, end) in enumerate(self._iter_chunk_bounds(tokens, distances)):
+            if document_id is None:
+                chunk_id = f"{id_prefix}{index:08x}"
+            else:
+                chunk_id = hashlib.blake2b(f"{document_id}:{index}".encode(), digest_size=16).hexdigest()
+            chunk = self._build_chunk(texts[start:end], metas[start:end], chunk_id=chunk_id, index=index)
+            if pending is not None:
+                pending.next_content = chunk.content
+                chunk.prev_content = pending.content
+                yield pending
+            pending = chunk
+        if pending is not None:
+            yield pending
+
+    def _flatten_sentences(
+        self, *, blocks: list[ParsedBlock]
+    ) -> tuple[list[str], list[dict[str, Any]], np.ndarray]:
+        # Flatten blocks into one stream of sentences kept as parallel arrays:
+        # texts[i], metas[i] (the parent block's metadata) and tokens[i].
+        # This loses per-block rich text alignment, but that's a trade-off;
+        # chunks use plain text as rich_content for now.
+        texts: list[str] = []
+        metas: list[dict[str, Any]] = []
         for block in blocks:
-             txt = block.text.strip()
-             if not txt: continue
-             
-             sents = self._split_sentences(txt)
-             for s in sents:
-                 # heuristic to try and find rich text equiv? Too hard.
-                 # We will just map rich text = text for now inside chunks, 
-                 # or if the block was small enough, use block's rich text. 
-                 # Let's assume plain text for semantic chunks for simplicity for now.
-                 all_sentences.append({
-                     "text": s,
-                     "rich": s, # simplified
-                     "metadata": block.metadata
-                 })
-        
-        if not all_sentences:
-            return []
-            
-        # 2. Assign token counts
-        for item in all_sentences:
-            item["tokens"] = estimate_tokens(item["text"])
+            txt = block.text.strip()
+            if not txt:
+                continue
+            sents = self._split_sentences(txt)
+            texts.extend(sents)
+            metas.extend([block.metadata] * len(sents))
 
-        # 3. If semantic, calc distances
-        # We can calculate distances for the whole batch or sliding window. 
+        # One vectorized pass over every sentence
+        tokens = estimate_tokens_bulk(texts)
+        return texts, metas, tokens
+
+    def _sentence_distances(self, texts: list[str], tokens: np.ndarray) -> np.ndarray:
+        # distances[i] is between sentence i and i + 1.
         # For valid large docs, batching all might be heavy. But typically docs are < 100k tokens.
-        # 300 pages book ~100-150k words. 
-        # Let's process in groups if needed, but for "Research Files" usually short.
-        
-        raw_texts = [x["text"] for x in all_sentences]
-        distances = []
-        if self.semantic_enabled and len(raw_texts) > 1:
-            try:
-                distances = self._calculate_cosine_distances(raw_texts)
-            except Exception as e:
-                print(f"Semantic calc failed: {e}, falling back to fixed")
-                distances = [0.0] * (len(raw_texts) - 1)
-        else:
-             distances = [0.0] * (len(raw_texts) - 1)
+        distances = np.zeros(max(len(texts) - 1, 0), dtype=np.float64)
+        if not self.semantic_enabled or len(texts) < 2:
+            return distances
 
-        # 4. Group into chunks
-        chunks: list[ChunkModel] = []
-        
-        current_chunk_sents: list[dict] = []
-        current_tokens = 0
-        
-        # dist[i] is between sent[i] and sent[i+1]
-        
-        for i, sent in enumerate(all_sentences):
-            # Special case: if single sentence is > target_tokens, we must split it forcefully
-            # For simplicity in this implementation, we will just allow it to overflow if it's one sentence, 
-            # UNLESS it is excessively large (e.g. > 2x target). 
-            # Better approach: if sent["tokens"] > target_tokens, split sent["text"] into smaller pieces first.
-            # But `_split_sentences` is responsible for splitting.
-            # Let's add a check here to force flush previous if adding this one exceeds limit significantly,
-            # and if this one alone is huge, we might just have to accept it or implement sub-sentence splitting.
-            # For now: strict flush BEFORE adding if adding would exceed limit, unless buffer is empty.
-            
-            if current_chunk_sents and (current_tokens + sent["tokens"] > self.target_tokens):
-                 # Flush current buffer first
-                 overlap_sents, overlap_tokens = self._get_overlap_sents(current_chunk_sents)
-                 self._flush_chunk(chunks, current_chunk_sents)
-                 current_chunk_sents = overlap_sents
-                 current_tokens = overlap_tokens
-            
-            current_chunk_sents.append(sent)
-            current_tokens += sent["tokens"]
-            
-            # Check for semantic split trigger
-            should_split = False
-            
-            # Semantic split
-            # Check distance to NEXT sentence if exists
-            if self.semantic_enabled and i < len(distances):
-                 dist = distances[i]
-                 if dist > self.semantic_threshold and current_tokens > 50: # min chunk size
-                      should_split = True
-            
-            if should_split:
-                 overlap_sents, overlap_tokens = self._get_overlap_sents(current_chunk_sents)
-                 self._flush_chunk(chunks, current_chunk_sents)
-                 current_chunk_sents = overlap_sents
-                 current_tokens = overlap_tokens
-        
-        # Flush remainder
-        if current_chunk_sents:
-             self._flush_chunk(chunks, current_chunk_sents)
+        # distances[i] can only split once sentences 0..i exceed the minimum
+        # chunk size, so earlier sentences are never embedded. Short documents
+        # skip the model (and its load) entirely.
+        first = int(np.searchsorted(np.cumsum(tokens), _SEMANTIC_MIN_CHUNK_TOKENS, side="right"))
+        if first >= len(distances):
+            return distances
+        try:
+            distances[first:] = self._calculate_cosine_distances(texts[first:])
+        except Exception as e:
+            print(f"Semantic calc failed: {e}, falling back to fixed")
+            distances[:] = 0.0
+        return distances
+
+    def _iter_chunk_bounds(self, tokens: np.ndarray, distances: np.ndarray) -> Iterator[tuple[int, int]]:
+        """
+        Yield `(start, end)` sentence ranges, one per chunk.
 
-        # add prev/next
-        for i in range(len(chunks)):
-            chunks[i].prev_content = chunks[i - 1].content if i > 0 else None
-            chunks[i].next_content = chunks[i + 1].content if i < (len(chunks) - 1) else None
+        Sentence i is appended to the current range after flushing it if that
+        would overflow `target_tokens` (a lone oversized sentence is allowed to
+        overflow). After appending, a semantic distance above the threshold to
+        the next sentence flushes the range once it holds more than
+        `_SEMANTIC_MIN_CHUNK_TOKENS`. Each
+        flush keeps an overlap tail as the start of the next range.
 
-        return chunks
+        Range sums come from a cumulative token array, so the next size or
+        semantic boundary is found with a binary search instead of
+        accumulating sentence by sentence.
+        """
+        n = len(tokens)
+        cum = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(tokens, out=cum[1:])
+        if self.semantic_enabled:
+            candidates = np.flatnonzero(distances > self.semantic_threshold)
+        else:
+            candidates = np.empty(0, dtype=np.intp)
 
-    def _get_overlap_sents(self, sents: list[dict]) -> tuple[list[dict], int]:
-        if self.overlap_tokens <= 0 or not sents:
-            return [], 0
+        start = 0  # first sentence of the current range
+        pos = 0  # next sentence to append; the current range is [start, pos)
+        size_flushed = False  # sentence `pos` already triggered a size flush
+        while pos < n:
+            # First i >= pos whose append overflows: cum[i + 1] - cum[start] > target.
+            size_i = int(np.searchsorted(cum, cum[start] + self.target_tokens, side="right")) - 1
+            size_i = max(size_i, start + 1, pos + 1 if size_flushed else pos)
 
-        overlap: list[dict] = []
-        tokens = 0
-        for sent in reversed(sents):
-            sent_tokens = sent["tokens"]
-            if tokens + sent_tokens > self.overlap_tokens and overlap:
-                break
-            overlap.append(sent)
-            tokens += sent_tokens
-            if tokens >= self.overlap_tokens:
+            # First semantic candidate before that with enough tokens buffered.
+            min_i = int(np.searchsorted(cum, cum[start] + _SEMANTIC_MIN_CHUNK_TOKENS, side="right")) - 1
+            k = int(np.searchsorted(candidates, max(pos, min_i)))
+            if k < len(candidates) and candidates[k] < size_i:
+                end = int(candidates[k]) + 1
+                size_flushed = False
+            elif size_i < n:
+                end = size_i
+                size_flushed = True
+            else:
                 break
 
-        overlap.reverse()
-        return overlap, tokens
+            yield start, end
+            start = self._overlap_start(cum, start, end)
+            pos = end
 
-    def _flush_chunk(self, chunks_list: list[ChunkModel], sents: list[dict]) -> None:
-        if not sents: return
-        
-        content = " ".join(s["text"] for s in sents)
+        # Flush remainder
+        if start < n:
+            yield start, n
+
+    def _overlap_start(self, cum: np.ndarray, start: int, end: int) -> int:
+        """
+        First sentence of the overlap tail of range [start, end): walking back
+        from the last sentence (always kept), stop before a sentence that would
+        exceed `overlap_tokens` or once the budget is reached. Returns `end` for
+        no overlap.
+
+        With `cum` the cumulative token counts, the tail [s, end) holds
+        cum[end] - cum[s] tokens, so both stopping points are binary searches.
+        """
+        if self.overlap_tokens <= 0 or start >= end:
+            return end
+
+        floor = cum[end] - self.overlap_tokens
+        # Smallest s whose tail fits the budget, and smallest s whose tail is
+        # still under it (the walk stops after the sentence reaching it).
+        fits = int(np.searchsorted(cum, floor, side="left"))
+        under = int(np.searchsorted(cum, floor, side="right"))
+        return max(start, min(end - 1, max(fits, under - 1)))
+
+    def _build_chunk(
+        self, texts: list[str], metas: list[dict[str, Any]], *, chunk_id: str, index: int
+    ) -> ChunkModel:
+        # Sentences are already stripped by _split_sentences.
+        content = " ".join(texts)
         # Merge metadata priority? Last one? First one?
         # Usually first one has chapter title.
-        combined_meta = {}
-        for s in sents:
-            combined_meta.update(s["metadata"])
+        combined_meta: dict[str, Any] = {}
+        last_meta: dict[str, Any] | None = None
+        for meta in metas:
+            # Sentences from one block share its metadata dict; merge it once.
+            if meta is last_meta:
+                continue
+            combined_meta.update(meta)
+            last_meta = meta
+        combined_meta["chunk_index"] = index
             
-        chunks_list.append(ChunkModel(
-            id=uuid4().hex,
+        return ChunkModel(
+            id=chunk_id,
             content=content,
             rich_content=content, # simplified
-            metadata={**combined_meta, "chunk_index": len(chunks_list)}
-        ))
+            metadata=combined_meta
+        )
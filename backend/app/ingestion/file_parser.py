@@ -1,14 +1,21 @@
 from __future__ import annotations
 
+import codecs
+import os
 import re
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from io import BytesIO
 from typing import Any
 
 from bs4 import BeautifulSoup
-from docx import Document
-from ebooklib import ITEM_DOCUMENT, epub
+from lxml import etree
+from lxml import html as lxml_html
+
+try:
+    import charset_normalizer
+except ImportError:
+    charset_normalizer = None
 
 
 @dataclass(frozen=True)
@@ -18,8 +25,35 @@ class ParsedBlock:
     metadata: dict[str, Any]
 
 
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
 def _decode_best_effort(raw: bytes) -> str:
-    for enc in ("utf-8", "utf-16", "utf-16le", "utf-16be", "gb18030"):
+    for bom, enc in _BOMS:
+        if raw.startswith(bom):
+            return raw.decode(enc, errors="replace")
+
+    # Common case: plain UTF-8, decoded in a single pass.
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+
+    # One statistical pass instead of a trial decode per codec. (Trial
+    # decoding is also unreliable here: "utf-16" accepts almost any even-length
+    # input, so GB18030 text never reached its own codec.)
+    if charset_normalizer is not None:
+        best = charset_normalizer.from_bytes(raw).best()
+        if best is not None:
+            return str(best)
+
+    for enc in ("utf-16", "utf-16le", "utf-16be", "gb18030"):
         try:
             return raw.decode(enc)
         except UnicodeDecodeError:
@@ -27,42 +61,72 @@ def _decode_best_effort(raw: bytes) -> str:
     return raw.decode("utf-8", errors="replace")
 
 
+_PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n")
+_EXTRA_NEWLINES_RE = re.compile(r"\n{3,}")
+_MD_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+
 _ALLOWED_INLINE_TAGS = {"b", "strong", "i", "em", "h1", "h2", "h3", "p", "br", "li"}
 
 
-def _html_to_text_and_rich(html: str) -> tuple[str, str]:
-    soup = BeautifulSoup(html, "lxml")
+def _html_to_plain_text(html: str) -> str:
+    # Only the text is needed here, and unwrapping tags never changes
+    # get_text() output, so there is no unwrap pass. BeautifulSoup stays
+    # because, unlike lxml.html, it keeps text that trails a stray </html>.
+    text = BeautifulSoup(html, "lxml").get_text(separator="\n")
+    return _EXTRA_NEWLINES_RE.sub("\n\n", text).strip()
 
-    for tag in soup.find_all(True):
-        if tag.name not in _ALLOWED_INLINE_TAGS:
-            tag.unwrap()
 
-    rich = str(soup.body or soup)
-    rich = re.sub(r"^<(body|html)[^>]*>|</(body|html)>$", "", rich).strip()
+# lxml refuses `str` input that still carries an XML encoding declaration,
+# which most EPUB XHTML documents start with.
+_XML_DECL_RE = re.compile(r"^\s*<\?xml[^>]*\?>")
 
-    text = soup.get_text(separator="\n")
-    text = re.sub(r"\n{3,}", "\n\n", text).strip()
-    return text, rich
 
+def _lxml_root(html: str) -> Any | None:
+    try:
+        doc = lxml_html.document_fromstring(_XML_DECL_RE.sub("", html, count=1))
+    except (etree.ParserError, ValueError):
+        return None
+    body = doc.find("body")
+    root = body if body is not None else doc
+    # Like BeautifulSoup's get_text(), never treat script/style bodies as text.
+    for el in root.iter("script", "style"):
+        el.text = None
+    return root
 
-def _html_to_blocks(*, html: str, filename: str) -> list[ParsedBlock]:
-    soup = BeautifulSoup(html, "lxml")
-    root = soup.body or soup
 
-    # Strip all but basic formatting tags, while keeping textual content.
-    for tag in root.find_all(True):
-        if tag.name not in _ALLOWED_INLINE_TAGS:
-            tag.unwrap()
+def _strip_to_allowed_tags(root: Any) -> None:
+    # Same cleanup as the BeautifulSoup path, as single C-level passes:
+    # drop comments/PIs, then unwrap every tag that is not basic formatting.
+    etree.strip_elements(root, etree.Comment, etree.ProcessingInstruction, with_tail=False)
+    disallowed = {
+        el.tag for el in root.iterdescendants() if isinstance(el.tag, str)
+    } - _ALLOWED_INLINE_TAGS
+    if disallowed:
+        etree.strip_tags(root, *disallowed)
+
+
+def _html_to_blocks(*, html: str, filename: str) -> list[ParsedBlock]:
+    """
+    Used once per EPUB document item, so it walks the tree with lxml directly
+    instead of paying for BeautifulSoup's Python-level tree.
+    """
+    root = _lxml_root(html)
+
+    # Read text before unwrapping: strip_tags() merges adjacent text nodes,
+    # whereas get_text(" ", strip=True) kept them apart (e.g. "x <a>link</a>y").
+    found: list[tuple[Any, str]] = []
+    if root is not None:
+        for el in root.iter("h1", "h2", "h3", "p", "li"):
+            text = " ".join(t.strip() for t in el.itertext() if t.strip())
+            if text:
+                found.append((el, text))
+        _strip_to_allowed_tags(root)
 
     blocks: list[ParsedBlock] = []
     current_heading: str | None = None
 
-    for el in root.find_all(["h1", "h2", "h3", "p", "li"]):
-        text = el.get_text(" ", strip=True)
-        if not text:
-            continue
-
-        if el.name in {"h1", "h2", "h3"}:
+    for el, text in found:
+        if el.tag in {"h1", "h2", "h3"}:
             current_heading = text
             blocks.append(
                 ParsedBlock(
@@ -72,7 +136,7 @@ def _html_to_blocks(*, html: str, filename: str) -> list[ParsedBlock]:
                         "source": filename,
                         "kind": "heading",
                         "chapter_title": text,
-                        "heading_level": 1 if el.name == "h1" else 2 if el.name == "h2" else 3,
+                        "heading_level": 1 if el.tag == "h1" else 2 if el.tag == "h2" else 3,
                     },
                 )
             )
@@ -81,7 +145,7 @@ def _html_to_blocks(*, html: str, filename: str) -> list[ParsedBlock]:
         blocks.append(
             ParsedBlock(
                 text=text,
-                rich_text=str(el),
+                rich_text=etree.tostring(el, encoding="unicode", method="html", with_tail=False),
                 metadata={
                     "source": filename,
                     "kind": "paragraph",
@@ -94,8 +158,8 @@ def _html_to_blocks(*, html: str, filename: str) -> list[ParsedBlock]:
         return blocks
 
     # Fallback: plain text splitting.
-    text, _rich = _html_to_text_and_rich(html)
-    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    text = _html_to_plain_text(html)
+    paragraphs = [p.strip() for p in _PARAGRAPH_SPLIT_RE.split(text) if p.strip()]
     return [
         ParsedBlock(
             text=p,
@@ -131,7 +195,7 @@ class FileParser:
 
     def _parse_txt(self, *, filename: str, content: bytes) -> list[ParsedBlock]:
         text = _decode_best_effort(content)
-        paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+        paragraphs = [p.strip() for p in _PARAGRAPH_SPLIT_RE.split(text) if p.strip()]
         return [
             ParsedBlock(
                 text=p,
@@ -169,7 +233,7 @@ class FileParser:
             buffer = []
 
         for ln in lines:
-            heading_match = re.match(r"^(#{1,6})\s+(.*)$", ln)
+            heading_match = _MD_HEADING_RE.match(ln) if ln.startswith("#") else None
             if heading_match:
                 flush()
                 level = len(heading_match.group(1))
@@ -199,6 +263,8 @@ class FileParser:
         return blocks
 
     def _parse_docx(self, *, filename: str, content: bytes) -> list[ParsedBlock]:
+        from docx import Document
+
         doc = Document(BytesIO(content))
 
         blocks: list[ParsedBlock] = []
@@ -209,8 +275,11 @@ class FileParser:
             if not text:
                 continue
 
-            style_name = (para.style.name or "").lower() if para.style else ""
-            is_heading = style_name.startswith("heading")
+            # python-docx resolves `para.style` through the styles XML on every
+            # access, so look it up once per paragraph.
+            style = para.style
+            style_name_raw = style.name if style is not None else None
+            is_heading = (style_name_raw or "").lower().startswith("heading")
 
             rich_parts: list[str] = []
             for run in para.runs:
@@ -235,7 +304,7 @@ class FileParser:
                             "source": filename,
                             "kind": "heading",
                             "chapter_title": text,
-                            "style": para.style.name if para.style else None,
+                            "style": style_name_raw,
                         },
                     )
                 )
@@ -249,7 +318,7 @@ class FileParser:
                         "source": filename,
                         "kind": "paragraph",
                         "chapter_title": current_heading,
-                        "style": para.style.name if para.style else None,
+                        "style": style_name_raw,
                     },
                 )
             )
@@ -257,24 +326,31 @@ class FileParser:
         return blocks
 
     def _parse_epub(self, *, filename: str, content: bytes) -> list[ParsedBlock]:
-        # ebooklib expects a filesystem path; use a temp file to stay "ephemeral"
-        # while still supporting the library's API.
-        with tempfile.NamedTemporaryFile(suffix=".epub") as tmp:
-            tmp.write(content)
-            tmp.flush()
-            book = epub.read_epub(tmp.name)
-
-        all_blocks: list[ParsedBlock] = []
+        from ebooklib import ITEM_DOCUMENT, epub
 
-        for item in book.get_items():
-            if item.get_type() != ITEM_DOCUMENT:
-                continue
-            html = item.get_content().decode("utf-8", errors="replace")
-            blocks = _html_to_blocks(html=html, filename=filename)
-            if blocks:
-                all_blocks.extend(blocks)
+        # read_epub hands its argument to zipfile.ZipFile, which takes a
+        # file-like object, so the upload never touches disk.
+        book = epub.read_epub(BytesIO(content))
 
-        return all_blocks
+        htmls = [
+            item.get_content().decode("utf-8", errors="replace")
+            for item in book.get_items()
+            if item.get_type() == ITEM_DOCUMENT
+        ]
+        if not htmls:
+            return []
+
+        # Each document item is parsed independently and lxml releases the GIL
+        # while parsing, so spread the items over a bounded thread pool.
+        # executor.map keeps results in spine order.
+        workers = min(len(htmls), os.cpu_count() or 1)
+        if workers <= 1:
+            results = [_html_to_blocks(html=html, filename=filename) for html in htmls]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(lambda html: _html_to_blocks(html=html, filename=filename), htmls))
+
+        return [block for blocks in results for block in blocks]
 
     def _parse_mobi_best_effort(self, *, filename: str, content: bytes) -> list[ParsedBlock]:
         try:
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from typing import BinaryIO
+
+from ..models.chunk import ChunkModel
+from .chunker import Chunker
+from .file_parser import FileParser, ParsedBlock
+
+# Module-level functions so ingestion can run in a process pool: they pickle
+# by reference, and only paths, blocks and chunks cross the process boundary.
+
+_SPOOL_PIECE_BYTES = 1 << 20  # 1 MiB
+
+
+class UploadTooLargeError(ValueError):
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__(f"Upload exceeds the {max_bytes}-byte limit")
+        self.max_bytes = max_bytes
+
+
+def _copy_capped(src: BinaryIO, dst: BinaryIO, *, max_bytes: int) -> None:
+    total = 0
+    while piece := src.read(_SPOOL_PIECE_BYTES):
+        total += len(piece)
+        if total > max_bytes:
+            raise UploadTooLargeError(max_bytes)
+        dst.write(piece)
+
+
+def spool_upload(src: BinaryIO, *, max_bytes: int = 0) -> str:
+    """
+    Copy an upload to a named temp file in 1 MiB pieces and return its path, so
+    the request never holds the whole file in memory. The caller owns the file.
+
+    With `max_bytes` > 0, raises UploadTooLargeError (and removes the partial
+    file) as soon as the upload grows past the limit.
+    """
+    with tempfile.NamedTemporaryFile(prefix="err-upload-", delete=False) as tmp:
+        try:
+            if max_bytes > 0:
+                _copy_capped(src, tmp, max_bytes=max_bytes)
+            else:
+                shutil.copyfileobj(src, tmp, length=_SPOOL_PIECE_BYTES)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    return tmp.name
+
+
+def remove_spooled_upload(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def parse_spooled_upload(path: str, filename: str) -> tuple[list[ParsedBlock], str]:
+    """
+    Parse an upload spooled to `path`, deleting the file once it is read.
+
+    Returns the blocks and a document id derived from the file bytes, so
+    re-uploading the same file reproduces the same chunk ids.
+    """
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+    finally:
+        remove_spooled_upload(path)
+    blocks = FileParser().parse(filename=filename, content=content)
+    return blocks, hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+@lru_cache(maxsize=4)
+def _chunker(
+    target_tokens: int, overlap_tokens: int, semantic_enabled: bool, semantic_threshold: float
+) -> Chunker:
+    # Reused per worker so the spacy pipeline and embedding model load once,
+    # not once per uploaded document.
+    return Chunker(
+        target_tokens=target_tokens,
+        overlap_tokens=overlap_tokens,
+        semantic_enabled=semantic_enabled,
+        semantic_threshold=semantic_threshold,
+    )
+
+
+def chunk_blocks(
+    blocks: list[ParsedBlock],
+    document_id: str,
+    target_tokens: int,
+    overlap_tokens: int,
+    semantic_enabled: bool,
+    semantic_threshold: float,
+) -> list[ChunkModel]:
+    chunker = _chunker(target_tokens, overlap_tokens, semantic_enabled, semantic_threshold)
+    return chunker.chunk(blocks=blocks, document_id=document_id)
@@ -1,10 +1,19 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
 from contextlib import asynccontextmanager
-from typing import cast
+from functools import lru_cache
+from io import StringIO
+from typing import Callable, cast
 from uuid import uuid4
 
+import numpy as np
 from fastapi import Depends, FastAPI, File, Header, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
@@ -12,17 +21,39 @@ from sse_starlette.sse import EventSourceResponse
 from starlette.responses import Response
 
 from .config import Settings, load_settings
-from .guardrails import STRICT_NO_MENTION, enforce_strict_rag_answer
-from .ingestion.chunker import Chunker
+from .guardrails import (
+    CITATION_RE,
+    STRICT_NO_MENTION,
+    enforce_strict_rag_answer,
+    extract_citation_numbers,
+)
 from .ingestion.chunker import estimate_tokens
-from .ingestion.file_parser import FileParser
+from .ingestion.jobs import (
+    UploadTooLargeError,
+    chunk_blocks,
+    parse_spooled_upload,
+    remove_spooled_upload,
+    spool_upload,
+)
 from .models.chunk import ChunkModel
 from .openrouter_client import OpenRouterClient, OpenRouterError
 from .openrouter_client import ChatMessage
-from .retrieval.fusion import dedupe_keep_order, rrf_fuse
-from .retrieval.hybrid_retriever import HybridRetriever
-from .repacking import apply_repack_strategy
-from .session_store import ChatTurn, cleanup_expired_sessions, get_or_create_session, get_session
+from .retrieval.fusion import dedupe_keep_order, rankings_agree_on_top, rrf_fuse
+from .retrieval.hybrid_retriever import (
+    HybridRetriever,
+    detect_corpus_language,
+    query_matches_language,
+    set_faiss_threads,
+)
+from .repacking import repack_chunks_reverse, resolve_repack
+from .session_store import (
+    ChatTurn,
+    DocumentSnapshot,
+    cleanup_expired_sessions,
+    get_or_create_session,
+    get_session,
+    next_expiry,
+)
 from datetime import datetime
 
 from .retrieval.evaluation import EvaluationRecord, RetrievalMetrics
@@ -31,19 +62,36 @@ from .retrieval.evaluation import EvaluationRecord, RetrievalMetrics
 async def _cleanup_loop(settings: Settings, shutdown_event: asyncio.Event) -> None:
     while not shutdown_event.is_set():
         cleanup_expired_sessions()
+        # Sleep until the earliest expiry; with no sessions, poll at the configured interval.
+        expiry = next_expiry()
+        if expiry is None:
+            timeout = float(settings.session_cleanup_interval_seconds)
+        else:
+            timeout = max(1.0, expiry - time.time())
         try:
-            await asyncio.wait_for(
-                shutdown_event.wait(), timeout=settings.session_cleanup_interval_seconds
-            )
+            await asyncio.wait_for(shutdown_event.wait(), timeout=timeout)
         except TimeoutError:
             continue
 
 
+def _create_ingest_pool(settings: Settings) -> ProcessPoolExecutor | None:
+    if settings.ingest_workers <= 0:
+        return None
+    # spawn, not fork: the server process already runs threads (event loop
+    # executors, tokenizer pools) that must not be duplicated mid-state.
+    return ProcessPoolExecutor(
+        max_workers=settings.ingest_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     settings = load_settings()
     app.state.settings = settings
+    set_faiss_threads(settings.faiss_threads)
     app.state.openrouter = OpenRouterClient(settings)
+    app.state.ingest_pool = _create_ingest_pool(settings)
+    app.state.ingest_slots = asyncio.Semaphore(settings.max_concurrent_ingests)
     shutdown_event = asyncio.Event()
     app.state.shutdown_event = shutdown_event
     cleanup_task = asyncio.create_task(_cleanup_loop(settings, shutdown_event))
@@ -53,6 +101,8 @@ async def lifespan(app: FastAPI):
         shutdown_event.set()
         cleanup_task.cancel()
         await app.state.openrouter.aclose()
+        if app.state.ingest_pool is not None:
+            app.state.ingest_pool.shutdown(wait=False, cancel_futures=True)
 
 
 app = FastAPI(title="ERR Backend", lifespan=lifespan)
@@ -74,181 +124,275 @@ def get_openrouter() -> OpenRouterClient:
     return app.state.openrouter
 
 
+def get_ingest_pool() -> Executor | None:
+    return app.state.ingest_pool
+
+
+def get_ingest_slots() -> asyncio.Semaphore:
+    return app.state.ingest_slots
+
+
 @app.get("/health")
 async def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+def _token_cache_key(language: str, content: str) -> str:
+    return hashlib.blake2b(f"{language}:{content}".encode(), digest_size=16).hexdigest()
+
+
 async def _ingest_file(
     *,
     session_id: str,
     filename: str,
-    content: bytes,
+    content_path: str,
+    settings: Settings,
+    openrouter: OpenRouterClient,
+    ingest_pool: Executor | None,
+    ingest_slots: asyncio.Semaphore,
+) -> None:
+    # Each ingestion holds an embedding pipeline and a full index build; cap how
+    # many run at once so a burst of uploads queues instead of thrashing memory.
+    if ingest_slots.locked():
+        session = get_session(session_id=session_id, ttl_seconds=settings.session_ttl_seconds)
+        if session is not None:
+            await session.log("[LOG] Queued; waiting for ingest slot")
+    async with ingest_slots:
+        await _run_ingest(
+            session_id=session_id,
+            filename=filename,
+            content_path=content_path,
+            settings=settings,
+            openrouter=openrouter,
+            ingest_pool=ingest_pool,
+        )
+
+
+async def _run_ingest(
+    *,
+    session_id: str,
+    filename: str,
+    content_path: str,
     settings: Settings,
     openrouter: OpenRouterClient,
+    ingest_pool: Executor | None,
 ) -> None:
     session = get_session(session_id=session_id, ttl_seconds=settings.session_ttl_seconds)
     if session is None:
+        remove_spooled_upload(content_path)
         return
 
     async with session.lock:
-        session.ingest_status = "processing"
-        session.ingest_error = None
-        session.filename = filename
-        session.chunks = []
-        session.retriever = None
-        session.chat_history = []
+        session.document = DocumentSnapshot(status="processing", filename=filename)
+        session.clear_chat()
         session.reference_ids = {}
         session.references = []
 
-    await session.log(f"[LOG] Received file: {filename}")
-    await session.log("[LOG] Parsing document...")
+    await session.log_many([f"[LOG] Received file: {filename}", "[LOG] Parsing document..."])
 
-    parser = FileParser()
+    # Parsing and chunking are CPU-bound and hold the GIL; run them in the
+    # ingest worker processes (or the default thread pool when disabled) so
+    # SSE log streams and /chat stay responsive. Workers read the spooled file
+    # themselves, so the upload bytes never cross the process boundary.
     loop = asyncio.get_running_loop()
     try:
-        blocks = await loop.run_in_executor(
-            None, lambda: parser.parse(filename=filename, content=content)
+        blocks, document_id = await loop.run_in_executor(
+            ingest_pool, parse_spooled_upload, content_path, filename
         )
     except Exception as e:  # noqa: BLE001
-        async with session.lock:
-            session.ingest_status = "error"
-            session.ingest_error = str(e)
+        # A worker that died before reading the file leaves it behind.
+        remove_spooled_upload(content_path)
+        session.set_document(status="error", error=str(e))
         await session.log(f"[LOG] ERROR parsing: {e}")
         return
 
-    await session.log(f"[LOG] Extracted {len(blocks)} blocks")
-    await session.log(
-        "[LOG] Chunking into "
-        f"~{settings.chunk_target_tokens}-token chunks "
-        f"(overlap={settings.chunk_overlap_tokens}, "
-        f"semantic={settings.semantic_chunking_enabled}, "
-        f"threshold={settings.semantic_chunking_threshold})..."
+    await session.log_many(
+        [
+            f"[LOG] Extracted {len(blocks)} blocks",
+            "[LOG] Chunking into "
+            f"~{settings.chunk_target_tokens}-token chunks "
+            f"(overlap={settings.chunk_overlap_tokens}, "
+            f"semantic={settings.semantic_chunking_enabled}, "
+            f"threshold={settings.semantic_chunking_threshold})...",
+        ]
     )
 
-    chunker = Chunker(
-        target_tokens=settings.chunk_target_tokens,
-        overlap_tokens=settings.chunk_overlap_tokens,
-        semantic_enabled=settings.semantic_chunking_enabled,
-        semantic_threshold=settings.semantic_chunking_threshold,
-    )
-    chunks = await loop.run_in_executor(None, lambda: chunker.chunk(blocks=blocks))
+    try:
+        chunks = await loop.run_in_executor(
+            ingest_pool,
+            chunk_blocks,
+            blocks,
+            document_id,
+            settings.chunk_target_tokens,
+            settings.chunk_overlap_tokens,
+            settings.semantic_chunking_enabled,
+            settings.semantic_chunking_threshold,
+        )
+    except Exception as e:  # noqa: BLE001
+        # Includes BrokenProcessPool / pickling failures from the worker pool.
+        session.set_document(status="error", error=str(e))
+        await session.log(f"[LOG] ERROR chunking: {e}")
+        return
+    # Chunks carry everything from here on; free the parsed blocks before embedding.
+    del blocks
     await session.log(f"[LOG] Created {len(chunks)} chunks")
     if not chunks:
-        async with session.lock:
-            session.ingest_status = "error"
-            session.ingest_error = "No chunks created from document"
+        session.set_document(status="error", error="No chunks created from document")
         await session.log("[LOG] ERROR: No chunks created from document")
         return
 
-    # Embed chunks in batches.
-    await session.log("[LOG] Building vector embeddings (batched)...")
-    batch_size = 32
-    embeddings_list: list[list[float]] = []
-    detected_embedding_dim: int | None = None
-    total_batches = (len(chunks) + batch_size - 1) // batch_size
+    retriever = HybridRetriever(
+        embedding_dim=settings.embedding_dim,
+        vector_weight=0.8,
+        bm25_weight=0.2,
+        candidate_k=100,
+        vector_quantization=settings.vector_quantization,
+        ann_index=settings.vector_ann_index,
+    )
+
+    # BM25 needs only chunk text: tokenize it in a thread while the embedding
+    # batches below are waiting on the network.
+    # Tokens depend only on chunk text and document language, so that is what
+    # the cache is keyed on; a chunk id repeats across re-chunkings of a file.
+    doc_language = detect_corpus_language(chunks)
+    token_keys = [_token_cache_key(doc_language, c.content) for c in chunks]
 
-    # Concurrent embedding with semaphore
-    semaphore = asyncio.Semaphore(20)
-    tasks = []
+    async def _build_keyword_index() -> tuple[list[list[str]], str | None]:
+        cached = session.tokenized_corpus
+        precomputed = [cached.get(k) for k in token_keys] if cached else None
+        try:
+            tokens = await loop.run_in_executor(
+                None,
+                lambda: retriever.build_keyword_index(
+                    chunks=chunks, doc_language=doc_language, precomputed_tokens=precomputed
+                ),
+            )
+        except Exception as e:  # noqa: BLE001
+            return [], str(e)
+        return tokens, None
 
-    async def _process_batch(b_idx: int):
-        async with semaphore:
+    keyword_index_task = asyncio.create_task(_build_keyword_index())
+    # Cancelled on every exit from the embedding phase, so an early error return
+    # cannot leave it running for a failed document.
+    try:
+        # Embed chunks in batches.
+        await session.log("[LOG] Building vector embeddings (batched)...")
+        batch_size = settings.embedding_batch_size
+        # Filled batch by batch once the first batch reveals the dimension.
+        embeddings: np.ndarray | None = None
+        detected_embedding_dim: int | None = None
+        total_batches = (len(chunks) + batch_size - 1) // batch_size
+
+        # Batches are independent: overlap their round-trips, bounded by a semaphore.
+        semaphore = asyncio.Semaphore(settings.embedding_concurrency)
+
+        def _batch_log_line(b_idx: int) -> str:
             start = b_idx * batch_size
             end = min(len(chunks), (b_idx + 1) * batch_size)
-            assert session is not None
-            await session.log(f"[LOG] Embedding batch {b_idx+1}/{total_batches} ({start}-{end})...")
-            texts = [c.content for c in chunks[start:end]]
-            try:
-                embs = await openrouter.embeddings(model=settings.embedding_model, inputs=texts)
-            except Exception as e:
-                return b_idx, None, str(e)
+            return f"[LOG] Embedding batch {b_idx+1}/{total_batches} ({start}-{end})..."
+
+        # The first wave of batches starts in the same tick: announce it as one
+        # burst. Later batches start one at a time as slots free up.
+        first_wave = min(total_batches, settings.embedding_concurrency)
+        await session.log_many([_batch_log_line(b) for b in range(first_wave)])
+
+        async def _process_batch(b_idx: int):
+            async with semaphore:
+                start = b_idx * batch_size
+                end = min(len(chunks), (b_idx + 1) * batch_size)
+                assert session is not None
+                if b_idx >= first_wave:
+                    await session.log(_batch_log_line(b_idx))
+                texts = [c.content for c in chunks[start:end]]
+                try:
+                    embs = await openrouter.embeddings(model=settings.embedding_model, inputs=texts)
+                except Exception as e:
+                    return b_idx, None, str(e)
             
-            if embs.ndim != 2 or embs.shape[0] != len(texts):
-                return b_idx, None, f"Unexpected embeddings shape: {tuple(embs.shape)}"
+                if embs.ndim != 2 or embs.shape[0] != len(texts):
+                    return b_idx, None, f"Unexpected embeddings shape: {tuple(embs.shape)}"
             
-            return b_idx, embs, None
-
-    for b in range(total_batches):
-        tasks.append(_process_batch(b))
-    
-    # Run all tasks
-    results = await asyncio.gather(*tasks)
-    
-    # Sort results by batch index to ensure order
-    results.sort(key=lambda x: x[0])
-
-    for b_idx, embs, err in results:
-        if err:
-            async with session.lock:
-                session.ingest_status = "error"
-                session.ingest_error = err
-            await session.log(f"[LOG] ERROR embedding batch {b_idx+1}: {err}")
+                return b_idx, embs, None
+
+        # gather() returns results in batch order.
+        results = await asyncio.gather(*(_process_batch(b) for b in range(total_batches)))
+
+        # Pop each batch as it is copied so its response array is freed right away,
+        # instead of holding every batch alongside the full embeddings matrix.
+        results.reverse()
+        while results:
+            b_idx, embs, err = results.pop()
+            if err:
+                session.set_document(status="error", error=err)
+                await session.log(f"[LOG] ERROR embedding batch {b_idx+1}: {err}")
+                return
+
+            batch_dim = int(embs.shape[1])
+            if detected_embedding_dim is None:
+                detected_embedding_dim = batch_dim
+                embeddings = np.empty((len(chunks), detected_embedding_dim), dtype=np.float32)
+                await session.log(f"[LOG] Detected embedding dim: {detected_embedding_dim}")
+            elif batch_dim != detected_embedding_dim:
+                session.set_document(
+                    status="error",
+                    error=(
+                        f"Inconsistent embedding dim across batches: "
+                        f"expected {detected_embedding_dim}, got {batch_dim}"
+                    ),
+                )
+                await session.log(
+                    "[LOG] ERROR embedding: Inconsistent embedding dim across batches "
+                    f"(expected {detected_embedding_dim}, got {batch_dim})"
+                )
+                return
+
+            assert embeddings is not None
+            start = b_idx * batch_size
+            embeddings[start : start + embs.shape[0]] = embs
+
+        await session.log("[LOG] Building FAISS + BM25 indexes in memory...")
+
+        if detected_embedding_dim is None or embeddings is None:
+            session.set_document(status="error", error="Could not determine embedding dimension")
+            await session.log("[LOG] ERROR: Could not determine embedding dimension")
             return
 
-        batch_dim = int(embs.shape[1])
-        if detected_embedding_dim is None:
-            detected_embedding_dim = batch_dim
-            await session.log(f"[LOG] Detected embedding dim: {detected_embedding_dim}")
-        elif batch_dim != detected_embedding_dim:
-            async with session.lock:
-                session.ingest_status = "error"
-                session.ingest_error = (
-                    f"Inconsistent embedding dim across batches: "
-                    f"expected {detected_embedding_dim}, got {batch_dim}"
-                )
+        if settings.embedding_dim and settings.embedding_dim != detected_embedding_dim:
             await session.log(
-                "[LOG] ERROR embedding: Inconsistent embedding dim across batches "
-                f"(expected {detected_embedding_dim}, got {batch_dim})"
+                "[LOG] WARNING: OPENROUTER_EMBEDDING_DIM="
+                f"{settings.embedding_dim} but model returned {detected_embedding_dim}; "
+                f"using {detected_embedding_dim}"
             )
-            return
-        
-        embeddings_list.extend(embs.tolist())
-
-    embeddings = embeddings_list
-    await session.log("[LOG] Building FAISS + BM25 indexes in memory...")
 
-    if detected_embedding_dim is None:
-        async with session.lock:
-            session.ingest_status = "error"
-            session.ingest_error = "Could not determine embedding dimension"
-        await session.log("[LOG] ERROR: Could not determine embedding dimension")
+        retriever.embedding_dim = detected_embedding_dim
+        corpus_tokens, keyword_index_error = await keyword_index_task
+    finally:
+        keyword_index_task.cancel()
+    if keyword_index_error:
+        session.set_document(status="error", error=keyword_index_error)
+        await session.log(f"[LOG] ERROR building indexes: {keyword_index_error}")
         return
-
-    if settings.embedding_dim and settings.embedding_dim != detected_embedding_dim:
-        await session.log(
-            "[LOG] WARNING: OPENROUTER_EMBEDDING_DIM="
-            f"{settings.embedding_dim} but model returned {detected_embedding_dim}; "
-            f"using {detected_embedding_dim}"
-        )
-
-    retriever = HybridRetriever(
-        embedding_dim=detected_embedding_dim,
-        vector_weight=0.8,
-        bm25_weight=0.2,
-        candidate_k=100,
-    )
     try:
-        import numpy as np
-
         await loop.run_in_executor(
-            None,
-            lambda: retriever.build(
-                chunks=chunks, embeddings=np.asarray(embeddings, dtype=np.float32)
-            ),
+            None, lambda: retriever.build_vector_index(embeddings=embeddings)
         )
     except Exception as e:  # noqa: BLE001
-        async with session.lock:
-            session.ingest_status = "error"
-            session.ingest_error = str(e)
+        session.set_document(status="error", error=str(e))
         await session.log(f"[LOG] ERROR building indexes: {e}")
         return
 
-    async with session.lock:
-        session.chunks = chunks
-        session.retriever = retriever
-        session.doc_language = retriever.doc_language
-        session.ingest_status = "ready"
+    await session.log(f"[LOG] Vector index: {retriever.index_description}")
+
+    # One attribute rebinding publishes the finished index to readers.
+    session.document = DocumentSnapshot(
+        status="ready",
+        filename=filename,
+        chunks=chunks,
+        retriever=retriever,
+        doc_language=retriever.doc_language,
+    )
+    # Replaced, not merged, so the cache only ever holds the published document.
+    session.tokenized_corpus = dict(zip(token_keys, corpus_tokens))
 
     await session.log("[LOG] Ready.")
 
@@ -259,12 +403,29 @@ async def upload(
     x_session_id: str | None = Header(default=None, alias="X-Session-Id"),
     settings: Settings = Depends(get_settings),
     openrouter: OpenRouterClient = Depends(get_openrouter),
+    ingest_pool: Executor | None = Depends(get_ingest_pool),
+    ingest_slots: asyncio.Semaphore = Depends(get_ingest_slots),
 ) -> dict[str, str]:
     session_id = (x_session_id or "").strip() or uuid4().hex
-    session = get_or_create_session(session_id=session_id, ttl_seconds=settings.session_ttl_seconds)
+    session = get_or_create_session(
+        session_id=session_id,
+        ttl_seconds=settings.session_ttl_seconds,
+        log_history_max=settings.log_history_max,
+    )
+
+    max_bytes = settings.max_upload_bytes
+    too_large = f"File too large (limit {max_bytes // (1024 * 1024)} MiB)"
+    if max_bytes and file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=too_large)
 
-    content = await file.read()
-    if not content:
+    # UploadFile is closed once the response is sent, so spool it to a file the
+    # background task owns (and deletes) instead of reading it into memory.
+    try:
+        content_path = await asyncio.to_thread(spool_upload, file.file, max_bytes=max_bytes)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=too_large) from e
+    if os.path.getsize(content_path) == 0:
+        remove_spooled_upload(content_path)
         raise HTTPException(status_code=400, detail="Empty file")
 
     await session.log("[LOG] Upload accepted; starting background ingestion...")
@@ -272,9 +433,11 @@ async def upload(
         _ingest_file(
             session_id=session_id,
             filename=file.filename or "upload",
-            content=content,
+            content_path=content_path,
             settings=settings,
             openrouter=openrouter,
+            ingest_pool=ingest_pool,
+            ingest_slots=ingest_slots,
         )
     )
 
@@ -285,38 +448,47 @@ async def upload(
 async def logs(
     session_id: str,
     settings: Settings = Depends(get_settings),
+    last_event_id: str | None = Header(default=None, alias="Last-Event-ID"),
 ) -> EventSourceResponse:
     # Use get_or_create to handle race condition where SSE connects before upload completes
-    session = get_or_create_session(session_id=session_id, ttl_seconds=settings.session_ttl_seconds)
-
-    async def event_generator():
-        # Replay recent history first.
-        history = list(session.log_history)
+    session = get_or_create_session(
+        session_id=session_id,
+        ttl_seconds=settings.session_ttl_seconds,
+        log_history_max=settings.log_history_max,
+    )
+    # EventSource resends the last id it saw on reconnect; only replay what it missed.
+    try:
+        last_seq = int(last_event_id) if last_event_id else 0
+    except ValueError:
         last_seq = 0
-        for seq, line in history:
-            last_seq = max(last_seq, seq)
-            yield {"event": "log", "data": line.rstrip("\n")}
-
-        # Then stream new events.
-        while True:
-            try:
-                await asyncio.wait_for(session.log_event.wait(), timeout=15.0)
-                session.log_event.clear()
 
-                history = list(session.log_history)
-                # If we missed too much and the deque rotated, just replay everything we still have.
-                earliest_seq = history[0][0] if history else 0
-                if earliest_seq and earliest_seq > last_seq:
-                    last_seq = earliest_seq - 1
+    async def event_generator():
+        # Subscribe and snapshot the history with no await in between, so every
+        # line is either replayed or queued, never both.
+        queue = session.subscribe_logs()
+        history = session.iter_logs_since(last_seq)
+        try:
+            # Replay recent history first.
+            for seq, line in history:
+                yield {"event": "log", "id": str(seq), "data": line.rstrip("\n")}
 
-                for seq, line in history:
-                    if seq <= last_seq:
-                        continue
-                    last_seq = seq
-                    yield {"event": "log", "data": line.rstrip("\n")}
-            except TimeoutError:
-                # heartbeat to keep connection alive
-                yield {"event": "ping", "data": "keepalive"}
+            # Then stream new events.
+            while True:
+                try:
+                    seq, line = await asyncio.wait_for(queue.get(), timeout=15.0)
+                except TimeoutError:
+                    # Heartbeat as an SSE comment: keeps proxies from idling the
+                    # connection out, and EventSource never surfaces it as an event.
+                    yield {"comment": "keepalive"}
+                    continue
+                yield {"event": "log", "id": str(seq), "data": line.rstrip("\n")}
+                # Drain whatever else is already queued (e.g. a log_many burst)
+                # without another wait_for round-trip per line.
+                while not queue.empty():
+                    seq, line = queue.get_nowait()
+                    yield {"event": "log", "id": str(seq), "data": line.rstrip("\n")}
+        finally:
+            session.unsubscribe_logs(queue)
 
     return EventSourceResponse(
         event_generator(),
@@ -345,8 +517,15 @@ class ChatResponse(BaseModel):
     citations: list[dict]
 
 
-def _estimate_prompt_tokens(*, text_parts: list[str]) -> int:
-    return sum(estimate_tokens(t) for t in text_parts if t)
+_STRICT_RAG_SYSTEM_PROMPT = (
+    "You are a strict RAG QA engine.\n"
+    "Rules:\n"
+    "1) You MUST answer using ONLY the provided document excerpts in CONTEXT.\n"
+    '2) If the answer cannot be found in CONTEXT, reply exactly: "The document does not mention this."\n'
+    "3) When you use information from an excerpt, cite it with stacked citations like [1][2].\n"
+    "4) Do not use any outside knowledge. Do not guess.\n"
+)
+_STRICT_RAG_SYSTEM_PROMPT_TOKENS = estimate_tokens(_STRICT_RAG_SYSTEM_PROMPT)
 
 
 def _unique_nonempty(items: list[str]) -> list[str]:
@@ -366,7 +545,6 @@ def _weighted_embedding_mean(embeddings, *, decay: float = 0.7):
     Weighted average of embeddings. First embedding gets weight 1.0,
     subsequent ones decay exponentially (0.7^i).
     """
-    import numpy as np
     embs = np.asarray(embeddings, dtype=np.float32)
     if embs.ndim != 2 or embs.shape[0] == 0:
         return embs[0] if embs.shape[0] > 0 else embs
@@ -376,30 +554,52 @@ def _weighted_embedding_mean(embeddings, *, decay: float = 0.7):
     return np.average(embs, axis=0, weights=weights).astype(np.float32)
 
 
+@lru_cache(maxsize=8)
+def _embedding_query_formatter(template: str, task: str) -> Callable[[str], str]:
+    """
+    Resolve the instruction template for `task` once per (template, task).
+
+    Templates that end in a single plain `{query}` (like the default) reduce to
+    a precomputed prefix plus concatenation; others are formatted per query.
+    """
+    # Fallback: if template is invalid, still provide something reasonable.
+    fallback_prefix = f"Instruct: {task}\nQuery:"
+    probes = ("\x00q\x00", "\x00query-probe\x00")
+    try:
+        rendered = [template.format(task=task, query=p) for p in probes]
+    except Exception:
+        return lambda q: fallback_prefix + q
+
+    prefix = rendered[0][: -len(probes[0])]
+    if all(r == prefix + p for r, p in zip(rendered, probes)):
+        return lambda q: prefix + q
+
+    def format_query(q: str) -> str:
+        try:
+            return template.format(task=task, query=q)
+        except Exception:
+            return fallback_prefix + q
+
+    return format_query
+
 
-def _build_embedding_query_inputs(*, settings: Settings, queries: list[str]) -> list[str]:
+def _build_embedding_query_inputs(
+    *, queries: list[str], format_query: Callable[[str], str] | None, include_raw: bool
+) -> list[str]:
     """
     Build embedding inputs for user queries, optionally using instruction-aware format.
+
+    `format_query` is None when instructions are disabled; resolve it once per
+    request with `_embedding_query_formatter`.
     """
     queries = _unique_nonempty(queries)
     if not queries:
         return []
 
-    inputs: list[str] = []
-    if settings.embedding_query_use_instruction:
-        template = settings.embedding_query_instruction_template
-        task = settings.embedding_query_task
-        for q in queries:
-            try:
-                inputs.append(template.format(task=task, query=q))
-            except Exception:
-                # Fallback: if template is invalid, still provide something reasonable.
-                inputs.append(f"Instruct: {task}\nQuery:{q}")
-
-    if settings.embedding_query_include_raw or not inputs:
-        inputs.extend(queries)
-
-    return _unique_nonempty(inputs)
+    formatted = [format_query(q) for q in queries] if format_query is not None else []
+    if include_raw or not formatted:
+        formatted.extend(queries)
+    return _unique_nonempty(formatted)
 
 
 def _trim_text(text: str, *, max_chars: int) -> str:
@@ -433,13 +633,6 @@ def _build_context_blocks(*, chunks: list, include_neighbors: bool = True) -> li
     return blocks
 
 
-def _extract_citation_numbers(answer: str) -> list[int]:
-    # Back-compat wrapper used by export rewriting.
-    from .guardrails import extract_citation_numbers
-
-    return extract_citation_numbers(answer)
-
-
 @app.post("/chat", response_model=ChatResponse)
 async def chat(
     req: ChatRequest,
@@ -450,25 +643,30 @@ async def chat(
     if session is None:
         raise HTTPException(status_code=404, detail="Unknown session")
 
-    async with session.lock:
-        if session.ingest_status != "ready" or session.retriever is None:
-            raise HTTPException(
-                status_code=400, detail="No active document. Upload and wait until Ready."
-            )
-        retriever = session.retriever
-        doc_language = session.doc_language or retriever.doc_language or "en"
+    # Lock-free: ingestion replaces the snapshot wholesale, never mutates it.
+    document = session.document
+    if document.status != "ready" or document.retriever is None:
+        raise HTTPException(
+            status_code=400, detail="No active document. Upload and wait until Ready."
+        )
+    retriever = document.retriever
+    doc_language = document.doc_language or retriever.doc_language or "en"
 
     user_query = req.message.strip()
     if not user_query:
         raise HTTPException(status_code=400, detail="Empty message")
 
-    await session.log("[LOG] Chat: translating query for keyword alignment...")
-    try:
-        expanded_query = await openrouter.translate_query_for_doc_language(
-            query=user_query, doc_language=str(doc_language)
-        )
-    except OpenRouterError as e:
-        raise HTTPException(status_code=502, detail=f"OpenRouter translate error: {e}") from e
+    if query_matches_language(user_query, doc_language):
+        await session.log("[LOG] Chat: query already in document language; skipping translation.")
+        expanded_query = user_query
+    else:
+        await session.log("[LOG] Chat: translating query for keyword alignment...")
+        try:
+            expanded_query = await openrouter.translate_query_for_doc_language(
+                query=user_query, doc_language=str(doc_language)
+            )
+        except OpenRouterError as e:
+            raise HTTPException(status_code=502, detail=f"OpenRouter translate error: {e}") from e
 
     metrics = RetrievalMetrics(
         session_id=req.session_id,
@@ -484,23 +682,33 @@ async def chat(
         },
     )
 
+    format_query = (
+        _embedding_query_formatter(
+            settings.embedding_query_instruction_template, settings.embedding_query_task
+        )
+        if settings.embedding_query_use_instruction
+        else None
+    )
+    include_raw_query = settings.embedding_query_include_raw
+
     if req.fast_mode:
         await session.log("[LOG] Chat: fast mode enabled -> baseline retrieval.")
 
         await session.log("[LOG] Chat: embedding query (instruction-aware)...")
         try:
             query_variants = _unique_nonempty([user_query, expanded_query])
-            embed_inputs = _build_embedding_query_inputs(settings=settings, queries=query_variants)
+            embed_inputs = _build_embedding_query_inputs(
+                queries=query_variants, format_query=format_query, include_raw=include_raw_query
+            )
             if not embed_inputs:
                 raise HTTPException(status_code=400, detail="Empty message")
-            q_embs = await openrouter.embeddings(model=settings.embedding_model, inputs=embed_inputs)
+            q_embs = await openrouter.embed_queries(model=settings.embedding_model, inputs=embed_inputs)
         except OpenRouterError as e:
             raise HTTPException(status_code=502, detail=f"OpenRouter embedding error: {e}") from e
 
         if q_embs.ndim != 2 or q_embs.shape[0] < 1:
             raise HTTPException(status_code=500, detail="Unexpected embedding response shape")
 
-        import numpy as np
         # Fast mode: simple mean (no weighted aggregation)
         query_embedding = cast(np.ndarray, np.mean(q_embs, axis=0, dtype=np.float32))
 
@@ -527,96 +735,112 @@ async def chat(
         query_texts: list[str] = [base_query]
         hyde_text: str = ""
         if settings.query_fusion_enabled:
-            await session.log("[LOG] Chat: generating query variants (multi-query)...")
-            try:
-                variants = await openrouter.generate_query_variants(
-                    query=base_query,
-                    doc_language=str(doc_language),
-                    n=settings.query_variants_count,
-                )
-            except OpenRouterError as e:
-                await session.log(f"[LOG] WARNING: query variants failed: {e}")
-                variants = []
-
-            # Keep the raw query too (useful for cross-lingual names / phrasing).
-            query_texts = dedupe_keep_order([base_query, user_query] + variants)
+            # Variants and HyDE both derive from base_query only: request them
+            # concurrently so query prep costs one round-trip, not two.
+            async def _variants() -> list[str]:
+                try:
+                    return await openrouter.generate_query_variants(
+                        query=base_query,
+                        doc_language=str(doc_language),
+                        n=settings.query_variants_count,
+                    )
+                except OpenRouterError as e:
+                    await session.log(f"[LOG] WARNING: query variants failed: {e}")
+                    return []
 
-            if settings.hyde_enabled:
-                await session.log("[LOG] Chat: generating HyDE passage (retrieval-only)...")
+            async def _hyde() -> str:
+                if not settings.hyde_enabled:
+                    return ""
                 try:
-                    hyde_text = await openrouter.generate_hyde_passage(
+                    return await openrouter.generate_hyde_passage(
                         query=base_query,
                         doc_language=str(doc_language),
                         max_words=settings.hyde_max_words,
                     )
                 except OpenRouterError as e:
                     await session.log(f"[LOG] WARNING: HyDE generation failed: {e}")
-                    hyde_text = ""
+                    return ""
+
+            async def _combined() -> tuple[list[str], str]:
+                try:
+                    aids = await openrouter.generate_retrieval_aids(
+                        query=base_query,
+                        doc_language=str(doc_language),
+                        n_variants=settings.query_variants_count,
+                        max_words=settings.hyde_max_words,
+                    )
+                except OpenRouterError as e:
+                    await session.log(f"[LOG] WARNING: query variants/HyDE failed: {e}")
+                    return [], ""
+                return aids["variants"], aids["hyde"]
+
+            await session.log("[LOG] Chat: generating query variants (multi-query)...")
+            if settings.hyde_enabled:
+                await session.log("[LOG] Chat: generating HyDE passage (retrieval-only)...")
+            if settings.hyde_enabled and settings.query_aids_single_call:
+                variants, hyde_text = await _combined()
+            else:
+                variants, hyde_text = await asyncio.gather(_variants(), _hyde())
+
+            # Keep the raw query too (useful for cross-lingual names / phrasing).
+            query_texts = dedupe_keep_order([base_query, user_query] + variants)
         else:
             query_texts = dedupe_keep_order([base_query, user_query])
 
         # Embed all query texts (and optional HyDE) in one call.
         await session.log("[LOG] Chat: embedding query variants (instruction-aware)...")
-        embed_inputs: list[str] = []
-        slices: dict[str, slice] = {}
+        # Identical inputs across variants are embedded once; each query keeps
+        # the row indices of its own inputs, in order.
+        input_rows: dict[str, int] = {}
+        rows: dict[str, list[int]] = {}
         for q in query_texts:
-            inputs_for_q = _build_embedding_query_inputs(settings=settings, queries=[q])
+            inputs_for_q = _build_embedding_query_inputs(
+                queries=[q], format_query=format_query, include_raw=include_raw_query
+            )
             if not inputs_for_q:
                 continue
-            start = len(embed_inputs)
-            embed_inputs.extend(inputs_for_q)
-            end = len(embed_inputs)
-            slices[q] = slice(start, end)
+            rows[q] = [input_rows.setdefault(inp, len(input_rows)) for inp in inputs_for_q]
 
         if hyde_text.strip():
-            start = len(embed_inputs)
-            embed_inputs.append(hyde_text.strip())
-            end = len(embed_inputs)
-            slices["__hyde__"] = slice(start, end)
+            rows["__hyde__"] = [input_rows.setdefault(hyde_text.strip(), len(input_rows))]
+        embed_inputs = list(input_rows)
 
         if not embed_inputs:
             raise HTTPException(status_code=400, detail="Empty message")
 
         try:
-            q_embs = await openrouter.embeddings(model=settings.embedding_model, inputs=embed_inputs)
+            q_embs = await openrouter.embed_queries(model=settings.embedding_model, inputs=embed_inputs)
         except OpenRouterError as e:
             raise HTTPException(status_code=502, detail=f"OpenRouter embedding error: {e}") from e
 
         if q_embs.ndim != 2 or q_embs.shape[0] != len(embed_inputs):
             raise HTTPException(status_code=500, detail="Unexpected embedding response shape")
 
-        import numpy as np
-
-        def cosine(a: np.ndarray, b: np.ndarray) -> float:
-            aa = np.asarray(a, dtype=np.float32).reshape(-1)
-            bb = np.asarray(b, dtype=np.float32).reshape(-1)
-            denom = float(np.linalg.norm(aa) * np.linalg.norm(bb))
-            if denom < 1e-12:
-                return 0.0
-            return float(np.dot(aa, bb) / denom)
-
-        query_vecs: dict[str, np.ndarray] = {}
+        # One L2-normalized row per query text, then HyDE last; drift filtering
+        # and retrieval all read rows of this matrix.
         aggregation_decay = float(settings.embedding_aggregation_decay)
-        for q, sl in slices.items():
-            if q == "__hyde__":
-                continue
-            vec = _weighted_embedding_mean(q_embs[sl], decay=aggregation_decay)
-            query_vecs[q] = vec
+        hyde_rows = rows.pop("__hyde__", None)
+        query_row: dict[str, int] = {q: i for i, q in enumerate(rows)}
+        query_matrix = np.empty(
+            (len(rows) + (hyde_rows is not None), q_embs.shape[1]), dtype=np.float32
+        )
+        for q, q_rows in rows.items():
+            query_matrix[query_row[q]] = _weighted_embedding_mean(
+                q_embs[q_rows], decay=aggregation_decay
+            )
+        if hyde_rows is not None:
+            query_matrix[-1] = _weighted_embedding_mean(q_embs[hyde_rows], decay=aggregation_decay)
+        query_matrix /= np.linalg.norm(query_matrix, axis=1, keepdims=True).clip(min=1e-12)
 
-        base_vec = query_vecs.get(base_query)
-        if base_vec is None and query_vecs:
-            base_vec = next(iter(query_vecs.values()))
+        base_row = query_row.get(base_query)
+        if base_row is None and query_row:
+            base_row = 0
 
         # Drift filter (recall-oriented): only drop clearly off-topic variants.
-        if base_vec is not None:
-            scored_variants: list[tuple[float, str]] = []
-            for q in query_texts:
-                if q == base_query:
-                    continue
-                v = query_vecs.get(q)
-                if v is None:
-                    continue
-                scored_variants.append((cosine(base_vec, v), q))
+        if base_row is not None:
+            variants = [q for q in query_texts if q != base_query and q in query_row]
+            sims = query_matrix[[query_row[q] for q in variants]] @ query_matrix[base_row]
+            scored_variants = list(zip(sims.tolist(), variants))
 
             scored_variants.sort(key=lambda x: x[0], reverse=True)
             kept: list[str] = [base_query]
@@ -630,14 +854,11 @@ async def chat(
 
         # Optional HyDE drift filter.
         use_hyde = False
-        hyde_vec: np.ndarray | None = None
-        hyde_slice = slices.get("__hyde__")
-        if hyde_slice is not None:
-            hyde_vec = _weighted_embedding_mean(q_embs[hyde_slice], decay=aggregation_decay)
-            if base_vec is None:
+        if hyde_rows is not None:
+            if base_row is None:
                 use_hyde = True
             else:
-                sim_hyde = cosine(base_vec, cast(np.ndarray, hyde_vec))
+                sim_hyde = float(query_matrix[-1] @ query_matrix[base_row])
                 use_hyde = (not settings.drift_filter_enabled) or (
                     sim_hyde >= settings.hyde_drift_sim_threshold
                 )
@@ -651,34 +872,24 @@ async def chat(
         rankings: list[list[str]] = []
         id_to_chunk: dict[str, ChunkModel] = {}
 
-        for q in query_texts:
-            v = query_vecs.get(q)
-            if v is None:
-                continue
-            scored = retriever.search(
-                query=q,
-                query_embedding=v,
-                expanded_query=q,
-                top_k=settings.fusion_per_query_top_k,
-                metrics=metrics
-            )
-            ranking_ids: list[str] = []
-            for s in scored:
-                cid = s.chunk.id
-                ranking_ids.append(cid)
-                id_to_chunk[cid] = s.chunk
-            if ranking_ids:
-                rankings.append(ranking_ids)
+        search_texts = [q for q in query_texts if q in query_row]
+        search_rows = [query_row[q] for q in search_texts]
+        if use_hyde:
+            search_texts.append(base_query)
+            search_rows.append(len(query_matrix) - 1)
 
-        if use_hyde and hyde_vec is not None:
-            scored = retriever.search(
-                query=base_query,
-                query_embedding=hyde_vec,
-                expanded_query=base_query,
+        batched = (
+            retriever.search_many(
+                queries=search_texts,
+                query_embeddings=query_matrix[search_rows],
                 top_k=settings.fusion_per_query_top_k,
-                metrics=metrics
+                metrics=metrics,
             )
-            ranking_ids = []
+            if search_texts
+            else []
+        )
+        for scored in batched:
+            ranking_ids: list[str] = []
             for s in scored:
                 cid = s.chunk.id
                 ranking_ids.append(cid)
@@ -704,17 +915,23 @@ async def chat(
         if not candidate_chunks:
             scored = retriever.search(
                 query=base_query,
-                query_embedding=base_vec if base_vec is not None else q_embs[0],
+                query_embedding=query_matrix[base_row] if base_row is not None else q_embs[0],
                 expanded_query=base_query,
                 top_k=max(req.top_k, 1),
                 metrics=metrics
             )
             candidate_chunks = [s.chunk for s in scored]
 
+        pool_n = max(1, min(settings.llm_rerank_candidate_pool, len(candidate_chunks)))
         if not settings.llm_rerank_enabled:
             metrics.add_step("llm_rerank", skipped=True, reason="disabled")
+        elif settings.llm_rerank_skip_unanimous and rankings_agree_on_top(rankings, pool_n):
+            # Every query variant retrieved the same rerank pool, so rerank could
+            # not bring in a different chunk; it would still reorder the pool
+            # (and so the top-k and repack order), which this opt-in gives up.
+            await session.log("[LOG] Chat: retrieval unanimous on rerank pool -> skipping LLM rerank.")
+            metrics.add_step("llm_rerank", skipped=True, reason="unanimous")
         elif candidate_chunks:
-            pool_n = max(1, min(settings.llm_rerank_candidate_pool, len(candidate_chunks)))
             pool = candidate_chunks[:pool_n]
             passages = [(c.id, c.content) for c in pool]
 
@@ -726,6 +943,8 @@ async def chat(
                     doc_language=str(doc_language),
                     model=settings.llm_rerank_model or None,
                     max_chars=settings.llm_rerank_max_chars,
+                    max_tokens_per_passage=settings.llm_rerank_max_tokens_per_passage,
+                    max_output_tokens=settings.llm_rerank_max_output_tokens,
                 )
                 candidate_ids = {c.id for c in candidate_chunks}
                 metrics.add_step(
@@ -765,21 +984,18 @@ async def chat(
     if req.fast_mode:
         await session.log("[LOG] Chat: fast mode -> skipping re-packing.")
     else:
-        if repack_strategy in {"forward", "none", "off", "disabled", "disable"}:
-            await session.log(f"[LOG] Chat: re-pack strategy '{repack_strategy}' -> keeping order.")
-        elif repack_strategy == "reverse":
-            await session.log("[LOG] Chat: re-pack strategy 'reverse' -> reversing order.")
-        else:
+        repacker = resolve_repack(repack_strategy)
+        if repacker is None:
             await session.log(
                 f"[LOG] WARNING: unknown ERR_REPACK_STRATEGY='{repack_strategy}', defaulting to 'reverse'."
             )
-            repack_strategy = "reverse"
+            repacker = repack_chunks_reverse
+        elif repacker is repack_chunks_reverse:
+            await session.log("[LOG] Chat: re-pack strategy 'reverse' -> reversing order.")
+        else:
+            await session.log(f"[LOG] Chat: re-pack strategy '{repack_strategy}' -> keeping order.")
+        retrieved_chunks = repacker(retrieved_chunks)
 
-    retrieved_chunks = apply_repack_strategy(
-        retrieved_chunks,
-        fast_mode=req.fast_mode,
-        repack_strategy=repack_strategy,
-    )
     # Add final context with previews (no scores for repacked, use 0 or previous)
     final_chunks_data = []
     for i, chunk in enumerate(retrieved_chunks):
@@ -798,20 +1014,16 @@ async def chat(
     context_blocks = _build_context_blocks(chunks=retrieved_chunks, include_neighbors=True)
     context_text = "\n\n".join(context_blocks)
 
-    system_prompt = (
-        "You are a strict RAG QA engine.\n"
-        "Rules:\n"
-        "1) You MUST answer using ONLY the provided document excerpts in CONTEXT.\n"
-        '2) If the answer cannot be found in CONTEXT, reply exactly: "The document does not mention this."\n'
-        "3) When you use information from an excerpt, cite it with stacked citations like [1][2].\n"
-        "4) Do not use any outside knowledge. Do not guess.\n"
-    )
+    # No await between these reads, so the text and its token count agree
+    # without taking the session lock (writers never await mid-update either).
+    history_text = "\n".join([f"{t.role}: {t.content}" for t in session.chat_history])
+    history_tokens = session.chat_history_tokens
 
-    async with session.lock:
-        history_text = "\n".join([f"{t.role}: {t.content}" for t in session.chat_history])
-
-    prompt_tokens = _estimate_prompt_tokens(
-        text_parts=[system_prompt, history_text, context_text, user_query]
+    prompt_tokens = (
+        _STRICT_RAG_SYSTEM_PROMPT_TOKENS
+        + history_tokens
+        + estimate_tokens(context_text)
+        + estimate_tokens(user_query)
     )
     if prompt_tokens > settings.chat_model_context_limit_tokens:
         await session.log("[LOG] Chat: token limit reached -> refusing request")
@@ -820,7 +1032,7 @@ async def chat(
             detail="Session limit reached. Please export and refresh.",
         )
 
-    messages: list[ChatMessage] = [ChatMessage(role="system", content=system_prompt)]
+    messages: list[ChatMessage] = [ChatMessage(role="system", content=_STRICT_RAG_SYSTEM_PROMPT)]
     if history_text:
         messages.append(ChatMessage(role="assistant", content=f"CHAT_HISTORY:\n{history_text}"))
     messages.append(ChatMessage(role="assistant", content=f"CONTEXT:\n{context_text}"))
@@ -890,9 +1102,9 @@ async def chat(
     # IMPORTANT for frontend:
     # - The model cites [1]..[K] based on the CONTEXT numbering.
     # - Therefore the API must return `citations` aligned to that same numbering.
-    citations_payload: list[dict] = [c.model_dump() for c in retrieved_chunks]
+    citations_payload: list[dict] = [c.as_dict() for c in retrieved_chunks]
 
-    cited_nums = _extract_citation_numbers(answer)
+    cited_nums = extract_citation_numbers(answer)
     cited_models = []
     for n in cited_nums:
         idx = n - 1
@@ -900,8 +1112,8 @@ async def chat(
             cited_models.append(retrieved_chunks[idx])
 
     async with session.lock:
-        session.chat_history.append(ChatTurn(role="user", content=user_query))
-        session.chat_history.append(
+        session.add_chat_turn(ChatTurn(role="user", content=user_query))
+        session.add_chat_turn(
             ChatTurn(role="assistant", content=answer, citations=retrieved_chunks)
         )
         session.register_references(cited_models)
@@ -924,33 +1136,24 @@ async def get_evaluation(
     return session.latest_evaluation
 
 
+_UNSAFE_FILENAME_CHAR_RE = re.compile(r"[^\w-]")
+
+
 def _rewrite_local_citations_to_global(
-    *, answer: str, local_citations: list[dict], global_map: dict[str, int]
+    *, answer: str, local_citation_ids: list[str], global_map: dict[str, int]
 ) -> str:
     """
-    Convert local [n] citations (index into local_citations) into stable global references.
-    local_citations are dicts with at least {"id": "..."}.
+    Convert local [n] citations (index into local_citation_ids) into stable global references.
     """
-    import re
-
-    def repl(m: re.Match[str]) -> str:
-        raw = m.group(1)
-        try:
-            n = int(raw)
-        except ValueError:
-            return m.group(0)
-        idx = n - 1
-        if idx < 0 or idx >= len(local_citations):
-            return m.group(0)
-        cid = local_citations[idx].get("id")
-        if not isinstance(cid, str):
-            return m.group(0)
-        g = global_map.get(cid)
-        if g is None:
-            return m.group(0)
-        return f"[{g}]"
+    # Local number -> replacement, built once; unknown numbers stay as written.
+    replacements: dict[int, str] = {}
+    for i, cid in enumerate(local_citation_ids, start=1):
+        if cid in global_map:
+            replacements[i] = f"[{global_map[cid]}]"
+    if not replacements or "[" not in answer:
+        return answer
 
-    return re.sub(r"\[(\d+)\]", repl, answer)
+    return CITATION_RE.sub(lambda m: replacements.get(int(m.group(1)), m.group(0)), answer)
 
 
 @app.get("/export/{session_id}")
@@ -968,56 +1171,46 @@ async def export_markdown(
         turns = list(session.chat_history)
         refs = list(session.references)
         ref_map = dict(session.reference_ids)
-        filename = session.filename or "document"
+    filename = session.document.filename or "document"
 
     # Build transcript. For assistant turns we rewrite local numbering to global numbering
     # so the Appendix indices match the citations users see in the exported markdown.
-    lines: list[str] = []
-    lines.append(f"# ERR Export — {filename}")
-    lines.append("")
-    lines.append("## Chat History")
-    lines.append("")
+    buf = StringIO()
+    w = buf.write
+    w(f"# ERR Export — {filename}\n\n## Chat History\n\n")
 
     for t in turns:
         if t.role == "user":
-            lines.append("### User")
-            lines.append(t.content.strip())
-            lines.append("")
-            continue
-
-        if t.role == "assistant":
-            lines.append("### Assistant")
-            local_citations = [c.model_dump() for c in t.citations]
-            rewritten = _rewrite_local_citations_to_global(
-                answer=t.content, local_citations=local_citations, global_map=ref_map
+            w("### User\n")
+            content = t.content
+        elif t.role == "assistant":
+            w("### Assistant\n")
+            content = _rewrite_local_citations_to_global(
+                answer=t.content,
+                local_citation_ids=[c.id for c in t.citations],
+                global_map=ref_map,
             )
-            lines.append(rewritten.strip())
-            lines.append("")
-            continue
-
-        # fallback
-        lines.append(f"### {t.role}")
-        lines.append(t.content.strip())
-        lines.append("")
+        else:
+            w(f"### {t.role}\n")
+            content = t.content
+        w(content.strip())
+        w("\n\n")
 
-    lines.append("---")
-    lines.append("")
-    lines.append("## Appendix — Referenced Chunks")
-    lines.append("")
+    w("---\n\n## Appendix — Referenced Chunks\n\n")
 
     if not refs:
-        lines.append("_No references were used in this session._")
-        lines.append("")
+        w("_No references were used in this session._\n")
     else:
         for i, ch in enumerate(refs, start=1):
-            lines.append(f"> **Reference [{i}]**")
-            lines.append(">")
+            w(f"> **Reference [{i}]**\n>\n")
             for ln in ch.content.strip().splitlines():
-                lines.append(f"> {ln}")
-            lines.append("")
+                w("> ")
+                w(ln)
+                w("\n")
+            w("\n")
 
-    md = "\n".join(lines).strip() + "\n"
-    safe_name = "".join(c if c.isalnum() or c in ("-", "_") else "_" for c in filename)[:40]
+    md = buf.getvalue().strip() + "\n"
+    safe_name = _UNSAFE_FILENAME_CHAR_RE.sub("_", filename)[:40]
     return Response(
         content=md,
         media_type="text/markdown; charset=utf-8",
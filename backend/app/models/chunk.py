@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import Any
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 
 class ChunkModel(BaseModel):
@@ -13,3 +13,14 @@ class ChunkModel(BaseModel):
     next_content: str | None = None  # Text of the next chunk (for context)
     metadata: dict[str, Any] = Field(default_factory=dict)
 
+    # Chunks are not mutated once chunking returns, so their dump can be memoized.
+    _dump_cache: dict[str, Any] | None = PrivateAttr(default=None)
+
+    def as_dict(self) -> dict[str, Any]:
+        """
+        Cached `model_dump()`; treat the returned dict as read-only.
+        """
+        if self._dump_cache is None:
+            self._dump_cache = self.model_dump()
+        return self._dump_cache
+
@@ -1,16 +1,38 @@
 from __future__ import annotations
 
 import asyncio
+import base64
+import binascii
+import hashlib
 import json
 import re
-from dataclasses import dataclass
-from typing import Any, Literal
+import time
+from collections import OrderedDict
+from typing import Any, Literal, TypedDict
 
 import httpx
 import numpy as np
-from tenacity import retry, stop_after_attempt, wait_exponential_jitter
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 
 from .config import Settings
+from .ingestion.chunker import truncate_to_tokens
+
+try:
+    import orjson  # type: ignore
+except Exception:  # noqa: BLE001
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import msgspec  # type: ignore
+except Exception:  # noqa: BLE001
+    msgspec = None  # type: ignore[assignment]
+
+try:
+    import h2  # type: ignore  # noqa: F401
+except Exception:  # noqa: BLE001
+    _HTTP2_AVAILABLE = False
+else:
+    _HTTP2_AVAILABLE = True
 
 
 class OpenRouterError(RuntimeError):
@@ -19,6 +41,177 @@ class OpenRouterError(RuntimeError):
         self.status_code = status_code
 
 
+class _TransientOpenRouterError(OpenRouterError):
+    """
+    A failure worth retrying (rate limit, upstream 5xx, timeout, dropped
+    connection). Still an OpenRouterError, so callers see one type once
+    retries run out.
+    """
+
+    def __init__(
+        self, message: str, *, status_code: int | None = None, retry_after: float | None = None
+    ) -> None:
+        super().__init__(message, status_code=status_code)
+        self.retry_after = retry_after
+
+
+_TRANSIENT_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+# Longest server-requested Retry-After we honor before falling back to backoff.
+_MAX_RETRY_AFTER_SECONDS = 10.0
+_backoff = wait_exponential_jitter(initial=0.5, max=4.0)
+
+
+def _retry_wait(retry_state: Any) -> float:
+    exc = retry_state.outcome.exception() if retry_state.outcome else None
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after is not None and 0 <= retry_after <= _MAX_RETRY_AFTER_SECONDS:
+        return retry_after
+    return _backoff(retry_state)
+
+
+# Only transient failures are retried; a 400/401/404 fails on the first attempt.
+# reraise=True surfaces the last OpenRouterError instead of tenacity's RetryError.
+_retry_transient = retry(
+    retry=retry_if_exception_type(_TransientOpenRouterError),
+    stop=stop_after_attempt(3),
+    wait=_retry_wait,
+    reraise=True,
+)
+
+
+def _retry_after_seconds(resp: httpx.Response) -> float | None:
+    raw = resp.headers.get("Retry-After")
+    if raw is None:
+        return None
+    try:
+        return float(raw)
+    except ValueError:
+        return None
+
+
+def _raise_for_error(resp: httpx.Response, payload: Any, *, what: str) -> None:
+    """
+    Raise for a non-200 status or a 200 carrying an `error` object (OpenRouter
+    does this in rare cases), as transient when a retry could succeed.
+    """
+    message = _extract_error_message(payload)
+    if resp.status_code != 200:
+        status: Any = resp.status_code
+        message = message or f"HTTP {resp.status_code} from {what}"
+    elif message:
+        try:
+            status = int(payload["error"].get("code"))
+        except (TypeError, ValueError):
+            status = None
+    else:
+        return
+    if status in _TRANSIENT_STATUSES:
+        raise _TransientOpenRouterError(
+            message, status_code=resp.status_code, retry_after=_retry_after_seconds(resp)
+        )
+    raise OpenRouterError(message, status_code=resp.status_code)
+
+
+async def _post(client: httpx.AsyncClient, url: str, body: bytes) -> httpx.Response:
+    try:
+        return await client.post(url, content=body)
+    except httpx.TransportError as e:
+        raise _TransientOpenRouterError(f"{type(e).__name__} calling {url}: {e}") from e
+
+
+def _response_json(resp: httpx.Response) -> Any:
+    # orjson parses large embedding payloads several times faster than stdlib json.
+    if orjson is not None:
+        return orjson.loads(resp.content)
+    return resp.json()
+
+
+def _encode_json(body: dict[str, Any]) -> bytes:
+    # Sorted keys make the bytes deterministic, so they double as a cache key.
+    if orjson is not None:
+        return orjson.dumps(body, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(body, sort_keys=True, ensure_ascii=False).encode("utf-8")
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+# Assistant prefill for rerank_passages_yesno; the reply continues the array.
+_RANKED_IDS_PREFILL = '{"ranked_ids": ['
+# One complete JSON string literal.
+_JSON_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+
+def _rerank_candidate(pid: str, text: str, max_chars: int, max_tokens: int = 0) -> str:
+    snippet = (text or "").strip()
+    if max_tokens > 0:
+        clipped = truncate_to_tokens(snippet, max_tokens)
+        if len(clipped) < len(snippet):
+            snippet = clipped.rstrip() + "…"
+    elif len(snippet) > max_chars:
+        # Prefer a word boundary when one is reasonably close to the cap;
+        # CJK text has none, so fall back to a hard cut.
+        cut = snippet.rfind(" ", 0, max_chars - 1)
+        snippet = snippet[: cut if cut > max_chars // 2 else max_chars - 1] + "…"
+    return f"- id: {pid}\n  passage: {snippet}"
+
+
+def _partial_ranked_ids(raw: str) -> list[str]:
+    """
+    String items of the ranked_ids array in a reply that is not valid JSON,
+    e.g. one cut off by the output-token limit. Scanning stops at the array's
+    closing bracket; an unterminated trailing id is ignored.
+    """
+    key = raw.find('"ranked_ids"')
+    start = raw.find("[", key) if key >= 0 else -1
+    if start < 0:
+        return []
+    out: list[str] = []
+    pos = start + 1
+    for m in _JSON_STRING_RE.finditer(raw, pos):
+        if "]" in raw[pos : m.start()]:
+            break
+        try:
+            item = json.loads(m.group(0))
+        except ValueError:
+            break
+        out.append(item)
+        pos = m.end()
+    return out
+
+
+def _clean_variants(variants: Any) -> list[str]:
+    if not isinstance(variants, list):
+        return []
+    out: list[str] = []
+    seen: set[str] = set()
+    for v in variants:
+        if not isinstance(v, str):
+            continue
+        s = " ".join(v.split()).strip()
+        if not s or s in seen:
+            continue
+        seen.add(s)
+        out.append(s)
+    return out
+
+
+def _clean_passage(text: Any) -> str:
+    if not isinstance(text, str):
+        return ""
+    return "\n".join([ln.rstrip() for ln in text.strip().splitlines()]).strip()
+
+
+def _is_json(text: str) -> bool:
+    try:
+        if orjson is not None:
+            orjson.loads(text)
+        else:
+            json.loads(text)
+    except ValueError:
+        return False
+    return True
+
+
 def _extract_error_message(payload: Any) -> str | None:
     if isinstance(payload, dict):
         err = payload.get("error")
@@ -32,22 +225,230 @@ def _extract_error_message(payload: Any) -> str | None:
     return None
 
 
+def _decode_embedding(value: Any) -> np.ndarray:
+    # base64 payloads are packed little-endian float32; providers that ignore
+    # encoding_format still send plain float lists, which are accepted as-is.
+    if isinstance(value, str):
+        try:
+            return np.frombuffer(base64.b64decode(value, validate=True), dtype="<f4")
+        except (binascii.Error, ValueError) as e:
+            raise OpenRouterError(f"Invalid base64 embedding: {e}") from e
+    return np.asarray(value, dtype=np.float32)
+
+
+def _stack_embeddings(values: list[Any]) -> np.ndarray:
+    """
+    Decode each response embedding straight into one preallocated float32
+    matrix: float lists convert once (no per-row array) and base64 rows are
+    copied from their buffer.
+    """
+    first = _decode_embedding(values[0])
+    out = np.empty((len(values), first.shape[0]), dtype=np.float32)
+    out[0] = first
+    for i in range(1, len(values)):
+        value = values[i]
+        try:
+            out[i] = _decode_embedding(value) if isinstance(value, str) else value
+        except ValueError as e:
+            raise OpenRouterError(f"Inconsistent embedding dims in response: {e}") from e
+    return out
+
+
+if msgspec is not None:
+    # Typed views of the success payloads, decoded in one C-level pass. Anything
+    # that does not fit (error objects, missing fields) falls back to the
+    # generic dict walk below, which produces the detailed error messages.
+
+    class _EmbeddingItem(msgspec.Struct):
+        embedding: str | list[float]
+
+    class _EmbeddingsResponse(msgspec.Struct):
+        data: list[_EmbeddingItem]
+        error: Any = None
+
+    class _ChatMessageOut(msgspec.Struct):
+        content: str
+
+    class _ChatChoice(msgspec.Struct):
+        message: _ChatMessageOut
+
+    class _ChatResponse(msgspec.Struct):
+        choices: list[_ChatChoice]
+        error: Any = None
+
+    _EMBEDDINGS_DECODER: Any = msgspec.json.Decoder(_EmbeddingsResponse)
+    _CHAT_DECODER: Any = msgspec.json.Decoder(_ChatResponse)
+else:
+    _EMBEDDINGS_DECODER = None
+    _CHAT_DECODER = None
+
+
+def _decode_typed(decoder: Any, resp: httpx.Response) -> Any:
+    """
+    Parse a 200 response with a msgspec decoder, or return None when msgspec
+    is unavailable or the payload does not match the success schema.
+    """
+    if decoder is None or resp.status_code != 200:
+        return None
+    try:
+        parsed = decoder.decode(resp.content)
+    except msgspec.DecodeError:
+        return None
+    if parsed.error is not None:
+        return None
+    return parsed
+
+
 ChatRole = Literal["system", "user", "assistant"]
 
 
-@dataclass(frozen=True)
-class ChatMessage:
+class ChatMessage(TypedDict):
+    # Already the wire shape, so request bodies take a list of these as-is.
     role: ChatRole
     content: str
 
 
+class RetrievalAids(TypedDict):
+    variants: list[str]
+    hyde: str
+
+
+class _CompletionCache:
+    """
+    In-process LRU of chat completions keyed on a digest of the exact request
+    body. Entries older than `ttl_seconds` are treated as misses (0 = no expiry).
+    """
+
+    def __init__(self, *, max_entries: int, ttl_seconds: int) -> None:
+        self._max_entries = max_entries
+        self._ttl = float(ttl_seconds)
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def key(self, body: bytes) -> str | None:
+        if self._max_entries <= 0:
+            return None
+        return hashlib.sha256(body).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, content = entry
+        if self._ttl and time.monotonic() - stored_at > self._ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return content
+
+    def set(self, key: str, content: str) -> None:
+        self._entries[key] = (time.monotonic(), content)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+
+class _EmbeddingBatcher:
+    """
+    Coalesces small embedding requests (one /chat turn's queries) that arrive
+    within `window` seconds into a single upstream call, then hands each caller
+    back its own rows. A batch is sent early once it holds `max_inputs` inputs.
+    If a merged call fails, each caller is retried on its own so one bad input
+    (or a rate limit) only fails the chats it belongs to.
+    """
+
+    def __init__(self, embed: Any, *, window: float, max_inputs: int) -> None:
+        self._embed = embed
+        self._window = window
+        self._max_inputs = max(1, max_inputs)
+        # model -> [(inputs, future)] waiting for the next flush
+        self._pending: dict[str, list[tuple[list[str], asyncio.Future[np.ndarray]]]] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def embed(self, *, model: str, inputs: list[str]) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future[np.ndarray] = loop.create_future()
+        pending = self._pending.setdefault(model, [])
+        pending.append((inputs, fut))
+        if sum(len(i) for i, _ in pending) >= self._max_inputs:
+            self._flush(model)
+        elif model not in self._timers:
+            self._timers[model] = loop.call_later(self._window, self._flush, model)
+        return await fut
+
+    def _flush(self, model: str) -> None:
+        timer = self._timers.pop(model, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(model, [])
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._send(model, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(
+        self, model: str, batch: list[tuple[list[str], asyncio.Future[np.ndarray]]]
+    ) -> None:
+        try:
+            embs = await self._embed(model=model, inputs=[t for inputs, _ in batch for t in inputs])
+            if embs.ndim != 2 or embs.shape[0] != sum(len(inputs) for inputs, _ in batch):
+                raise OpenRouterError(f"Unexpected embeddings shape: {tuple(embs.shape)}")
+        except asyncio.CancelledError:
+            for _, fut in batch:
+                fut.cancel()
+            raise
+        except Exception as e:  # noqa: BLE001
+            if len(batch) > 1:
+                await self._send_separately(model, batch)
+                return
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        start = 0
+        for inputs, fut in batch:
+            if not fut.done():
+                fut.set_result(embs[start : start + len(inputs)])
+            start += len(inputs)
+
+    async def _send_separately(
+        self, model: str, batch: list[tuple[list[str], asyncio.Future[np.ndarray]]]
+    ) -> None:
+        try:
+            results = await asyncio.gather(
+                *(self._embed(model=model, inputs=inputs) for inputs, _ in batch),
+                return_exceptions=True,
+            )
+        except asyncio.CancelledError:
+            for _, fut in batch:
+                fut.cancel()
+            raise
+        for (inputs, fut), res in zip(batch, results):
+            if fut.done():
+                continue
+            if isinstance(res, BaseException):
+                fut.set_exception(res)
+            elif res.ndim != 2 or res.shape[0] != len(inputs):
+                fut.set_exception(OpenRouterError(f"Unexpected embeddings shape: {tuple(res.shape)}"))
+            else:
+                fut.set_result(res)
+
+
 class OpenRouterClient:
     def __init__(self, settings: Settings) -> None:
         if not settings.openrouter_api_key:
             raise OpenRouterError("OPENROUTER_API_KEY is not set")
         self.settings = settings
+        # HTTP/2 multiplexes concurrent embedding/chat calls over one TLS connection;
+        # without the optional h2 package httpx stays on pooled HTTP/1.1.
         self._client = httpx.AsyncClient(
             base_url=settings.openrouter_base_url.rstrip("/"),
+            http2=_HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=max(32, settings.embedding_concurrency),
+                max_keepalive_connections=16,
+                keepalive_expiry=60.0,
+            ),
             timeout=httpx.Timeout(60.0, connect=10.0),
             headers={
                 "Authorization": f"Bearer {settings.openrouter_api_key}",
@@ -56,53 +457,77 @@ class OpenRouterClient:
                 "Content-Type": "application/json",
             },
         )
+        # Temperature-0 completions are effectively deterministic, so repeated
+        # requests (same translation, variants, rerank...) skip the round-trip.
+        self._completion_cache = _CompletionCache(
+            max_entries=settings.llm_cache_max_entries,
+            ttl_seconds=settings.llm_cache_ttl_seconds,
+        )
+        window_ms = settings.query_embedding_batch_window_ms
+        self._query_batcher = (
+            _EmbeddingBatcher(
+                self.embeddings,
+                window=window_ms / 1000.0,
+                max_inputs=settings.embedding_batch_size,
+            )
+            if window_ms > 0
+            else None
+        )
 
     async def aclose(self) -> None:
         await self._client.aclose()
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential_jitter(initial=0.5, max=4.0))
+    async def embed_queries(self, *, model: str, inputs: list[str]) -> np.ndarray:
+        """
+        Like `embeddings`, but concurrent callers within the batch window share
+        one upstream request. Meant for small per-turn query batches.
+        """
+        if self._query_batcher is None:
+            return await self.embeddings(model=model, inputs=inputs)
+        return await self._query_batcher.embed(model=model, inputs=inputs)
+
     async def embeddings(self, *, model: str, inputs: list[str]) -> np.ndarray:
         """
         Returns float32 ndarray of shape (len(inputs), embedding_dim).
         """
-        resp = await self._client.post(
-            "/embeddings",
-            json={
+        body = _encode_json(
+            {
                 "model": model,
                 "input": inputs,
-                # Explicit "float" for portability. (OpenRouter may support base64 too.)
-                "encoding_format": "float",
-            },
+                # base64 float32 is ~4x smaller than JSON floats and decodes without
+                # per-float parsing; "float" remains available for strict providers.
+                "encoding_format": self.settings.embedding_encoding_format,
+            }
         )
+        return await self._post_embeddings(body)
+
+    @_retry_transient
+    async def _post_embeddings(self, body: bytes) -> np.ndarray:
+        resp = await _post(self._client, "/embeddings", body)
+        typed = _decode_typed(_EMBEDDINGS_DECODER, resp)
+        if typed is not None and typed.data:
+            return _stack_embeddings([item.embedding for item in typed.data])
+
         payload: Any
         try:
-            payload = resp.json()
+            payload = _response_json(resp)
         except Exception:  # noqa: BLE001
             payload = None
 
-        if resp.status_code != 200:
-            msg = _extract_error_message(payload) or f"HTTP {resp.status_code} from embeddings"
-            raise OpenRouterError(msg, status_code=resp.status_code)
-
-        # OpenRouter may return status 200 with an error payload in rare cases.
-        embedded_error = _extract_error_message(payload)
-        if embedded_error:
-            raise OpenRouterError(embedded_error, status_code=resp.status_code)
+        _raise_for_error(resp, payload, what="embeddings")
 
         data = payload.get("data") if isinstance(payload, dict) else None
         if not isinstance(data, list) or not data:
             raise OpenRouterError("Embeddings response missing data[]")
 
-        vectors: list[list[float]] = []
+        values: list[Any] = []
         for item in data:
             if not isinstance(item, dict) or "embedding" not in item:
                 raise OpenRouterError("Embeddings response item missing embedding")
-            vectors.append(item["embedding"])
+            values.append(item["embedding"])
 
-        arr = np.asarray(vectors, dtype=np.float32)
-        return arr
+        return _stack_embeddings(values)
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential_jitter(initial=0.5, max=4.0))
     async def chat_completion(
         self,
         *,
@@ -110,30 +535,49 @@ class OpenRouterClient:
         messages: list[ChatMessage],
         temperature: float = 0.0,
         max_tokens: int | None = None,
+        response_format: dict[str, Any] | None = None,
+        reasoning: dict[str, Any] | None = None,
     ) -> str:
         body: dict[str, Any] = {
             "model": model,
-            "messages": [{"role": m.role, "content": m.content} for m in messages],
+            "messages": messages,
             "temperature": temperature,
             "stream": False,
         }
         if max_tokens is not None:
             body["max_tokens"] = max_tokens
+        if response_format is not None:
+            body["response_format"] = response_format
+        if reasoning is not None:
+            body["reasoning"] = reasoning
+
+        # Encoded once: the same bytes are the cache key and every retry's payload.
+        encoded = _encode_json(body)
+        cache_key = self._completion_cache.key(encoded) if temperature == 0.0 else None
+        if cache_key is not None:
+            cached = self._completion_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        content = await self._post_chat_completion(encoded)
+        if cache_key is not None:
+            self._completion_cache.set(cache_key, content)
+        return content
+
+    @_retry_transient
+    async def _post_chat_completion(self, body: bytes) -> str:
+        resp = await _post(self._client, "/chat/completions", body)
+        typed = _decode_typed(_CHAT_DECODER, resp)
+        if typed is not None and typed.choices:
+            return typed.choices[0].message.content.strip()
 
-        resp = await self._client.post("/chat/completions", json=body)
         payload: Any
         try:
-            payload = resp.json()
+            payload = _response_json(resp)
         except Exception:  # noqa: BLE001
             payload = None
 
-        if resp.status_code != 200:
-            msg = _extract_error_message(payload) or f"HTTP {resp.status_code} from chat"
-            raise OpenRouterError(msg, status_code=resp.status_code)
-
-        embedded_error = _extract_error_message(payload)
-        if embedded_error:
-            raise OpenRouterError(embedded_error, status_code=resp.status_code)
+        _raise_for_error(resp, payload, what="chat")
 
         choices = payload.get("choices") if isinstance(payload, dict) else None
         if not isinstance(choices, list) or not choices:
@@ -181,36 +625,30 @@ class OpenRouterClient:
             return None
 
         # Strip ```json fences if present.
-        raw = re.sub(r"^```(?:json)?\\s*", "", raw, flags=re.IGNORECASE)
-        raw = re.sub(r"\\s*```$", "", raw)
+        if raw.startswith("```"):
+            raw = raw[3:]
+            if raw[:4].lower() == "json":
+                raw = raw[4:]
+            raw = raw.lstrip()
+        if raw.endswith("```"):
+            raw = raw[:-3].rstrip()
 
         # Fast path: already valid JSON.
-        try:
-            json.loads(raw)
+        if _is_json(raw):
             return raw
-        except Exception:  # noqa: BLE001
-            pass
 
-        # Try to extract an object {...} or array [...] substring.
-        first_obj = raw.find("{")
-        last_obj = raw.rfind("}")
-        if first_obj != -1 and last_obj != -1 and last_obj > first_obj:
-            candidate = raw[first_obj : last_obj + 1].strip()
-            try:
-                json.loads(candidate)
-                return candidate
-            except Exception:  # noqa: BLE001
-                pass
-
-        first_arr = raw.find("[")
-        last_arr = raw.rfind("]")
-        if first_arr != -1 and last_arr != -1 and last_arr > first_arr:
-            candidate = raw[first_arr : last_arr + 1].strip()
-            try:
-                json.loads(candidate)
-                return candidate
-            except Exception:  # noqa: BLE001
-                pass
+        # Otherwise decode forward from each opening bracket (objects first, as
+        # callers expect one); raw_decode stops at the end of the value, so
+        # trailing commentary needs no rfind/retry.
+        for opener in "{[":
+            start = raw.find(opener)
+            while start != -1:
+                try:
+                    _, end = _JSON_DECODER.raw_decode(raw, start)
+                except ValueError:
+                    start = raw.find(opener, start + 1)
+                    continue
+                return raw[start:end]
 
         return None
 
@@ -260,21 +698,7 @@ class OpenRouterClient:
         except Exception:  # noqa: BLE001
             return []
 
-        variants = payload.get("variants") if isinstance(payload, dict) else None
-        if not isinstance(variants, list):
-            return []
-
-        out: list[str] = []
-        seen: set[str] = set()
-        for v in variants:
-            if not isinstance(v, str):
-                continue
-            s = " ".join(v.split()).strip()
-            if not s or s in seen:
-                continue
-            seen.add(s)
-            out.append(s)
-        return out
+        return _clean_variants(payload.get("variants") if isinstance(payload, dict) else None)
 
     async def generate_hyde_passage(
         self,
@@ -315,8 +739,69 @@ class OpenRouterClient:
             ],
             temperature=0.2,
         )
-        cleaned = "\n".join([ln.rstrip() for ln in (passage or "").strip().splitlines()]).strip()
-        return cleaned
+        return _clean_passage(passage or "")
+
+    async def generate_retrieval_aids(
+        self,
+        *,
+        query: str,
+        doc_language: str,
+        n_variants: int = 6,
+        max_words: int = 140,
+    ) -> RetrievalAids:
+        """
+        Query variants and a HyDE passage from one JSON chat call, instead of
+        `generate_query_variants` + `generate_hyde_passage` (one request, one
+        system preamble). Fields that fail to parse come back empty.
+        """
+        n_variants = max(0, min(int(n_variants), 12))
+        max_words = max(40, min(int(max_words), 300))
+        base = (query or "").strip()
+        if not base:
+            return RetrievalAids(variants=[], hyde="")
+
+        system = (
+            "You prepare search inputs for a document QA retrieval system.\n"
+            "Produce two things for the user's query:\n"
+            "1. variants: alternative queries that help retrieve passages from the SAME document.\n"
+            "   - Preserve the user's intent exactly.\n"
+            "   - Prefer variants that cover: keyword-style, natural language, and paraphrases.\n"
+            "2. hyde: a hypothetical passage that could appear in the document, used ONLY to retrieve "
+            "relevant excerpts.\n"
+            "   - Do NOT claim you saw the document.\n"
+            "   - Focus on wording that a document might contain.\n"
+            "Rules for both:\n"
+            "- Write in the document language.\n"
+            "- Do NOT add new named entities, proper nouns, facts, dates, numbers, or constraints.\n"
+            "Output format:\n"
+            'Return ONLY valid JSON: {"variants": ["...","..."], "hyde": "..."}\n'
+        )
+        user = (
+            f"Document language: {doc_language}\n"
+            f"User query (already aligned to document language when possible): {base}\n\n"
+            f"Generate {n_variants} short variants and one hyde passage (<= {max_words} words)."
+        )
+        raw = await self.chat_completion(
+            model=self.settings.chat_model_complex,
+            messages=[ChatMessage(role="system", content=system), ChatMessage(role="user", content=user)],
+            temperature=0.0,
+            response_format={"type": "json_object"},
+        )
+
+        extracted = self._extract_json_text(raw)
+        payload: Any = None
+        if extracted is not None:
+            try:
+                payload = json.loads(extracted)
+            except Exception:  # noqa: BLE001
+                payload = None
+        if not isinstance(payload, dict):
+            return RetrievalAids(variants=[], hyde="")
+
+        return RetrievalAids(
+            variants=_clean_variants(payload.get("variants"))[:n_variants],
+            hyde=_clean_passage(payload.get("hyde")),
+        )
 
     async def rerank_passages_yesno(
         self,
@@ -326,10 +811,16 @@ class OpenRouterClient:
         doc_language: str,
         model: str | None = None,
         max_chars: int = 900,
+        max_tokens_per_passage: int = 0,
+        max_output_tokens: int = 0,
     ) -> list[str]:
         """
         LLM-based reranker (fast to implement, not perfectly stable).
         Returns passage IDs ordered best -> worst.
+
+        Passages are cut to `max_tokens_per_passage` estimated tokens when it is
+        set, otherwise to `max_chars` characters. `max_output_tokens` > 0 caps
+        the reply; ids completed before a cut-off are still used.
         """
         base_query = (query or "").strip()
         if not base_query or not passages:
@@ -339,15 +830,11 @@ class OpenRouterClient:
         effective_model = (model or "").strip() or self.settings.chat_model_complex
 
         # Build a compact candidate list.
-        lines: list[str] = []
-        for pid, text in passages:
-            pid_s = (pid or "").strip()
-            if not pid_s:
-                continue
-            snippet = (text or "").strip()
-            if len(snippet) > max_chars:
-                snippet = snippet[: max_chars - 1].rstrip() + "…"
-            lines.append(f"- id: {pid_s}\n  passage: {snippet}")
+        candidates = "\n\n".join(
+            _rerank_candidate(pid_s, text, max_chars, max_tokens_per_passage)
+            for pid, text in passages
+            if (pid_s := (pid or "").strip())
+        )
 
         system = (
             "You are a reranking engine for document question answering.\n"
@@ -365,26 +852,40 @@ class OpenRouterClient:
             f"Document language: {doc_language}\n"
             f"Question: {base_query}\n\n"
             "Candidates:\n"
-            + "\n\n".join(lines)
+            + candidates
         )
+        # Prefill the JSON envelope so the model only emits the id array. Reasoning
+        # is disabled: thinking models would otherwise spend the output budget
+        # (and latency) before the first id.
         raw = await self.chat_completion(
             model=effective_model,
-            messages=[ChatMessage(role="system", content=system), ChatMessage(role="user", content=user)],
+            messages=[
+                ChatMessage(role="system", content=system),
+                ChatMessage(role="user", content=user),
+                ChatMessage(role="assistant", content=_RANKED_IDS_PREFILL),
+            ],
             temperature=0.0,
+            max_tokens=max_output_tokens if max_output_tokens > 0 else None,
+            reasoning={"enabled": False},
         )
 
+        # Providers that honor the prefill return only the continuation; others
+        # answer with the whole object.
+        raw = (raw or "").strip()
+        if not raw.startswith(("{", "```")):
+            raw = _RANKED_IDS_PREFILL + raw
+        ranked_ids: Any = None
         extracted = self._extract_json_text(raw)
-        if extracted is None:
-            return [pid for pid, _ in passages]
-
-        try:
-            payload = json.loads(extracted)
-        except Exception:  # noqa: BLE001
-            return [pid for pid, _ in passages]
-
-        ranked_ids = payload.get("ranked_ids") if isinstance(payload, dict) else None
+        if extracted is not None:
+            try:
+                payload = json.loads(extracted)
+            except Exception:  # noqa: BLE001
+                payload = None
+            ranked_ids = payload.get("ranked_ids") if isinstance(payload, dict) else None
         if not isinstance(ranked_ids, list):
-            return [pid for pid, _ in passages]
+            # Unparseable, typically a reply cut off mid-array: keep the ids it
+            # did complete (possibly none, which falls back to the input order).
+            ranked_ids = _partial_ranked_ids(raw)
 
         wanted = [(pid or "").strip() for pid, _ in passages if (pid or "").strip()]
         wanted_set = set(wanted)
@@ -1,5 +1,10 @@
 from __future__ import annotations
 
+# typing.TYPE_CHECKING without importing typing: this module has no runtime imports.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
 
 def repack_chunks_reverse(chunks: list) -> list:
     """
@@ -11,6 +16,25 @@ def repack_chunks_reverse(chunks: list) -> list:
     return chunks[::-1]
 
 
+def _keep_order(chunks: list) -> list:
+    return chunks
+
+
+# Normalized strategy name -> re-packer; "forward" has a few "off" aliases.
+_STRATEGIES: dict[str, Callable[[list], list]] = {
+    "reverse": repack_chunks_reverse,
+    **dict.fromkeys(("forward", "none", "off", "disabled", "disable"), _keep_order),
+}
+
+
+def resolve_repack(strategy: str) -> Callable[[list], list] | None:
+    """
+    Re-packer for a strategy name (case- and whitespace-insensitive), or None
+    if the name is unknown so callers can report it before falling back.
+    """
+    return _STRATEGIES.get((strategy or "").strip().lower())
+
+
 def repack_chunks(chunks: list, *, strategy: str) -> list:
     """
     Re-pack chunks according to strategy.
@@ -19,11 +43,8 @@ def repack_chunks(chunks: list, *, strategy: str) -> list:
     - "reverse": reverse chunk order (most relevant near end of context)
     - "forward": keep current order (no re-packing)
     """
-    normalized = (strategy or "").strip().lower()
-    if normalized in {"forward", "none", "off", "disabled", "disable"}:
-        return chunks
     # Default behavior is "reverse" (including empty/unknown values).
-    return repack_chunks_reverse(chunks)
+    return (resolve_repack(strategy) or repack_chunks_reverse)(chunks)
 
 
 def apply_repack_strategy(
@@ -31,14 +31,16 @@ def __getattr__(name: str) -> Any:
         )
         from .hybrid_retriever import HybridRetriever, ScoredChunk
 
-        return {"HybridRetriever": HybridRetriever, "ScoredChunk": ScoredChunk}[name]
+        # Cache on the module so later lookups skip this hook (and the warning).
+        globals().update(HybridRetriever=HybridRetriever, ScoredChunk=ScoredChunk)
+        return globals()[name]
 
     raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def __dir__() -> list[str]:
     # Keep introspection usable while remaining import-light.
-    return sorted(list(globals().keys()) + ["HybridRetriever", "ScoredChunk"])
+    return sorted(set(globals()) | {"HybridRetriever", "ScoredChunk"})
 
 
 __all__: list[str] = []
@@ -53,21 +53,25 @@ class RetrievalMetrics:
         self.steps.append(step_data)
 
     def to_record(self) -> EvaluationRecord:
+        # Every field below is built by the pipeline itself, so construct the
+        # models without re-validating each step and chunk on every chat turn.
         timestamp = self.start_time.isoformat()
         pyd_steps = [
-            RetrievalStep(**step) for step in self.steps
+            RetrievalStep.model_construct(**step) for step in self.steps
         ]
         # Extract final_context from the last "final_context" step
         final_chunks = []
         for step in reversed(self.steps):
             if step.get("name") == "final_context":
-                raw_chunks = step.get("data", {}).get("chunks", [])
+                raw_chunks = (step.get("data") or {}).get("chunks", [])
                 final_chunks = [
-                    ChunkPreview(chunk_id=c["chunk_id"], rank=c["rank"], score=c["score"], preview=c["preview"])
+                    ChunkPreview.model_construct(
+                        chunk_id=c["chunk_id"], rank=c["rank"], score=c["score"], preview=c["preview"]
+                    )
                     for c in raw_chunks if isinstance(c, dict) and all(k in c for k in ["chunk_id", "rank", "score", "preview"])
                 ]
                 break
-        return EvaluationRecord(
+        return EvaluationRecord.model_construct(
             session_id=self.session_id,
             user_query=self.user_query,
             mode=self.mode,
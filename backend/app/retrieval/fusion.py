@@ -1,18 +1,24 @@
 from __future__ import annotations
 
-from collections import defaultdict
-
 
 def dedupe_keep_order(items: list[str]) -> list[str]:
-    seen: set[str] = set()
-    out: list[str] = []
-    for raw in items:
-        s = (raw or "").strip()
-        if not s or s in seen:
-            continue
-        seen.add(s)
-        out.append(s)
-    return out
+    # dict keys keep insertion order, so fromkeys dedupes in one C-level pass.
+    stripped = ((raw or "").strip() for raw in items)
+    return list(dict.fromkeys(s for s in stripped if s))
+
+
+def rankings_agree_on_top(rankings: list[list[str]], k: int) -> bool:
+    """
+    True when there are at least two rankings and each one's top `k` ids are
+    the same set (order may differ), i.e. every query already agrees on
+    which chunks are best.
+    """
+    if k < 1 or len(rankings) < 2:
+        return False
+    top = set(rankings[0][:k])
+    if len(top) < k:
+        return False
+    return all(set(r[:k]) == top for r in rankings[1:])
 
 
 def rrf_fuse(
@@ -32,19 +38,24 @@ def rrf_fuse(
     if not rankings:
         return []
 
-    scores: dict[str, float] = defaultdict(float)
+    scores: dict[str, float] = {}
     first_rank: dict[str, int] = {}
 
+    # Count from k + 1 so each term is a single division; one membership test
+    # per id covers both the score update and the first-seen rank.
     for r in rankings:
-        for idx, doc_id in enumerate(r, start=1):
+        for denom, doc_id in enumerate(r, start=k + 1):
             if not doc_id:
                 continue
-            scores[doc_id] += 1.0 / (k + idx)
-            if doc_id not in first_rank:
-                first_rank[doc_id] = idx
-
-    ordered = sorted(scores.items(), key=lambda kv: (-kv[1], first_rank.get(kv[0], 10**9), kv[0]))
-    fused = [doc_id for doc_id, _ in ordered]
+            if doc_id in scores:
+                scores[doc_id] += 1.0 / denom
+            else:
+                scores[doc_id] = 1.0 / denom
+                first_rank[doc_id] = denom - k
+
+    # Sort plain tuples: no key callback, and every id has a first_rank.
+    ordered = sorted([(-score, first_rank[doc_id], doc_id) for doc_id, score in scores.items()])
+    fused = [doc_id for _, _, doc_id in ordered]
     if max_results is not None:
         return fused[: max(0, int(max_results))]
     return fused
@@ -1,13 +1,15 @@
 from __future__ import annotations
 
 import re
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Literal, Optional
+from typing import Any, Literal, Optional
 from .evaluation import RetrievalMetrics
 
 import numpy as np
 
 from ..models.chunk import ChunkModel
+from .bm25 import BM25Index
 
 
 try:
@@ -34,26 +36,83 @@ except Exception as e:  # noqa: BLE001
 else:
     _SPACY_IMPORT_ERROR = None
 
-from rank_bm25 import BM25Okapi  # noqa: E402
-
 
 Language = Literal["en", "zh"]
 
+# Recent BM25 queries kept per retriever; chat follow-ups and fusion variants
+# often repeat the same text or the same bag of tokens.
+_BM25_QUERY_CACHE_MAX = 128
+# Texts per nlp.pipe batch when tokenizing an English corpus.
+_SPACY_PIPE_BATCH_SIZE = 64
+
+# Every byte except ASCII A-Z / a-z, for bytes.translate(None, delete=...).
+_NON_LATIN_LETTER_BYTES = bytes(i for i in range(256) if not (65 <= i <= 90 or 97 <= i <= 122))
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+
+# HNSW graph degree and build/search beam widths (faiss defaults are M=32, ef=40/16).
+_HNSW_M = 32
+_HNSW_EF_CONSTRUCTION = 200
+_HNSW_EF_SEARCH_MIN = 64
+
 
 def detect_dominant_language(text: str) -> Language:
     # Very small heuristic: if there is meaningful CJK presence, treat as zh.
-    cjk = len(re.findall(r"[\u4e00-\u9fff]", text))
-    latin = len(re.findall(r"[A-Za-z]", text))
+    # Counted in C (bytes.translate, one vectorized compare) rather than
+    # building regex match lists just to take their length.
+    latin = len(text.encode("ascii", "ignore").translate(None, _NON_LATIN_LETTER_BYTES))
+    cjk = 0
+    if not text.isascii():
+        codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        cjk = int(np.count_nonzero((codes >= 0x4E00) & (codes <= 0x9FFF)))
     return "zh" if cjk > max(10, latin) else "en"
 
 
+def detect_corpus_language(chunks: list[ChunkModel]) -> Language:
+    """The language build_keyword_index() tokenizes `chunks` in: that of the first 8."""
+    return detect_dominant_language(" ".join(c.content for c in chunks[:8]))
+
+
+def set_faiss_threads(n: int) -> None:
+    """
+    Cap faiss' OpenMP thread pool; n <= 0 keeps faiss' default (one per core).
+    """
+    if faiss is not None and n > 0:
+        faiss.omp_set_num_threads(n)
+
+
+def query_matches_language(query: str, language: str) -> bool:
+    """
+    Conservative check for skipping query translation: True only when the query
+    is plainly in `language` already (CJK-dominant for zh, pure ASCII for en).
+    Accented or mixed-script queries still go through translation.
+    """
+    if language == "zh":
+        cjk = len(_CJK_RE.findall(query))
+        return cjk > 0 and cjk >= len(_LATIN_RE.findall(query))
+    return query.isascii()
+
+
+def _spacy_tokens(doc: Any) -> list[str]:
+    # lower_ is the lexeme's cached text.lower(), so no per-token string work.
+    return [tt for t in doc if not (t.is_space or t.is_punct) and (tt := t.lower_.strip())]
+
+
+def _lru_put(cache: OrderedDict[Any, Any], key: Any, value: Any) -> None:
+    cache[key] = value
+    if len(cache) > _BM25_QUERY_CACHE_MAX:
+        cache.popitem(last=False)
+
+
 def _l2_normalize(vectors: np.ndarray, *, eps: float = 1e-12) -> np.ndarray:
-    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
-    norms = np.maximum(norms, eps)
-    return vectors / norms
+    # Row dot products via einsum and one multiply by the reciprocal norm:
+    # fewer passes and temporaries than linalg.norm(keepdims) + divide.
+    sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+    inv_norms = 1.0 / np.sqrt(np.maximum(sq_norms, eps * eps))
+    return vectors * inv_norms[:, None]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ScoredChunk:
     chunk: ChunkModel
     final_score: float
@@ -64,7 +123,12 @@ class ScoredChunk:
 class HybridRetriever:
     """
     In-memory hybrid retriever:
-    - Vector search via FAISS IndexFlatIP with L2-normalized embeddings (cosine similarity)
+    - Vector search via FAISS IndexFlatIP with L2-normalized embeddings (cosine similarity);
+      corpora of at least `ivf_min_chunks` chunks use an ANN index for candidate generation:
+      IndexIVFPQ (ann_index="ivfpq", candidates re-scored exactly against the stored
+      embeddings) or IndexHNSWFlat (ann_index="hnsw", exact scores, no training)
+    - vector_quantization="int8" stores embeddings only as 8-bit scalar-quantized
+      codes (IndexScalarQuantizer), ~4x less RAM than fp32
     - Keyword search via BM25
     - Per-query MinMax normalization for BM25 scores (top-N for that query)
     - Late fusion:
@@ -78,21 +142,38 @@ class HybridRetriever:
         vector_weight: float = 0.8,
         bm25_weight: float = 0.2,
         candidate_k: int = 50,
+        ivf_min_chunks: int = 4096,
+        vector_quantization: str = "none",
+        ann_index: str = "ivfpq",
     ) -> None:
         if abs((vector_weight + bm25_weight) - 1.0) > 1e-6:
             raise ValueError("vector_weight + bm25_weight must sum to 1.0")
         if candidate_k < 1:
             raise ValueError("candidate_k must be >= 1")
+        if vector_quantization not in ("none", "int8"):
+            raise ValueError("vector_quantization must be 'none' or 'int8'")
+        if ann_index not in ("ivfpq", "hnsw"):
+            raise ValueError("ann_index must be 'ivfpq' or 'hnsw'")
 
         self.embedding_dim = embedding_dim
         self.vector_weight = vector_weight
         self.bm25_weight = bm25_weight
         self.candidate_k = candidate_k
+        self.ivf_min_chunks = ivf_min_chunks
+        self.vector_quantization = vector_quantization
+        self.ann_index = ann_index
 
         self._chunks: list[ChunkModel] = []
         self._doc_embeddings: np.ndarray | None = None
+        # search_dim -> contiguous, re-normalized prefix of the doc vectors (MRL).
+        self._doc_vectors_mrl: dict[int, np.ndarray] = {}
         self._faiss_index = None
-        self._bm25: BM25Okapi | None = None
+        self._index_description = ""
+        self._bm25: BM25Index | None = None
+        # query text -> tokens, and sorted tokens -> read-only BM25 scores.
+        # Both depend on the corpus, so build_keyword_index() clears them.
+        self._query_tokens_cache: OrderedDict[str, list[str]] = OrderedDict()
+        self._bm25_scores_cache: OrderedDict[tuple[str, ...], np.ndarray] = OrderedDict()
         self._doc_language: Language | None = None
 
         self._spacy_nlp = None
@@ -101,6 +182,10 @@ class HybridRetriever:
     def doc_language(self) -> Language | None:
         return self._doc_language
 
+    @property
+    def index_description(self) -> str:
+        return self._index_description
+
     def _ensure_spacy(self) -> None:
         if self._spacy_nlp is not None:
             return
@@ -126,16 +211,20 @@ class HybridRetriever:
 
         self._ensure_spacy()
         assert self._spacy_nlp is not None
-        doc = self._spacy_nlp(text)
-        tokens: list[str] = []
-        for t in doc:
-            if t.is_space or t.is_punct:
-                continue
-            tt = t.text.lower().strip()
-            if not tt:
-                continue
-            tokens.append(tt)
-        return tokens
+        return _spacy_tokens(self._spacy_nlp(text))
+
+    def _tokenize_many(self, texts: list[str], *, language: Language) -> list[list[str]]:
+        """
+        `_tokenize` for a whole corpus. English texts stream through
+        `nlp.pipe` in batches instead of one pipeline call each.
+        """
+        if language == "zh":
+            return [self._tokenize(t, language=language) for t in texts]
+
+        self._ensure_spacy()
+        assert self._spacy_nlp is not None
+        docs = self._spacy_nlp.pipe((t.strip() for t in texts), batch_size=_SPACY_PIPE_BATCH_SIZE)
+        return [_spacy_tokens(doc) for doc in docs]
 
     def build(
         self,
@@ -143,49 +232,182 @@ class HybridRetriever:
         chunks: list[ChunkModel],
         embeddings: np.ndarray,
         doc_language: Language | None = None,
-    ) -> None:
+        precomputed_tokens: list[list[str] | None] | None = None,
+    ) -> list[list[str]]:
         """
         Build FAISS + BM25 indexes in memory for the provided chunks.
 
         embeddings: shape (len(chunks), embedding_dim)
+        Returns the tokenized corpus (see build_keyword_index).
+
+        Vectors are normalized into C-contiguous float32 arrays (doc and query
+        side alike), the layout faiss scans without copying; its OpenMP pool
+        is sized process-wide by set_faiss_threads().
         """
 
         if faiss is None:
             raise RuntimeError(
                 f"faiss-cpu is required for vector search. Import error: {_FAISS_IMPORT_ERROR}"
             )
+        tokens = self.build_keyword_index(
+            chunks=chunks, doc_language=doc_language, precomputed_tokens=precomputed_tokens
+        )
+        self.build_vector_index(embeddings=embeddings)
+        return tokens
+
+    def build_keyword_index(
+        self,
+        *,
+        chunks: list[ChunkModel],
+        doc_language: Language | None = None,
+        precomputed_tokens: list[list[str] | None] | None = None,
+    ) -> list[list[str]]:
+        """
+        Build the BM25 half only. It needs chunk text but no embeddings, so
+        ingestion can run it while embedding requests are still in flight.
+
+        precomputed_tokens, aligned with `chunks`, supplies tokens from an
+        earlier build of the same chunks; only `None` entries are tokenized.
+        Returns the tokenized corpus so callers can keep it for the next build.
+        """
         if len(chunks) == 0:
             raise ValueError("chunks must be non-empty")
 
+        doc_language = doc_language or detect_corpus_language(chunks)
+        if precomputed_tokens is not None and len(precomputed_tokens) != len(chunks):
+            raise ValueError("precomputed_tokens must align with chunks")
+        known = precomputed_tokens or [None] * len(chunks)
+        todo = [c.content for c, tokens in zip(chunks, known) if tokens is None]
+        fresh = iter(self._tokenize_many(todo, language=doc_language))
+        tokenized_corpus = [tokens if tokens is not None else next(fresh) for tokens in known]
+        bm25 = BM25Index(tokenized_corpus)
+
+        self._chunks = chunks
+        self._doc_language = doc_language
+        self._bm25 = bm25
+        self._query_tokens_cache.clear()
+        self._bm25_scores_cache.clear()
+        return tokenized_corpus
+
+    def build_vector_index(self, *, embeddings: np.ndarray) -> None:
+        """
+        Build the FAISS half for the chunks given to build_keyword_index().
+
+        embeddings: shape (len(chunks), embedding_dim)
+        """
+        if faiss is None:
+            raise RuntimeError(
+                f"faiss-cpu is required for vector search. Import error: {_FAISS_IMPORT_ERROR}"
+            )
+        if self._bm25 is None:
+            raise RuntimeError("build_keyword_index() must run before build_vector_index().")
+
         embeddings = np.asarray(embeddings, dtype=np.float32)
         if embeddings.ndim != 2:
             raise ValueError("embeddings must be a 2D array")
-        if embeddings.shape[0] != len(chunks):
+        if embeddings.shape[0] != len(self._chunks):
             raise ValueError("embeddings row count must match number of chunks")
         if embeddings.shape[1] != self.embedding_dim:
             raise ValueError(
                 f"embeddings dim mismatch: expected {self.embedding_dim}, got {embeddings.shape[1]}"
             )
 
-        self._chunks = chunks
-        self._doc_language = doc_language or detect_dominant_language(
-            " ".join(c.content for c in chunks[: min(8, len(chunks))])
-        )
-
         # Vector index (cosine via normalized inner product).
         doc_embeddings = _l2_normalize(embeddings)
-        index = faiss.IndexFlatIP(self.embedding_dim)
+        index, description = self._build_vector_index(doc_embeddings)
+
+        # Quantized indexes hold the only copy of the vectors; drop the fp32 matrix.
+        self._doc_embeddings = None if self.vector_quantization == "int8" else doc_embeddings
+        self._faiss_index = index
+        self._index_description = description
+        self._doc_vectors_mrl.clear()
+
+    def _build_vector_index(self, doc_embeddings: np.ndarray) -> tuple[Any, str]:
+        n, d = doc_embeddings.shape
+        if self.vector_quantization == "int8":
+            index = faiss.IndexScalarQuantizer(
+                d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+            index.train(doc_embeddings)  # type: ignore
+            index.add(doc_embeddings)  # type: ignore
+            return index, f"IndexScalarQuantizer(n={n}, int8)"
+
+        # 8-bit PQ trains 256 centroids per sub-quantizer, so it needs >= 256 vectors.
+        if self.ivf_min_chunks <= 0 or n < max(self.ivf_min_chunks, 256):
+            index = faiss.IndexFlatIP(d)
+            index.add(doc_embeddings)  # type: ignore
+            return index, f"IndexFlatIP(n={n})"
+
+        if self.ann_index == "hnsw":
+            index = faiss.IndexHNSWFlat(d, _HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = _HNSW_EF_CONSTRUCTION
+            index.add(doc_embeddings)  # type: ignore
+            return index, f"IndexHNSWFlat(n={n}, M={_HNSW_M})"
+
+        # Faiss guideline: nlist ~ 4*sqrt(N), with >= 39 training points per list.
+        # The PQ sub-quantizer count must divide d.
+        nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+        m = max(1, min(64, d // 4))
+        while d % m:
+            m -= 1
+        quantizer = faiss.IndexFlatIP(d)
+        index = faiss.IndexIVFPQ(quantizer, d, nlist, m, 8, faiss.METRIC_INNER_PRODUCT)
+        index.train(doc_embeddings)  # type: ignore
         index.add(doc_embeddings)  # type: ignore
+        index.nprobe = max(8, nlist // 16)
+        return index, f"IndexIVFPQ(n={n}, nlist={nlist}, m={m}, nprobe={index.nprobe})"
 
-        # BM25 index.
-        tokenized_corpus = [
-            self._tokenize(c.content, language=self._doc_language) for c in chunks
-        ]
-        bm25 = BM25Okapi(tokenized_corpus)
+    def _doc_vectors(self, ids: list[int] | None = None) -> np.ndarray:
+        """
+        Normalized document vectors (all rows, or `ids`), decoded from the
+        int8 codes when the fp32 matrix is not kept.
+        """
+        assert self._faiss_index is not None
+        if self._doc_embeddings is not None:
+            return self._doc_embeddings if ids is None else self._doc_embeddings[ids]
+        if ids is None:
+            return self._faiss_index.reconstruct_n(0, self._faiss_index.ntotal)
+        return self._faiss_index.reconstruct_batch(np.asarray(ids, dtype=np.int64))
+
+    def _mrl_doc_vectors(self, search_dim: int) -> np.ndarray:
+        """
+        Document vectors truncated to `search_dim` and re-normalized, built on
+        first use per dim so MRL searches skip the slice + normalize pass.
+        """
+        cached = self._doc_vectors_mrl.get(search_dim)
+        if cached is None:
+            cached = np.ascontiguousarray(_l2_normalize(self._doc_vectors()[:, :search_dim]))
+            self._doc_vectors_mrl[search_dim] = cached
+        return cached
+
+    def _vector_candidates(
+        self, query_embs: np.ndarray, k: int
+    ) -> list[tuple[list[int], np.ndarray]]:
+        """
+        FAISS top-k per query row: (doc ids, cosine scores).
 
-        self._doc_embeddings = doc_embeddings
-        self._faiss_index = index
-        self._bm25 = bm25
+        IVFPQ scores come from compressed codes, so candidates are re-scored
+        exactly; this keeps them comparable with the exact scores computed for
+        BM25-only candidates in _fuse().
+        """
+        assert self._faiss_index is not None
+        query_embs = np.ascontiguousarray(query_embs, dtype=np.float32)
+        if isinstance(self._faiss_index, faiss.IndexHNSWFlat):
+            # The beam must be at least k wide to return k results; 2x keeps recall high.
+            self._faiss_index.hnsw.efSearch = max(_HNSW_EF_SEARCH_MIN, 2 * k)
+        scores_raw, ids = self._faiss_index.search(query_embs, k)
+        rescore = isinstance(self._faiss_index, faiss.IndexIVFPQ)
+        out: list[tuple[list[int], np.ndarray]] = []
+        for row in range(query_embs.shape[0]):
+            ids_list = [int(i) for i in ids[row] if int(i) >= 0]
+            if rescore:
+                scores = self._doc_vectors(ids_list) @ query_embs[row]
+                order = np.argsort(-scores, kind="stable")
+                ids_list = [ids_list[i] for i in order]
+                out.append((ids_list, scores[order]))
+            else:
+                out.append((ids_list, scores_raw[row][: len(ids_list)]))
+        return out
 
     def search(
         self,
@@ -206,7 +428,7 @@ class HybridRetriever:
         """
         if top_k < 1:
             raise ValueError("top_k must be >= 1")
-        if self._faiss_index is None or self._bm25 is None or self._doc_embeddings is None:
+        if self._faiss_index is None or self._bm25 is None:
             raise RuntimeError("HybridRetriever is not built. Call build() first.")
         if self._doc_language is None:
             raise RuntimeError("doc_language is not set (unexpected).")
@@ -221,119 +443,242 @@ class HybridRetriever:
         use_mrl = search_dim is not None and 0 < search_dim < self.embedding_dim
         if use_mrl:
             query_emb_search = _l2_normalize(query_embedding[:, :search_dim])
-            doc_emb_search = _l2_normalize(self._doc_embeddings[:, :search_dim])
         else:
             query_emb_search = _l2_normalize(query_embedding)
-            doc_emb_search = self._doc_embeddings  # already normalized
 
         # Phase A: Vector candidates (direct cosine computation for MRL, or FAISS for full dim)
-        n_docs = len(self._chunks)
-        vec_fetch_k = min(max(top_k, self.candidate_k), n_docs)
+        vec_fetch_k = min(max(top_k, self.candidate_k), len(self._chunks))
         
         # Pre-compute variable to hold all MRL scores if available
         all_scores_mrl = None
 
         if use_mrl:
             # Direct computation for MRL (no pre-built index for truncated dims)
-            scores = (query_emb_search @ doc_emb_search.T).flatten()
-            all_scores_mrl = scores
-            vec_ids_list = np.argsort(-scores)[:vec_fetch_k].tolist()
-            vec_scores_flat = scores[vec_ids_list]
+            assert search_dim is not None
+            candidates, all_scores = self._mrl_candidates(query_emb_search, search_dim, vec_fetch_k)
+            (vec_ids_list, vec_scores_flat), all_scores_mrl = candidates[0], all_scores[0]
         else:
-            vec_scores_raw, vec_ids = self._faiss_index.search(query_emb_search, vec_fetch_k)
-            vec_ids_list = [int(i) for i in vec_ids[0] if int(i) >= 0]
-            vec_scores_flat = vec_scores_raw[0][: len(vec_ids_list)]
+            vec_ids_list, vec_scores_flat = self._vector_candidates(query_emb_search, vec_fetch_k)[0]
+
+        return self._fuse(
+            bm25_query=(expanded_query or query),
+            query_emb_search=query_emb_search,
+            vec_ids_list=vec_ids_list,
+            vec_scores_flat=vec_scores_flat,
+            all_scores_mrl=all_scores_mrl,
+            top_k=top_k,
+            metrics=metrics,
+        )
 
-        # Convert cosine [-1, 1] -> [0, 1] (spec expects 0..1).
-        vec_scores_map: dict[int, float] = {}
-        for idx, score in zip(vec_ids_list, vec_scores_flat):
-            cos = float(score)
-            vec_scores_map[idx] = float(np.clip((cos + 1.0) * 0.5, 0.0, 1.0))
+    def search_many(
+        self,
+        *,
+        queries: list[str],
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        search_dim: int | None = None,
+        metrics: Optional["RetrievalMetrics"] = None,
+    ) -> list[list[ScoredChunk]]:
+        """
+        Search for several queries at once.
+
+        Equivalent to calling search(query=q, query_embedding=e, expanded_query=q,
+        search_dim=search_dim) per row, but the vector phase runs once over the
+        stacked (Q, D) query matrix: a single FAISS search, or for MRL a single
+        (Q, N) matmul. queries[i] is the BM25 text for query_embeddings[i].
+        """
+        if top_k < 1:
+            raise ValueError("top_k must be >= 1")
+        if self._faiss_index is None or self._bm25 is None:
+            raise RuntimeError("HybridRetriever is not built. Call build() first.")
+
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        if query_embeddings.ndim == 1:
+            query_embeddings = query_embeddings.reshape(1, -1)
+        if query_embeddings.shape[0] != len(queries):
+            raise ValueError("query_embeddings row count must match number of queries")
+        if query_embeddings.shape[1] != self.embedding_dim:
+            raise ValueError(
+                f"query_embedding dim mismatch: expected {self.embedding_dim}, got {query_embeddings.shape[1]}"
+            )
+        if not queries:
+            return []
+
+        vec_fetch_k = min(max(top_k, self.candidate_k), len(self._chunks))
+        all_scores_mrl: np.ndarray | None = None
+        if search_dim is not None and 0 < search_dim < self.embedding_dim:
+            query_embs_search = _l2_normalize(query_embeddings[:, :search_dim])
+            candidates, all_scores_mrl = self._mrl_candidates(
+                query_embs_search, search_dim, vec_fetch_k
+            )
+        else:
+            query_embs_search = _l2_normalize(query_embeddings)
+            candidates = self._vector_candidates(query_embs_search, vec_fetch_k)
+
+        results: list[list[ScoredChunk]] = []
+        for row, (query, (vec_ids_list, vec_scores_flat)) in enumerate(zip(queries, candidates)):
+            results.append(
+                self._fuse(
+                    bm25_query=query,
+                    query_emb_search=query_embs_search[row : row + 1],
+                    vec_ids_list=vec_ids_list,
+                    vec_scores_flat=vec_scores_flat,
+                    all_scores_mrl=None if all_scores_mrl is None else all_scores_mrl[row],
+                    top_k=top_k,
+                    metrics=metrics,
+                )
+            )
+        return results
+
+    def _mrl_candidates(
+        self, queries_search: np.ndarray, search_dim: int, k: int
+    ) -> tuple[list[tuple[list[int], np.ndarray]], np.ndarray]:
+        """
+        Exact top-k by cosine over the first `search_dim` dims, one entry per row
+        of the normalized (Q, search_dim) query matrix, best first. All rows are
+        scored with one (Q, N) matmul and selected with one row-wise
+        argpartition; the full score matrix is returned too, since _fuse reads
+        it for candidates outside the vector top-k.
+        """
+        scores = queries_search @ self._mrl_doc_vectors(search_dim).T
+        if k == scores.shape[1]:
+            top_idx = np.argsort(-scores, axis=1)
+        else:
+            top_idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            order = np.argsort(-np.take_along_axis(scores, top_idx, axis=1), axis=1)
+            top_idx = np.take_along_axis(top_idx, order, axis=1)
+        top_scores = np.take_along_axis(scores, top_idx, axis=1)
+        return [(ids.tolist(), row) for ids, row in zip(top_idx, top_scores)], scores
+
+    def _bm25_scores(self, query: str) -> np.ndarray:
+        """
+        BM25 scores for `query`, memoized on the text and on its token
+        multiset (BM25 ignores token order but counts repeats).
+        """
+        assert self._bm25 is not None
+        assert self._doc_language is not None
+
+        tokens = self._query_tokens_cache.get(query)
+        if tokens is None:
+            tokens = self._tokenize(query, language=self._doc_language)
+            _lru_put(self._query_tokens_cache, query, tokens)
+        else:
+            self._query_tokens_cache.move_to_end(query)
+
+        key = tuple(sorted(tokens))
+        scores = self._bm25_scores_cache.get(key)
+        if scores is None:
+            scores = self._bm25.get_scores(tokens)
+            scores.flags.writeable = False
+            _lru_put(self._bm25_scores_cache, key, scores)
+        else:
+            self._bm25_scores_cache.move_to_end(key)
+        return scores
+
+    def _fuse(
+        self,
+        *,
+        bm25_query: str,
+        query_emb_search: np.ndarray,
+        vec_ids_list: list[int],
+        vec_scores_flat: np.ndarray,
+        all_scores_mrl: np.ndarray | None,
+        top_k: int,
+        metrics: Optional["RetrievalMetrics"],
+    ) -> list[ScoredChunk]:
+        assert self._bm25 is not None
+        assert self._doc_language is not None
+        n_docs = len(self._chunks)
 
         # Phase B: BM25 candidates.
-        bm25_query = (expanded_query or query).strip()
-        query_tokens = self._tokenize(bm25_query, language=self._doc_language)
-        bm25_scores = np.asarray(self._bm25.get_scores(query_tokens), dtype=np.float32)
+        bm25_scores = self._bm25_scores(bm25_query.strip())
 
+        # Fusion only needs the top-N as a set; just the metrics preview is sorted.
         bm25_fetch_k = min(max(top_k, self.candidate_k), n_docs)
         if bm25_fetch_k == n_docs:
-            bm25_top_idx = np.argsort(-bm25_scores)
+            bm25_top_idx = np.arange(n_docs)
         else:
             bm25_top_idx = np.argpartition(-bm25_scores, bm25_fetch_k - 1)[:bm25_fetch_k]
-            bm25_top_idx = bm25_top_idx[np.argsort(-bm25_scores[bm25_top_idx])]
 
         bm25_top_scores = bm25_scores[bm25_top_idx]
         bm25_min = float(np.min(bm25_top_scores)) if bm25_top_scores.size else 0.0
         bm25_max = float(np.max(bm25_top_scores)) if bm25_top_scores.size else 0.0
 
-        def norm_bm25(raw: float) -> float:
-            if bm25_max <= 0.0:
-                return 0.0
-            if abs(bm25_max - bm25_min) < 1e-12:
-                return 1.0
-            return float((raw - bm25_min) / (bm25_max - bm25_min))
-
-        bm25_norm_map: dict[int, float] = {
-            int(i): norm_bm25(float(s))
-            for i, s in zip(bm25_top_idx, bm25_top_scores)
-        }
-
         if metrics:
+            preview = np.argsort(-bm25_top_scores)[:10]
             metrics.add_step("bm25_search", data={
-                "topk_indices": bm25_top_idx.tolist()[:10],
-                "raw_scores": bm25_top_scores.tolist()[:10],
+                "topk_indices": bm25_top_idx[preview].tolist(),
+                "raw_scores": bm25_top_scores[preview].tolist(),
                 "norm_range": (bm25_min, bm25_max)
             })
 
-        # Phase C: Candidate union and fusion.
-        candidate_ids = set(vec_ids_list) | set(int(i) for i in bm25_top_idx.tolist())
-
-        # Compute vector scores for candidates missing from the vector search top-k
-        missing_indices = [idx for idx in candidate_ids if idx not in vec_scores_map]
-        if missing_indices:
+        # A zero score matches no query term. When no score in the top-N is
+        # negative it is bm25_min, so its normalized score is 0 and it would only
+        # add a vector-only candidate that already ranks below every vector
+        # top-k hit: drop it. Scores can be negative (the idf floor is
+        # epsilon * mean idf, and that mean can be negative); a zero then
+        # normalizes above 0 and must stay.
+        if bm25_min >= 0.0:
+            matched = bm25_top_scores > 0.0
+            if not matched.all():
+                bm25_top_idx = bm25_top_idx[matched]
+                bm25_top_scores = bm25_top_scores[matched]
+
+        # Phase C: Candidate union and fusion, as arrays aligned with the
+        # sorted candidate ids.
+        vec_ids = np.asarray(vec_ids_list, dtype=np.int64)
+        candidates = np.unique(np.concatenate([vec_ids, bm25_top_idx.astype(np.int64)]))
+
+        cos = np.empty(candidates.size, dtype=np.float64)
+        has_vec = np.zeros(candidates.size, dtype=bool)
+        vec_pos = np.searchsorted(candidates, vec_ids)
+        cos[vec_pos] = vec_scores_flat
+        has_vec[vec_pos] = True
+
+        # Vector scores for candidates missing from the vector search top-k.
+        missing = ~has_vec
+        if missing.any():
             if all_scores_mrl is not None:
-                # Optimized MRL: O(1) lookup since we computed all scores
-                for idx in missing_indices:
-                    cos = float(all_scores_mrl[idx])
-                    vec_scores_map[idx] = float(np.clip((cos + 1.0) * 0.5, 0.0, 1.0))
+                # MRL already scored every doc.
+                cos[missing] = all_scores_mrl[candidates[missing]]
             else:
-                # Optimized Vectorization: Compute all missing scores in one batch (M, D) @ (1, D).T
-                # instead of iterating with np.dot one by one.
-                missing_vecs = self._doc_embeddings[missing_indices]
-                # (M, Dim) @ (1, Dim).T -> (M, 1)
-                missing_scores = missing_vecs @ query_emb_search.T
-                missing_scores_flat = missing_scores.reshape(-1)
-
-                for idx, raw_score in zip(missing_indices, missing_scores_flat):
-                    cos = float(raw_score)
-                    vec_scores_map[idx] = float(np.clip((cos + 1.0) * 0.5, 0.0, 1.0))
-
-        scored: list[ScoredChunk] = []
-        for idx in candidate_ids:
-            # All candidates should now be in vec_scores_map
-            vector_score = vec_scores_map.get(idx, 0.0)  # fallback 0.0 just in case
-            bm25_norm = bm25_norm_map.get(idx, 0.0)
-            final = (self.vector_weight * vector_score) + (self.bm25_weight * bm25_norm)
-            scored.append(
-                ScoredChunk(
-                    chunk=self._chunks[idx],
-                    final_score=float(final),
-                    vector_score=float(vector_score),
-                    bm25_score_norm=float(bm25_norm),
-                )
+                missing_vecs = self._doc_vectors(candidates[missing].tolist())
+                cos[missing] = (missing_vecs @ query_emb_search.T).reshape(-1)
+
+        # Convert cosine [-1, 1] -> [0, 1] (spec expects 0..1).
+        vector_scores = np.clip((cos + 1.0) * 0.5, 0.0, 1.0)
+
+        # Per-query MinMax over the BM25 top-N; everything else scores 0.
+        bm25_norm = np.zeros(candidates.size, dtype=np.float64)
+        if bm25_max > 0.0:
+            span = bm25_max - bm25_min
+            bm25_norm[np.searchsorted(candidates, bm25_top_idx)] = (
+                1.0 if abs(span) < 1e-12 else (bm25_top_scores.astype(np.float64) - bm25_min) / span
             )
 
-        scored.sort(key=lambda x: x.final_score, reverse=True)
+        final = (self.vector_weight * vector_scores) + (self.bm25_weight * bm25_norm)
+        order = np.argsort(-final, kind="stable")[:top_k]
+        top_ids = candidates[order].tolist()
+        scored = [
+            ScoredChunk(
+                chunk=self._chunks[idx],
+                final_score=float(final[i]),
+                vector_score=float(vector_scores[i]),
+                bm25_score_norm=float(bm25_norm[i]),
+            )
+            for i, idx in zip(order, top_ids)
+        ]
+
         if metrics:
             metrics.add_step("hybrid_fusion", data={
                 "topk_chunks": [
                     {
                         "chunk_id": s.chunk.id,
-                        "chunk_idx": self._chunks.index(s.chunk),
+                        "chunk_idx": idx,
                         "final_score": s.final_score,
                         "vector_score": s.vector_score,
                         "bm25_norm": s.bm25_score_norm
-                    } for s in scored[:top_k]
+                    } for s, idx in zip(scored, top_ids)
                 ]
             })
-        return scored[: min(top_k, len(scored))]
+        return scored
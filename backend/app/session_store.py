@@ -1,16 +1,22 @@
 from __future__ import annotations
 
 import asyncio
+import heapq
+import itertools
 import time
 from collections import deque
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from typing import Any, Optional
 from .retrieval.evaluation import EvaluationRecord
 
+from .ingestion.chunker import estimate_tokens
 from .models.chunk import ChunkModel
 from .retrieval.hybrid_retriever import HybridRetriever, ScoredChunk
 
 
+LOG_HISTORY_MAX = 2000
+
+
 @dataclass
 class ChatTurn:
     role: str  # "user" | "assistant" (and optionally "system")
@@ -19,6 +25,21 @@ class ChatTurn:
     citations: list[ChunkModel] = field(default_factory=list)
 
 
+@dataclass(frozen=True)
+class DocumentSnapshot:
+    """
+    The session's current document and its ingest state. Ingestion replaces it
+    with a new snapshot in one assignment, so readers need no lock.
+    """
+
+    status: str = "idle"  # "idle" | "processing" | "ready" | "error"
+    error: str | None = None
+    filename: str | None = None
+    doc_language: str | None = None
+    chunks: list[ChunkModel] = field(default_factory=list)
+    retriever: HybridRetriever | None = None
+
+
 @dataclass
 class SessionState:
     session_id: str
@@ -26,26 +47,26 @@ class SessionState:
     last_access_at: float = field(default_factory=lambda: time.time())
     expires_at: float = 0.0
 
-    filename: str | None = None
-    doc_language: str | None = None
-
-    chunks: list[ChunkModel] = field(default_factory=list)
-    retriever: HybridRetriever | None = None
+    document: DocumentSnapshot = field(default_factory=DocumentSnapshot)
+    # BM25 tokens of the published document keyed by a digest of each chunk's
+    # language and text, so re-uploading the same file skips jieba/spaCy.
+    # Replaced whenever a new document is published.
+    tokenized_corpus: dict[str, list[str]] = field(default_factory=dict)
 
     chat_history: list[ChatTurn] = field(default_factory=list)
+    # estimate_tokens() of the "role: content" history prompt, kept up to date by add_chat_turn
+    chat_history_tokens: int = 0
 
     # Used for export: stable mapping chunk.id -> global reference number
     reference_ids: dict[str, int] = field(default_factory=dict)
     references: list[ChunkModel] = field(default_factory=list)
 
-    # Processing state
-    ingest_status: str = "idle"  # "idle" | "processing" | "ready" | "error"
-    ingest_error: str | None = None
-
-    # SSE logs
+    # SSE logs: history for replay, plus one queue per connected log stream.
+    # History keeps bare lines; the newest one has sequence number log_seq and
+    # the rest count down from it, so no (seq, line) tuple is kept per line.
     log_seq: int = 0
-    log_history: deque[tuple[int, str]] = field(default_factory=lambda: deque(maxlen=2000))
-    log_event: asyncio.Event = field(default_factory=asyncio.Event)
+    log_history: deque[str] = field(default_factory=lambda: deque(maxlen=LOG_HISTORY_MAX))
+    log_subscribers: set[asyncio.Queue[tuple[int, str]]] = field(default_factory=set)
 
     # concurrency
     lock: asyncio.Lock = field(default_factory=asyncio.Lock)
@@ -56,11 +77,70 @@ class SessionState:
         self.last_access_at = now
         self.expires_at = now + ttl_seconds
 
+    def set_document(self, **changes: Any) -> None:
+        self.document = replace(self.document, **changes)
+
     async def log(self, message: str) -> None:
-        line = message if message.endswith("\n") else f"{message}\n"
-        self.log_seq += 1
-        self.log_history.append((self.log_seq, line))
-        self.log_event.set()
+        await self.log_many([message])
+
+    async def log_many(self, messages: list[str]) -> None:
+        """
+        Append several lines in one step; subscribers receive them back to
+        back, so a stream drains them in a single wake-up.
+        """
+        lines = [message if message.endswith("\n") else f"{message}\n" for message in messages]
+        first_seq = self.log_seq + 1
+        self.log_seq += len(lines)
+        self.log_history.extend(lines)
+        if not self.log_subscribers:
+            return
+        entries = list(zip(itertools.count(first_seq), lines))
+        for queue in self.log_subscribers:
+            for entry in entries:
+                if queue.full():
+                    # Slow reader: drop its oldest line, like the bounded history does.
+                    queue.get_nowait()
+                queue.put_nowait(entry)
+
+    def subscribe_logs(self) -> asyncio.Queue[tuple[int, str]]:
+        """
+        Register a log stream; every later `log()` line is pushed onto the
+        returned queue. Pair with `unsubscribe_logs` when the stream ends.
+        """
+        queue: asyncio.Queue[tuple[int, str]] = asyncio.Queue(
+            maxsize=self.log_history.maxlen or LOG_HISTORY_MAX
+        )
+        self.log_subscribers.add(queue)
+        return queue
+
+    def unsubscribe_logs(self, queue: asyncio.Queue[tuple[int, str]]) -> None:
+        self.log_subscribers.discard(queue)
+
+    def iter_logs_since(self, seq: int) -> list[tuple[int, str]]:
+        """
+        History entries with a sequence number above `seq`, oldest first.
+        Walks the deque from the newest end, so a resuming stream pays for
+        the lines it missed rather than the whole history. A `seq` beyond
+        `log_seq` comes from an earlier incarnation of the session (e.g.
+        before a restart), so everything still retained is replayed.
+        """
+        if seq > self.log_seq:
+            seq = 0
+        missed = self.log_seq - seq
+        if missed <= 0:
+            return []
+        newer = list(itertools.islice(reversed(self.log_history), missed))
+        newer.reverse()
+        return list(zip(itertools.count(self.log_seq - len(newer) + 1), newer))
+
+    def add_chat_turn(self, turn: ChatTurn) -> None:
+        self.chat_history.append(turn)
+        # Lines are newline-joined and newlines never merge tokens, so counts add up.
+        self.chat_history_tokens += estimate_tokens(f"{turn.role}: {turn.content}")
+
+    def clear_chat(self) -> None:
+        self.chat_history = []
+        self.chat_history_tokens = 0
 
     def register_references(self, citations: list[ChunkModel]) -> None:
         """
@@ -76,12 +156,28 @@ class SessionState:
 # Global in-memory session store (ephemeral; cleared on process restart)
 SESSIONS: dict[str, SessionState] = {}
 
+# Expiry min-heap of (expires_at, session_id) with lazy deletion: touch() does not
+# push, so each session has one entry, re-pushed on pop if it was touched since.
+# _EXPIRY_SCHEDULED holds the live entry's time; entries that do not match it are stale.
+_EXPIRY_HEAP: list[tuple[float, str]] = []
+_EXPIRY_SCHEDULED: dict[str, float] = {}
+
+
+def _schedule_expiry(session_id: str, expires_at: float) -> None:
+    _EXPIRY_SCHEDULED[session_id] = expires_at
+    heapq.heappush(_EXPIRY_HEAP, (expires_at, session_id))
 
-def get_or_create_session(*, session_id: str, ttl_seconds: int) -> SessionState:
+
+def get_or_create_session(
+    *, session_id: str, ttl_seconds: int, log_history_max: int = LOG_HISTORY_MAX
+) -> SessionState:
     s = SESSIONS.get(session_id)
     if s is None:
-        s = SessionState(session_id=session_id)
+        s = SessionState(session_id=session_id, log_history=deque(maxlen=max(1, log_history_max)))
         SESSIONS[session_id] = s
+        s.touch(ttl_seconds=ttl_seconds)
+        _schedule_expiry(session_id, s.expires_at)
+        return s
     s.touch(ttl_seconds=ttl_seconds)
     return s
 
@@ -96,11 +192,35 @@ def get_session(*, session_id: str, ttl_seconds: int) -> SessionState | None:
 
 def delete_session(session_id: str) -> None:
     SESSIONS.pop(session_id, None)
+    _EXPIRY_SCHEDULED.pop(session_id, None)
+
+
+def next_expiry() -> float | None:
+    """
+    Earliest scheduled expiry, or None when no sessions exist. The session may
+    have been touched since, in which case cleanup only reschedules it.
+    """
+    while _EXPIRY_HEAP and _EXPIRY_SCHEDULED.get(_EXPIRY_HEAP[0][1]) != _EXPIRY_HEAP[0][0]:
+        heapq.heappop(_EXPIRY_HEAP)
+    return _EXPIRY_HEAP[0][0] if _EXPIRY_HEAP else None
 
 
 def cleanup_expired_sessions() -> int:
+    """
+    Remove sessions whose expiry has passed; O(log S) per due heap entry
+    rather than a scan of every session.
+    """
     now = time.time()
-    expired = [sid for sid, s in SESSIONS.items() if s.expires_at and s.expires_at <= now]
-    for sid in expired:
-        SESSIONS.pop(sid, None)
-    return len(expired)
+    removed = 0
+    while _EXPIRY_HEAP and _EXPIRY_HEAP[0][0] <= now:
+        expires_at, sid = heapq.heappop(_EXPIRY_HEAP)
+        if _EXPIRY_SCHEDULED.get(sid) != expires_at:
+            continue  # stale: session deleted or already rescheduled
+        s = SESSIONS.get(sid)
+        if s is not None and s.expires_at > now:
+            _schedule_expiry(sid, s.expires_at)
+            continue
+        del _EXPIRY_SCHEDULED[sid]
+        if SESSIONS.pop(sid, None) is not None:
+            removed += 1
+    return removed
@@ -0,0 +1,58 @@
+import math
+import unittest
+
+import numpy as np
+
+from backend.app.retrieval.bm25 import BM25Index
+
+
+def _okapi_scores(corpus: list[list[str]], query: list[str]) -> list[float]:
+    # Straight per-term loop with BM25Okapi's defaults (k1=1.5, b=0.75, epsilon=0.25).
+    n = len(corpus)
+    avgdl = sum(len(d) for d in corpus) / n
+    df: dict[str, int] = {}
+    for doc in corpus:
+        for term in set(doc):
+            df[term] = df.get(term, 0) + 1
+    idf = {t: math.log(n - f + 0.5) - math.log(f + 0.5) for t, f in df.items()}
+    eps = 0.25 * sum(idf.values()) / len(idf)
+    idf = {t: (eps if v < 0 else v) for t, v in idf.items()}
+    scores = []
+    for doc in corpus:
+        s = 0.0
+        for q in query:
+            tf = doc.count(q)
+            s += idf.get(q, 0.0) * tf * 2.5 / (tf + 1.5 * (0.25 + 0.75 * len(doc) / avgdl))
+        scores.append(s)
+    return scores
+
+
+class TestBM25Index(unittest.TestCase):
+    corpus = [
+        ["the", "cat", "sat", "on", "the", "mat"],
+        ["the", "dog", "chased", "the", "cat"],
+        [],
+        ["a", "bird", "sang"],
+        ["the", "the", "the"],
+    ]
+
+    def test_scores_match_okapi_formula(self) -> None:
+        index = BM25Index(self.corpus)
+        for query in (["cat"], ["the", "cat", "the"], ["bird", "unknown"], ["the"]):
+            scores = index.get_scores(query)
+            self.assertEqual(scores.dtype, np.float32)
+            np.testing.assert_allclose(scores, _okapi_scores(self.corpus, query), rtol=1e-6)
+
+    def test_unknown_or_empty_query_scores_zero(self) -> None:
+        index = BM25Index(self.corpus)
+        for query in ([], ["zebra"]):
+            np.testing.assert_array_equal(index.get_scores(query), np.zeros(5, dtype=np.float32))
+
+    def test_corpus_edge_cases(self) -> None:
+        with self.assertRaises(ValueError):
+            BM25Index([])
+        np.testing.assert_array_equal(BM25Index([[], []]).get_scores(["x"]), [0.0, 0.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,10 @@
 import unittest
-from backend.app.ingestion.chunker import Chunker, estimate_tokens
+from backend.app.ingestion.chunker import (
+    Chunker,
+    estimate_tokens,
+    estimate_tokens_bulk,
+    truncate_to_tokens,
+)
 from backend.app.models.chunk import ChunkModel
 from backend.app.ingestion.file_parser import ParsedBlock
 import os
@@ -16,12 +21,44 @@ class TestChunker(unittest.TestCase):
         self.assertEqual(estimate_tokens("你好"), 2)
         self.assertEqual(estimate_tokens("hello 你好"), 3)
 
+    def test_estimate_tokens_large_text_matches_small_path(self):
+        piece = "hello, world 42 你好！ "
+        text = piece * 1000
+        self.assertGreater(len(text), 4096)
+        self.assertEqual(estimate_tokens(text), estimate_tokens(piece) * 1000)
+
+    def test_estimate_tokens_bulk_matches_per_text(self):
+        texts = ["hello world", "", "你好", "end42", "hello 你好", "!!"]
+        self.assertEqual(
+            estimate_tokens_bulk(texts).tolist(),
+            [estimate_tokens(t) for t in texts],
+        )
+        self.assertEqual(estimate_tokens_bulk([]).tolist(), [])
+
+    def test_truncate_to_tokens(self):
+        self.assertEqual(truncate_to_tokens("hello world again", 2), "hello world ")
+        self.assertEqual(truncate_to_tokens("你好世界", 3), "你好世")
+        self.assertEqual(truncate_to_tokens("hello 你好", 5), "hello 你好")
+        self.assertEqual(truncate_to_tokens("hello", 0), "")
+        for text in ["a, b. c" * 50, "第一章 hello 世界 " * 40]:
+            for n in (1, 7, 30):
+                cut = truncate_to_tokens(text, n)
+                self.assertTrue(text.startswith(cut))
+                self.assertEqual(estimate_tokens(cut), min(n, estimate_tokens(text)))
+
     def test_split_sentences_simple(self):
         text = "Hello world. This is a test."
         sents = self.chunker._split_sentences(text)
         self.assertTrue(len(sents) >= 2)
         self.assertIn("Hello world.", sents[0])
 
+    def test_split_sentences_cjk(self):
+        text = "第一句。第二句？\n第三句！。没有结尾"
+        self.assertEqual(
+            self.chunker._split_sentences(text),
+            ["第一句。", "第二句？", "第三句！", "。", "没有结尾"],
+        )
+
     def test_semantic_split(self):
         # Real integration test with actual model
         # Using distinct topics
@@ -105,5 +142,87 @@ class TestChunker(unittest.TestCase):
         self.assertIn("epsilon zeta", chunks[2].content)
         self.assertIn("eta theta", chunks[2].content)
 
+    def test_prev_next_content_linked(self):
+        text = "alpha beta. gamma delta. epsilon zeta."
+        block = ParsedBlock(text=text, rich_text=text, metadata={})
+        chunker = Chunker(target_tokens=2, overlap_tokens=0, semantic_enabled=False)
+
+        chunks = chunker.chunk(blocks=[block])
+
+        self.assertEqual(len(chunks), 3)
+        self.assertIsNone(chunks[0].prev_content)
+        self.assertEqual(chunks[0].next_content, chunks[1].content)
+        self.assertEqual(chunks[1].prev_content, chunks[0].content)
+        self.assertEqual(chunks[1].next_content, chunks[2].content)
+        self.assertEqual(chunks[2].prev_content, chunks[1].content)
+        self.assertIsNone(chunks[2].next_content)
+
+        # Neighbour fields reference the adjacent chunk's string, not a copy.
+        self.assertIs(chunks[0].next_content, chunks[1].content)
+        self.assertIs(chunks[1].prev_content, chunks[0].content)
+
+    def test_chunk_ids_unique_across_documents(self):
+        text = "alpha beta. gamma delta. epsilon zeta."
+        block = ParsedBlock(text=text, rich_text=text, metadata={})
+        chunker = Chunker(target_tokens=2, overlap_tokens=0, semantic_enabled=False)
+
+        ids = [c.id for c in chunker.chunk(blocks=[block])]
+        ids += [c.id for c in chunker.chunk(blocks=[block])]
+
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(len(set(ids)), 6)
+
+    def test_chunk_ids_deterministic_with_document_id(self):
+        text = "alpha beta. gamma delta. epsilon zeta."
+        block = ParsedBlock(text=text, rich_text=text, metadata={})
+        chunker = Chunker(target_tokens=2, overlap_tokens=0, semantic_enabled=False)
+
+        first = [c.id for c in chunker.chunk(blocks=[block], document_id="doc-a")]
+        again = [c.id for c in chunker.chunk(blocks=[block], document_id="doc-a")]
+        other = [c.id for c in chunker.chunk(blocks=[block], document_id="doc-b")]
+
+        self.assertEqual(first, again)
+        self.assertEqual(len(set(first)), 3)
+        self.assertTrue(set(first).isdisjoint(other))
+
+    def test_chunk_bounds_size_and_semantic(self):
+        import numpy as np
+
+        chunker = Chunker(target_tokens=10, overlap_tokens=0, semantic_enabled=True, semantic_threshold=0.5)
+        tokens = np.array([4, 4, 4, 30, 20, 20, 20, 1])
+        distances = np.array([0.0, 0.0, 0.0, 0.0, 0.9, 0.0, 0.0])
+
+        bounds = list(chunker._iter_chunk_bounds(tokens, distances))
+
+        # Size flushes only; the oversized sentence gets a chunk of its own.
+        self.assertEqual(bounds, [(0, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8)])
+
+        # Semantic split after sentence 4, once more than 50 tokens are buffered.
+        chunker.target_tokens = 100
+        self.assertEqual(list(chunker._iter_chunk_bounds(tokens, distances)), [(0, 5), (5, 8)])
+
+    def test_short_document_skips_embedding(self):
+        text = "alpha beta. gamma delta. epsilon zeta."
+        block = ParsedBlock(text=text, rich_text=text, metadata={})
+        chunker = Chunker(target_tokens=100, overlap_tokens=0, semantic_enabled=True)
+
+        def fail(sentences):
+            raise AssertionError("embedding should not run for a short document")
+
+        chunker._calculate_cosine_distances = fail
+        chunks = chunker.chunk(blocks=[block])
+
+        self.assertEqual(len(chunks), 1)
+        self.assertIsNone(chunker._embed_model)
+
+    def test_chunk_dump_is_cached(self):
+        chunk = ChunkModel(id="c1", content="text", rich_content="<p>text</p>", metadata={"k": 1})
+
+        dumped = chunk.as_dict()
+
+        self.assertEqual(dumped, chunk.model_dump())
+        self.assertIs(chunk.as_dict(), dumped)
+        self.assertNotIn("_dump_cache", dumped)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from backend.app.config import _parse_dotenv_line, load_settings, reload_settings
+
+
+class TestLoadSettingsCache(unittest.TestCase):
+    def tearDown(self) -> None:
+        load_settings.cache_clear()
+
+    def test_load_settings_is_cached(self) -> None:
+        load_settings.cache_clear()
+        self.assertIs(load_settings(), load_settings())
+
+    def test_reload_settings_picks_up_env_changes(self) -> None:
+        with mock.patch.dict(os.environ, {"ERR_RRF_K": "17"}):
+            first = reload_settings()
+            self.assertEqual(first.rrf_k, 17)
+
+            os.environ["ERR_RRF_K"] = "23"
+            self.assertEqual(load_settings().rrf_k, 17)
+            self.assertEqual(reload_settings().rrf_k, 23)
+
+    def test_skip_dotenv_ignores_env_file(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            env_path = os.path.join(tmp, ".env")
+            with open(env_path, "w", encoding="utf-8") as f:
+                f.write("ERR_HYDE_MAX_WORDS=77\n")
+
+            with mock.patch.dict(os.environ, {"ENV_FILE": env_path, "ERR_SKIP_DOTENV": "1"}):
+                os.environ.pop("ERR_HYDE_MAX_WORDS", None)
+                self.assertEqual(reload_settings().hyde_max_words, 140)
+
+            with mock.patch.dict(os.environ, {"ENV_FILE": env_path, "ERR_SKIP_DOTENV": ""}):
+                os.environ.pop("ERR_HYDE_MAX_WORDS", None)
+                self.assertEqual(reload_settings().hyde_max_words, 77)
+
+    def test_llm_completion_cache_is_off_by_default(self) -> None:
+        # Cached prompts/answers are not tied to a session, so caching is opt-in.
+        with mock.patch.dict(os.environ, {"ERR_SKIP_DOTENV": "1"}):
+            os.environ.pop("ERR_LLM_CACHE_MAX_ENTRIES", None)
+            self.assertEqual(reload_settings().llm_cache_max_entries, 0)
+
+    def test_unanimous_rerank_skip_is_off_by_default(self) -> None:
+        # Skipping keeps the fused order, which rerank would otherwise change.
+        with mock.patch.dict(os.environ, {"ERR_SKIP_DOTENV": "1"}):
+            os.environ.pop("ERR_LLM_RERANK_SKIP_UNANIMOUS", None)
+            self.assertFalse(reload_settings().llm_rerank_skip_unanimous)
+
+
+class TestParseDotenvLine(unittest.TestCase):
+    def test_skips_blank_and_comment_lines(self) -> None:
+        self.assertIsNone(_parse_dotenv_line(""))
+        self.assertIsNone(_parse_dotenv_line("   "))
+        self.assertIsNone(_parse_dotenv_line("# OPENROUTER_API_KEY=x"))
+        self.assertIsNone(_parse_dotenv_line("no_equals_sign"))
+
+    def test_parses_plain_and_exported_values(self) -> None:
+        self.assertEqual(_parse_dotenv_line("  FOO=bar  "), ("FOO", "bar"))
+        self.assertEqual(_parse_dotenv_line("export FOO = bar"), ("FOO", "bar"))
+        self.assertEqual(_parse_dotenv_line("EMPTY="), ("EMPTY", ""))
+        self.assertEqual(_parse_dotenv_line("K=a=b"), ("K", "a=b"))
+
+    def test_strips_quotes_and_trailing_comments(self) -> None:
+        self.assertEqual(_parse_dotenv_line('FOO="a b"'), ("FOO", "a b"))
+        self.assertEqual(_parse_dotenv_line("FOO='a b' # note"), ("FOO", "a b"))
+        self.assertEqual(_parse_dotenv_line("FOO=abc # note"), ("FOO", "abc"))
+        self.assertEqual(_parse_dotenv_line("URL=http://h/#frag"), ("URL", "http://h/#frag"))
+
+
+if __name__ == "__main__":
+    unittest.main()
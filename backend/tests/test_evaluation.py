@@ -1,6 +1,9 @@
 import unittest
+from datetime import datetime
+
 from fastapi.testclient import TestClient
 from backend.app.main import app
+from backend.app.retrieval.evaluation import EvaluationRecord, RetrievalMetrics
 
 class TestEvaluationEndpoint(unittest.TestCase):
     def setUp(self):
@@ -19,5 +22,23 @@ class TestEvaluationEndpoint(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
         self.assertIn("No evaluation record", response.json()["detail"])
 
+class TestRetrievalMetrics(unittest.TestCase):
+    def test_record_round_trips_through_validation(self) -> None:
+        metrics = RetrievalMetrics(
+            session_id="s", user_query="q", mode="normal", start_time=datetime(2024, 1, 1)
+        )
+        metrics.add_step("drift_filter", skipped=True, reason="fast_mode")
+        metrics.add_step(
+            "final_context",
+            data={"chunks": [{"chunk_id": "c1", "rank": 1, "score": 0.0, "preview": "text"}]},
+        )
+
+        record = metrics.to_record()
+
+        self.assertEqual(record.final_context[0].chunk_id, "c1")
+        self.assertEqual(record.steps[0].reason, "fast_mode")
+        revalidated = EvaluationRecord.model_validate_json(record.model_dump_json())
+        self.assertEqual(revalidated.model_dump(), record.model_dump())
+
 if __name__ == "__main__":
     unittest.main()
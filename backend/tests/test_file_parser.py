@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+
+from ebooklib import epub
+
+from backend.app.ingestion.file_parser import FileParser, _decode_best_effort, _html_to_blocks
+
+
+XHTML = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>T</title></head><body>'
+    "<h1>Chapter 1</h1>"
+    "<div><p>Hello <span>big</span> <b>world</b>&amp; more</p><!-- note --><p>  </p>"
+    '<p>x<a href="#">link</a>y<script>var s;</script></p></div>'
+    "<h2>Section</h2><ul><li>one <i>two</i></li></ul>"
+    "</body></html>"
+)
+
+
+class TestHtmlToBlocks(unittest.TestCase):
+    def test_blocks_text_and_headings(self) -> None:
+        blocks = _html_to_blocks(html=XHTML, filename="book.epub")
+
+        self.assertEqual(
+            [b.text for b in blocks],
+            ["Chapter 1", "Hello big world & more", "x link y", "Section", "one two"],
+        )
+        self.assertEqual(blocks[0].metadata["kind"], "heading")
+        self.assertEqual(blocks[0].metadata["heading_level"], 1)
+        self.assertEqual(blocks[1].metadata["chapter_title"], "Chapter 1")
+        self.assertEqual(blocks[3].metadata["heading_level"], 2)
+        self.assertEqual(blocks[4].metadata["chapter_title"], "Section")
+
+    def test_rich_text_keeps_only_basic_formatting(self) -> None:
+        blocks = _html_to_blocks(html=XHTML, filename="book.epub")
+
+        self.assertEqual(blocks[1].rich_text, "<p>Hello big <b>world</b>&amp; more</p>")
+        self.assertEqual(blocks[4].rich_text, "<li>one <i>two</i></li>")
+
+    def test_plain_text_fallback(self) -> None:
+        blocks = _html_to_blocks(html="<div>first\n\nsecond</div>", filename="book.epub")
+
+        self.assertEqual([b.text for b in blocks], ["first", "second"])
+        self.assertEqual(_html_to_blocks(html="", filename="book.epub"), [])
+
+
+def _build_epub(chapters: list[str]) -> bytes:
+    book = epub.EpubBook()
+    book.set_identifier("test-book")
+    book.set_title("Test")
+    items = []
+    for i, body in enumerate(chapters):
+        item = epub.EpubHtml(title=f"c{i}", file_name=f"c{i}.xhtml", lang="en")
+        item.content = f"<html><body>{body}</body></html>"
+        book.add_item(item)
+        items.append(item)
+    book.spine = items
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "book.epub")
+        epub.write_epub(path, book)
+        with open(path, "rb") as f:
+            return f.read()
+
+
+class TestParseEpub(unittest.TestCase):
+    def test_items_keep_document_order(self) -> None:
+        chapters = [f"<h1>Chapter {i}</h1><p>Paragraph {i}</p>" for i in range(12)]
+        blocks = FileParser().parse(filename="book.epub", content=_build_epub(chapters))
+
+        texts = [b.text for b in blocks if b.text.startswith(("Chapter", "Paragraph"))]
+        expected = [t for i in range(12) for t in (f"Chapter {i}", f"Paragraph {i}")]
+        self.assertEqual(texts, expected)
+
+
+class TestDecodeBestEffort(unittest.TestCase):
+    def test_utf8_and_boms(self) -> None:
+        text = "Hello 你好"
+        self.assertEqual(_decode_best_effort(text.encode("utf-8")), text)
+        self.assertEqual(_decode_best_effort(text.encode("utf-8-sig")), text)
+        self.assertEqual(_decode_best_effort(text.encode("utf-16")), text)
+
+    def test_gb18030_without_bom(self) -> None:
+        text = "第一章 开始。这是一本用于测试编码检测的中文书籍，内容足够长以便识别。"
+        self.assertEqual(_decode_best_effort(text.encode("gb18030")), text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from backend.app.retrieval.fusion import dedupe_keep_order, rankings_agree_on_top, rrf_fuse
+
+
+class TestRrfFuse(unittest.TestCase):
+    def test_scores_sum_reciprocal_ranks(self) -> None:
+        # b: 1/62 + 1/61 beats a: 1/61 + 1/63; c only appears once.
+        self.assertEqual(rrf_fuse([["a", "b", "c"], ["b", "", "a"]], k=60), ["b", "a", "c"])
+
+    def test_ties_break_on_first_seen_rank_then_id(self) -> None:
+        # All tie on score. x and y were first seen at rank 1 (id decides), z at rank 2.
+        fused = rrf_fuse([["y", "z"], ["x", "y"], ["z", "x"]], k=60)
+        self.assertEqual(fused, ["x", "y", "z"])
+        self.assertEqual(rrf_fuse([["q"], ["p"]], k=60), ["p", "q"])
+
+    def test_max_results_and_validation(self) -> None:
+        self.assertEqual(rrf_fuse([["a", "b", "c"]], max_results=2), ["a", "b"])
+        self.assertEqual(rrf_fuse([]), [])
+        with self.assertRaises(ValueError):
+            rrf_fuse([["a"]], k=0)
+
+
+class TestDedupeKeepOrder(unittest.TestCase):
+    def test_strips_drops_empty_and_keeps_first_occurrence(self) -> None:
+        self.assertEqual(
+            dedupe_keep_order([" b ", "a", "", "b", None, "  ", "a "]),  # type: ignore[list-item]
+            ["b", "a"],
+        )
+        self.assertEqual(dedupe_keep_order([]), [])
+
+
+class TestRankingsAgreeOnTop(unittest.TestCase):
+    def test_same_top_set_in_any_order_agrees(self) -> None:
+        self.assertTrue(rankings_agree_on_top([["a", "b", "c"], ["b", "a", "d"]], 2))
+        self.assertFalse(rankings_agree_on_top([["a", "b", "c"], ["b", "c", "a"]], 2))
+
+    def test_needs_two_full_rankings(self) -> None:
+        self.assertFalse(rankings_agree_on_top([["a", "b"]], 2))
+        self.assertFalse(rankings_agree_on_top([["a"], ["a"]], 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
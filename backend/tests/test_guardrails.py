@@ -13,6 +13,12 @@ class TestGuardrails(unittest.TestCase):
         self.assertTrue(gr.ok)
         self.assertEqual(gr.answer, STRICT_NO_MENTION)
 
+    def test_strict_fallback_returns_shared_constant(self) -> None:
+        answer = "".join([" ", STRICT_NO_MENTION, "\n"])
+        gr = enforce_strict_rag_answer(answer=answer, context_size=5, require_citations=True)
+        self.assertTrue(gr.ok)
+        self.assertIs(gr.answer, STRICT_NO_MENTION)
+
     def test_rejects_empty_answer(self) -> None:
         gr = enforce_strict_rag_answer(answer="   ", context_size=5, require_citations=True)
         self.assertFalse(gr.ok)
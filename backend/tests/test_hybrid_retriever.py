@@ -1,7 +1,16 @@
 import unittest
+from datetime import datetime
+from unittest import mock
+
 import numpy as np
-from backend.app.retrieval.hybrid_retriever import HybridRetriever
+from backend.app.retrieval.hybrid_retriever import (
+    HybridRetriever,
+    _l2_normalize,
+    detect_dominant_language,
+    query_matches_language,
+)
 from backend.app.models.chunk import ChunkModel
+from backend.app.retrieval.evaluation import RetrievalMetrics
 
 class TestHybridRetriever(unittest.TestCase):
     def setUp(self):
@@ -88,5 +97,212 @@ class TestHybridRetriever(unittest.TestCase):
         )
         self.assertEqual(len(results), 5)
 
+    def test_mrl_doc_vectors_are_cached_per_dim(self):
+        query_emb = np.random.default_rng(3).random(self.dim).astype(np.float32)
+        results = self.retriever.search(query="zzz", query_embedding=query_emb, top_k=5, search_dim=4)
+
+        docs = self.embeddings[:, :4] / np.linalg.norm(self.embeddings[:, :4], axis=1, keepdims=True)
+        q = query_emb[:4] / np.linalg.norm(query_emb[:4])
+        expected = np.argsort(-(docs @ q))[:5]
+        self.assertEqual([r.chunk.id for r in results], [f"c{i}" for i in expected])
+
+        cached = self.retriever._doc_vectors_mrl[4]
+        self.retriever.search(query="zzz", query_embedding=query_emb, top_k=5, search_dim=4)
+        self.assertIs(self.retriever._doc_vectors_mrl[4], cached)
+        self.retriever.build_vector_index(embeddings=self.embeddings)
+        self.assertEqual(self.retriever._doc_vectors_mrl, {})
+
+    def test_search_many_matches_per_query_search(self):
+        rng = np.random.default_rng(7)
+        query_embs = rng.random((3, self.dim)).astype(np.float32)
+        queries = ["chunk number 3", "number 50", "chunk"]
+
+        for search_dim in (None, 4):
+            batched = self.retriever.search_many(
+                queries=queries, query_embeddings=query_embs, top_k=8, search_dim=search_dim
+            )
+
+            self.assertEqual(len(batched), 3)
+            for q, emb, results in zip(queries, query_embs, batched):
+                single = self.retriever.search(
+                    query=q, query_embedding=emb, expanded_query=q, top_k=8, search_dim=search_dim
+                )
+                self.assertEqual([r.chunk.id for r in results], [r.chunk.id for r in single])
+                for a, b in zip(results, single):
+                    self.assertAlmostEqual(a.final_score, b.final_score, places=6)
+
+    def test_large_corpus_uses_ivfpq(self):
+        self.assertTrue(self.retriever.index_description.startswith("IndexFlatIP"))
+
+        chunks = [
+            ChunkModel(id=f"c{i}", content=f"chunk number {i}", rich_content="", metadata={})
+            for i in range(300)
+        ]
+        embeddings = np.random.default_rng(3).random((300, self.dim)).astype(np.float32)
+        retriever = HybridRetriever(embedding_dim=self.dim, candidate_k=10, ivf_min_chunks=256)
+        retriever.build(chunks=chunks, embeddings=embeddings, doc_language="en")
+        self.assertTrue(retriever.index_description.startswith("IndexIVFPQ"))
+
+        target = embeddings[17]
+        results = retriever.search(query="chunk number 17", query_embedding=target, top_k=5)
+        self.assertEqual(results[0].chunk.id, "c17")
+        # Vector scores are exact cosines, not PQ approximations.
+        self.assertAlmostEqual(results[0].vector_score, 1.0, places=5)
+
+    def test_large_corpus_can_use_hnsw(self):
+        chunks = [
+            ChunkModel(id=f"c{i}", content=f"chunk number {i}", rich_content="", metadata={})
+            for i in range(300)
+        ]
+        embeddings = np.random.default_rng(3).random((300, self.dim)).astype(np.float32)
+        retriever = HybridRetriever(
+            embedding_dim=self.dim, candidate_k=10, ivf_min_chunks=256, ann_index="hnsw"
+        )
+        retriever.build(chunks=chunks, embeddings=embeddings, doc_language="en")
+        self.assertTrue(retriever.index_description.startswith("IndexHNSWFlat"))
+
+        results = retriever.search(query="chunk number 17", query_embedding=embeddings[17], top_k=5)
+        self.assertEqual(results[0].chunk.id, "c17")
+        self.assertAlmostEqual(results[0].vector_score, 1.0, places=5)
+        with self.assertRaises(ValueError):
+            HybridRetriever(embedding_dim=self.dim, ann_index="lsh")
+
+    def test_two_phase_build_matches_build(self):
+        retriever = HybridRetriever(
+            embedding_dim=self.dim, vector_weight=0.5, bm25_weight=0.5, candidate_k=10
+        )
+        with self.assertRaises(RuntimeError):
+            retriever.build_vector_index(embeddings=self.embeddings)
+
+        retriever.build_keyword_index(chunks=self.chunks, doc_language="en")
+        retriever.build_vector_index(embeddings=self.embeddings)
+
+        query_emb = np.random.default_rng(11).random(self.dim).astype(np.float32)
+        got = retriever.search(query="chunk number 42", query_embedding=query_emb, top_k=10)
+        want = self.retriever.search(query="chunk number 42", query_embedding=query_emb, top_k=10)
+        self.assertEqual([r.chunk.id for r in got], [r.chunk.id for r in want])
+
+    def test_int8_quantization_drops_fp32_vectors(self):
+        retriever = HybridRetriever(
+            embedding_dim=self.dim, vector_weight=0.5, bm25_weight=0.5,
+            candidate_k=10, vector_quantization="int8",
+        )
+        retriever.build(chunks=self.chunks, embeddings=self.embeddings, doc_language="en")
+        self.assertIsNone(retriever._doc_embeddings)
+        self.assertTrue(retriever.index_description.startswith("IndexScalarQuantizer"))
+
+        query_emb = np.random.default_rng(5).random(self.dim).astype(np.float32)
+        for search_dim in (None, 4):
+            results = retriever.search(
+                query="chunk number 50", query_embedding=query_emb, top_k=20, search_dim=search_dim
+            )
+            exact = self.retriever.search(
+                query="chunk number 50", query_embedding=query_emb, top_k=20, search_dim=search_dim
+            )
+            self.assertIn("c50", [r.chunk.id for r in results])
+            for a, b in zip(results[:3], exact[:3]):
+                self.assertAlmostEqual(a.vector_score, b.vector_score, places=2)
+
+        with self.assertRaises(ValueError):
+            HybridRetriever(embedding_dim=self.dim, vector_quantization="fp8")
+
+    def test_fusion_metrics_report_chunk_positions(self):
+        metrics = RetrievalMetrics(
+            session_id="s", user_query="q", mode="test", start_time=datetime.now()
+        )
+        results = self.retriever.search(
+            query="chunk number 42", query_embedding=self.embeddings[7], top_k=5, metrics=metrics
+        )
+        fusion = next(step for step in metrics.steps if step["name"] == "hybrid_fusion")
+        reported = [(c["chunk_id"], c["chunk_idx"]) for c in fusion["data"]["topk_chunks"]]
+        self.assertEqual(reported, [(r.chunk.id, int(r.chunk.id[1:])) for r in results])
+
+    def test_zero_bm25_scores_are_normalized_when_min_is_negative(self):
+        # Terms in most docs get a negative idf floor here, so the BM25 top-N
+        # mixes positive, negative and zero scores; MinMax then gives the
+        # zero-score "bird" doc a positive normalized score.
+        common = "t1 t2 t3 t4 t5 t6"
+        texts = [f"{common} cat", f"{common} dog", f"{common} cow", f"{common} zebra", "bird"]
+        chunks = [
+            ChunkModel(id=f"c{i}", content=text, rich_content="", metadata={})
+            for i, text in enumerate(texts)
+        ]
+        embeddings = np.random.default_rng(3).random((5, self.dim)).astype(np.float32)
+        for candidate_k, top_k in ((10, 5), (4, 4)):  # fetch_k == N, then argpartition
+            with self.subTest(candidate_k=candidate_k):
+                retriever = HybridRetriever(embedding_dim=self.dim, candidate_k=candidate_k)
+                retriever.build(chunks=chunks, embeddings=embeddings, doc_language="en")
+                raw = retriever._bm25_scores("t1 cat")
+                self.assertLess(raw.min(), 0.0)
+
+                results = retriever.search(
+                    query="t1 cat", query_embedding=embeddings[4], top_k=top_k
+                )
+                by_id = {r.chunk.id: r for r in results}
+                expected = (0.0 - raw.min()) / (raw.max() - raw.min())
+                self.assertAlmostEqual(by_id["c4"].bm25_score_norm, expected, places=6)
+                self.assertEqual(by_id["c0"].bm25_score_norm, 1.0)
+
+    def test_corpus_tokenization_matches_per_text(self):
+        texts = ["  Hello, World!  ", "", "Don't stop -- e.g. U.S.A. 3.5%", "  \n\t ", "naïve CAFÉ\u00a0bar"]
+        self.assertEqual(
+            self.retriever._tokenize_many(texts, language="en"),
+            [self.retriever._tokenize(t, language="en") for t in texts],
+        )
+        self.assertEqual(self.retriever._tokenize("  Hello, World!  ", language="en"), ["hello", "world"])
+
+    def test_precomputed_tokens_skip_tokenization(self):
+        retriever = HybridRetriever(embedding_dim=self.dim, candidate_k=10)
+        tokens = retriever.build_keyword_index(chunks=self.chunks, doc_language="en")
+        self.assertEqual(tokens[3], ["chunk", "number", "3"])
+
+        precomputed: list = list(tokens)
+        precomputed[5] = None
+        with mock.patch.object(retriever, "_tokenize_many", wraps=retriever._tokenize_many) as tokenize:
+            again = retriever.build_keyword_index(
+                chunks=self.chunks, doc_language="en", precomputed_tokens=precomputed
+            )
+        self.assertEqual(again, tokens)
+        tokenize.assert_called_once_with(["chunk number 5"], language="en")
+        with self.assertRaises(ValueError):
+            retriever.build_keyword_index(chunks=self.chunks, precomputed_tokens=tokens[:5])
+
+    def test_bm25_scores_are_cached_until_rebuild(self):
+        first = self.retriever._bm25_scores("number 7 chunk")
+        # Same token multiset in another order hits the score cache.
+        self.assertIs(self.retriever._bm25_scores("chunk 7 number"), first)
+        self.assertFalse(first.flags.writeable)
+        self.assertIsNot(self.retriever._bm25_scores("chunk chunk 7 number"), first)
+
+        self.retriever.build_keyword_index(chunks=self.chunks[:10], doc_language="en")
+        self.assertEqual(self.retriever._query_tokens_cache, {})
+        self.assertEqual(self.retriever._bm25_scores("number 7 chunk").shape, (10,))
+
+class TestL2Normalize(unittest.TestCase):
+    def test_rows_get_unit_norm_and_zero_rows_stay_zero(self) -> None:
+        vectors = np.array([[3.0, 4.0], [0.0, 0.0], [1e-3, 0.0]], dtype=np.float32)
+        out = _l2_normalize(vectors)
+        self.assertEqual(out.dtype, np.float32)
+        np.testing.assert_allclose(out, [[0.6, 0.8], [0.0, 0.0], [1.0, 0.0]], rtol=1e-6)
+
+
+class TestDetectDominantLanguage(unittest.TestCase):
+    def test_cjk_must_outnumber_latin_letters(self) -> None:
+        self.assertEqual(detect_dominant_language("第一章 开始。这是一本关于自然语言处理的书。"), "zh")
+        self.assertEqual(detect_dominant_language("Chapter One — naïve café, 42 pages."), "en")
+        # Ten CJK chars is not enough on its own, and Latin letters win ties.
+        self.assertEqual(detect_dominant_language("第一章开始这是一本书"), "en")
+        self.assertEqual(detect_dominant_language("中文" * 10 + "a" * 20), "en")
+        self.assertEqual(detect_dominant_language(""), "en")
+
+
+class TestQueryMatchesLanguage(unittest.TestCase):
+    def test_only_plain_same_language_queries_match(self) -> None:
+        self.assertTrue(query_matches_language("Who wrote chapter 3?", "en"))
+        self.assertFalse(query_matches_language("Qui a écrit le chapitre 3 ?", "en"))
+        self.assertFalse(query_matches_language("谁写了第三章？", "en"))
+        self.assertTrue(query_matches_language("谁写了第三章？", "zh"))
+        self.assertFalse(query_matches_language("Who wrote chapter 3?", "zh"))
+
 if __name__ == '__main__':
     unittest.main()
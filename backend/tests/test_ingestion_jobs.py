@@ -0,0 +1,58 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from backend.app.ingestion import jobs
+from backend.app.ingestion.jobs import (
+    UploadTooLargeError,
+    _chunker,
+    chunk_blocks,
+    parse_spooled_upload,
+    spool_upload,
+)
+
+
+class TestIngestionJobs(unittest.TestCase):
+    def test_spooled_upload_is_parsed_and_removed(self) -> None:
+        path = spool_upload(io.BytesIO(b"First paragraph.\n\nSecond paragraph."))
+        self.assertTrue(os.path.exists(path))
+
+        blocks, document_id = parse_spooled_upload(path, "notes.txt")
+
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual([b.text for b in blocks], ["First paragraph.", "Second paragraph."])
+        self.assertEqual(len(document_id), 32)
+
+    def test_oversized_upload_is_rejected_and_removed(self) -> None:
+        created: list[str] = []
+        real = tempfile.NamedTemporaryFile
+
+        def tracking(*args, **kwargs):
+            tmp = real(*args, **kwargs)
+            created.append(tmp.name)
+            return tmp
+
+        with mock.patch.object(jobs.tempfile, "NamedTemporaryFile", tracking):
+            with self.assertRaises(UploadTooLargeError):
+                spool_upload(io.BytesIO(b"x" * 10), max_bytes=9)
+            path = spool_upload(io.BytesIO(b"x" * 9), max_bytes=9)
+
+        self.assertFalse(os.path.exists(created[0]))
+        self.assertEqual(os.path.getsize(path), 9)
+        os.unlink(path)
+
+    def test_chunk_blocks_reuses_chunker(self) -> None:
+        path = spool_upload(io.BytesIO(b"alpha beta. gamma delta."))
+        blocks, document_id = parse_spooled_upload(path, "notes.txt")
+
+        first = chunk_blocks(blocks, document_id, 2, 0, False, 0.5)
+        again = chunk_blocks(blocks, document_id, 2, 0, False, 0.5)
+
+        self.assertEqual([c.id for c in first], [c.id for c in again])
+        self.assertIs(_chunker(2, 0, False, 0.5), _chunker(2, 0, False, 0.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,320 @@
+import asyncio
+import base64
+import functools
+import json
+import unittest
+
+import httpx
+import numpy as np
+from tenacity import stop_after_attempt
+
+from backend.app.config import Settings
+from backend.app.openrouter_client import (
+    ChatMessage,
+    OpenRouterClient,
+    OpenRouterError,
+    _decode_embedding,
+    _rerank_candidate,
+    _stack_embeddings,
+)
+
+
+def _client(handler, **settings) -> OpenRouterClient:
+    client = OpenRouterClient(Settings(openrouter_api_key="test-key", **settings))
+    client._client = httpx.AsyncClient(
+        base_url="https://openrouter.test/api/v1", transport=httpx.MockTransport(handler)
+    )
+    return client
+
+
+class TestEmbeddings(unittest.TestCase):
+    def test_base64_response_is_decoded(self) -> None:
+        expected = np.arange(6, dtype=np.float32).reshape(2, 3)
+        requests: list[dict] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(json.loads(request.content))
+            data = [
+                {"index": i, "embedding": base64.b64encode(row.astype("<f4").tobytes()).decode()}
+                for i, row in enumerate(expected)
+            ]
+            return httpx.Response(200, json={"data": data})
+
+        out = asyncio.run(_client(handler).embeddings(model="m", inputs=["a", "b"]))
+
+        self.assertEqual(requests[0]["encoding_format"], "base64")
+        self.assertEqual(out.dtype, np.float32)
+        np.testing.assert_array_equal(out, expected)
+
+    def test_float_lists_are_still_accepted(self) -> None:
+        def handler(request: httpx.Request) -> httpx.Response:
+            self.assertEqual(json.loads(request.content)["encoding_format"], "float")
+            return httpx.Response(200, json={"data": [{"embedding": [0.5, 1.5]}]})
+
+        client = _client(handler, embedding_encoding_format="float")
+        out = asyncio.run(client.embeddings(model="m", inputs=["a"]))
+
+        np.testing.assert_array_equal(out, np.array([[0.5, 1.5]], dtype=np.float32))
+
+    def test_error_payload_with_status_200_raises(self) -> None:
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(
+                200, json={"data": [], "error": {"code": 429, "message": "rate limited"}}
+            )
+
+        # Post without retries so the test does not sleep through backoff.
+        client = _client(handler)
+        post = OpenRouterClient._post_embeddings.retry_with(stop=stop_after_attempt(1), reraise=True)
+        client._post_embeddings = functools.partial(post, client)  # type: ignore[method-assign]
+        with self.assertRaisesRegex(OpenRouterError, "429: rate limited"):
+            asyncio.run(client.embeddings(model="m", inputs=["a"]))
+
+    def test_concurrent_query_embeddings_share_one_request(self) -> None:
+        requests: list[list[str]] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            inputs = json.loads(request.content)["input"]
+            requests.append(inputs)
+            data = [{"embedding": [float(len(text)), 0.0]} for text in inputs]
+            return httpx.Response(200, json={"data": data})
+
+        async def run(**settings) -> list[np.ndarray]:
+            client = _client(handler, embedding_encoding_format="float", **settings)
+            return await asyncio.gather(
+                client.embed_queries(model="m", inputs=["a", "bb"]),
+                client.embed_queries(model="m", inputs=["ccc"]),
+            )
+
+        first, second = asyncio.run(run(query_embedding_batch_window_ms=5))
+
+        self.assertEqual(requests, [["a", "bb", "ccc"]])
+        np.testing.assert_array_equal(first[:, 0], [1.0, 2.0])
+        np.testing.assert_array_equal(second[:, 0], [3.0])
+
+        # Batching is off by default: each caller gets its own request.
+        requests.clear()
+        asyncio.run(run())
+        self.assertEqual(requests, [["a", "bb"], ["ccc"]])
+
+    def test_failed_query_batch_is_retried_per_caller(self) -> None:
+        requests: list[list[str]] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            inputs = json.loads(request.content)["input"]
+            requests.append(inputs)
+            if "bad" in inputs:
+                return httpx.Response(400, json={"error": {"message": "invalid input"}})
+            data = [{"embedding": [float(len(text)), 0.0]} for text in inputs]
+            return httpx.Response(200, json={"data": data})
+
+        async def run() -> list:
+            client = _client(
+                handler, embedding_encoding_format="float", query_embedding_batch_window_ms=5
+            )
+            return await asyncio.gather(
+                client.embed_queries(model="m", inputs=["a", "bb"]),
+                client.embed_queries(model="m", inputs=["bad"]),
+                return_exceptions=True,
+            )
+
+        good, bad = asyncio.run(run())
+
+        self.assertEqual(requests, [["a", "bb", "bad"], ["a", "bb"], ["bad"]])
+        np.testing.assert_array_equal(good[:, 0], [1.0, 2.0])
+        self.assertIsInstance(bad, OpenRouterError)
+
+    def test_mismatched_embedding_lengths_raise(self) -> None:
+        with self.assertRaises(OpenRouterError):
+            _stack_embeddings([[1.0, 2.0], [1.0, 2.0, 3.0]])
+        packed = base64.b64encode(np.ones(2, dtype="<f4").tobytes()).decode()
+        np.testing.assert_array_equal(_stack_embeddings([packed, [0.5, 0.5]])[1], [0.5, 0.5])
+
+    def test_invalid_base64_raises(self) -> None:
+        with self.assertRaises(OpenRouterError):
+            _decode_embedding("not base64!")
+        with self.assertRaises(OpenRouterError):
+            _decode_embedding(base64.b64encode(b"\x00" * 5).decode())
+
+
+class TestChatCompletion(unittest.TestCase):
+    def test_content_is_returned_stripped(self) -> None:
+        def handler(request: httpx.Request) -> httpx.Response:
+            body = json.loads(request.content)
+            self.assertEqual(body["messages"], [{"role": "user", "content": "hi"}])
+            return httpx.Response(200, json={"choices": [{"message": {"content": "  hello \n"}}]})
+
+        out = asyncio.run(
+            _client(handler).chat_completion(
+                model="m", messages=[ChatMessage(role="user", content="hi")]
+            )
+        )
+
+        self.assertEqual(out, "hello")
+
+    def test_translation_is_cached_per_query_and_language(self) -> None:
+        calls: list[str] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(json.loads(request.content)["messages"][1]["content"])
+            return httpx.Response(200, json={"choices": [{"message": {"content": "translated"}}]})
+
+        async def run() -> list[str]:
+            client = _client(handler, llm_cache_max_entries=16)
+            return [
+                await client.translate_query_for_doc_language(query="q", doc_language="zh"),
+                await client.translate_query_for_doc_language(query="q", doc_language="zh"),
+                await client.translate_query_for_doc_language(query="q", doc_language="en"),
+            ]
+
+        self.assertEqual(asyncio.run(run()), ["translated"] * 3)
+        self.assertEqual(len(calls), 2)
+
+    def test_only_temperature_zero_completions_are_cached(self) -> None:
+        calls: list[float] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(json.loads(request.content)["temperature"])
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+        async def run(client: OpenRouterClient) -> None:
+            messages = [ChatMessage(role="user", content="hi")]
+            for temperature in (0.0, 0.0, 0.2, 0.2):
+                await client.chat_completion(model="m", messages=messages, temperature=temperature)
+
+        asyncio.run(run(_client(handler, llm_cache_max_entries=16)))
+        self.assertEqual(calls, [0.0, 0.2, 0.2])
+
+        calls.clear()
+        asyncio.run(run(_client(handler, llm_cache_max_entries=0)))
+        self.assertEqual(calls, [0.0, 0.0, 0.2, 0.2])
+
+    def test_only_transient_failures_are_retried(self) -> None:
+        statuses = iter([503, 200, 400])
+        calls: list[int] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            status = next(statuses)
+            calls.append(status)
+            if status != 200:
+                return httpx.Response(
+                    status, headers={"Retry-After": "0"}, json={"error": {"message": "boom"}}
+                )
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+        async def run() -> str:
+            client = _client(handler, llm_cache_max_entries=0)
+            messages = [ChatMessage(role="user", content="hi")]
+            first = await client.chat_completion(model="m", messages=messages)
+            with self.assertRaisesRegex(OpenRouterError, "boom") as ctx:
+                await client.chat_completion(model="m", messages=messages)
+            self.assertEqual(ctx.exception.status_code, 400)
+            return first
+
+        self.assertEqual(asyncio.run(run()), "ok")
+        # 503 retried once (Retry-After: 0), the 400 was not retried.
+        self.assertEqual(calls, [503, 200, 400])
+
+    def test_retrieval_aids_come_from_one_json_call(self) -> None:
+        bodies: list[dict] = []
+        reply = '```json\n{"variants": ["a  b", "a b", "c", 3], "hyde": " line one  \\nline two "}\n```'
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            bodies.append(json.loads(request.content))
+            return httpx.Response(200, json={"choices": [{"message": {"content": reply}}]})
+
+        aids = asyncio.run(
+            _client(handler).generate_retrieval_aids(query="q", doc_language="en", n_variants=6)
+        )
+
+        self.assertEqual(aids, {"variants": ["a b", "c"], "hyde": "line one\nline two"})
+        self.assertEqual(len(bodies), 1)
+        self.assertEqual(bodies[0]["response_format"], {"type": "json_object"})
+
+    def test_rerank_accepts_prefilled_continuation_or_full_object(self) -> None:
+        bodies: list[dict] = []
+        replies = iter(['"b", "a"]}', '{"ranked_ids": ["a", "b"]}'])
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            bodies.append(json.loads(request.content))
+            return httpx.Response(200, json={"choices": [{"message": {"content": next(replies)}}]})
+
+        async def run() -> list[list[str]]:
+            client = _client(handler, llm_cache_max_entries=0)
+            passages = [("a", "first"), ("b", "second"), ("c", "third")]
+            return [
+                await client.rerank_passages_yesno(query="q", passages=passages, doc_language="en")
+                for _ in range(2)
+            ]
+
+        self.assertEqual(asyncio.run(run()), [["b", "a", "c"], ["a", "b", "c"]])
+        self.assertEqual(bodies[0]["messages"][-1]["role"], "assistant")
+        self.assertEqual(bodies[0]["reasoning"], {"enabled": False})
+        self.assertNotIn("max_tokens", bodies[0])
+
+    def test_rerank_keeps_ids_from_a_truncated_reply(self) -> None:
+        bodies: list[dict] = []
+        # Cut off by the output cap in the middle of the third id.
+        replies = iter(['"c", "a", "b', "Sorry, I can't rank these."])
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            bodies.append(json.loads(request.content))
+            return httpx.Response(200, json={"choices": [{"message": {"content": next(replies)}}]})
+
+        async def run() -> list[list[str]]:
+            client = _client(handler)
+            passages = [("a", "first"), ("b", "second"), ("c", "third"), ("d", "fourth")]
+            return [
+                await client.rerank_passages_yesno(
+                    query="q", passages=passages, doc_language="en", max_output_tokens=64
+                )
+                for _ in range(2)
+            ]
+
+        self.assertEqual(asyncio.run(run()), [["c", "a", "b", "d"], ["a", "b", "c", "d"]])
+        self.assertEqual(bodies[0]["max_tokens"], 64)
+
+
+class TestRerankCandidate(unittest.TestCase):
+    def test_long_passages_are_cut_at_a_word_boundary(self) -> None:
+        line = _rerank_candidate("p1", "  " + "word " * 100, 200)
+        self.assertTrue(line.startswith("- id: p1\n  passage: word"))
+        self.assertTrue(line.endswith("word…"))
+        self.assertLessEqual(len(line.split("passage: ", 1)[1]), 200)
+
+    def test_text_without_spaces_is_hard_cut(self) -> None:
+        passage = _rerank_candidate("p1", "字" * 300, 200).split("passage: ", 1)[1]
+        self.assertEqual(passage, "字" * 199 + "…")
+        self.assertEqual(_rerank_candidate("p1", " short ", 200), "- id: p1\n  passage: short")
+
+    def test_token_cap_replaces_char_cap(self) -> None:
+        line = _rerank_candidate("p1", "字" * 300 + " tail", 2000, max_tokens=50)
+        self.assertEqual(line.split("passage: ", 1)[1], "字" * 50 + "…")
+
+
+class TestExtractJsonText(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = OpenRouterClient(Settings(openrouter_api_key="test-key"))
+
+    def test_code_fences_are_stripped(self) -> None:
+        for text in ('```json\n{"a": 1}\n```', '```JSON {"a": 1}```', '```\n[1, 2]\n```'):
+            extracted = self.client._extract_json_text(text)
+            self.assertIsNotNone(extracted)
+            self.assertEqual(extracted, extracted.strip())
+            json.loads(extracted)
+
+    def test_json_is_found_inside_commentary(self) -> None:
+        self.assertEqual(
+            self.client._extract_json_text('Sure! {"variants": ["x"]} Hope that helps.'),
+            '{"variants": ["x"]}',
+        )
+        self.assertIsNone(self.client._extract_json_text("no json here"))
+
+    def test_trailing_braces_in_commentary_do_not_break_extraction(self) -> None:
+        self.assertEqual(
+            self.client._extract_json_text('See [1]. {"ranked_ids": ["a"]} (ids look like {id})'),
+            '{"ranked_ids": ["a"]}',
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
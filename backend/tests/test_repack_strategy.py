@@ -1,37 +1,52 @@
 import unittest
 
+from backend.app.repacking import (
+    apply_repack_strategy,
+    repack_chunks,
+    repack_chunks_reverse,
+    resolve_repack,
+)
 
-class TestRepackStrategy(unittest.TestCase):
-    def test_repack_chunks_reverse_reverses(self) -> None:
-        from backend.app.repacking import repack_chunks_reverse
-
-        self.assertEqual(repack_chunks_reverse([1, 2, 3]), [3, 2, 1])
-
-    def test_repack_chunks_strategy_forward_keeps_order(self) -> None:
-        from backend.app.repacking import repack_chunks
+# Shared inputs: the re-packers must never mutate the list they are given.
+_CHUNKS = ["a", "b", "c"]
+_REVERSED = ["c", "b", "a"]
 
-        chunks = ["a", "b", "c"]
-        self.assertIs(repack_chunks(chunks, strategy="forward"), chunks)
 
-    def test_repack_chunks_strategy_reverse_reverses(self) -> None:
-        from backend.app.repacking import repack_chunks
-
-        self.assertEqual(repack_chunks(["a", "b", "c"], strategy="reverse"), ["c", "b", "a"])
+class TestRepackStrategy(unittest.TestCase):
+    def tearDown(self) -> None:
+        self.assertEqual(_CHUNKS, ["a", "b", "c"])
 
-    def test_repack_chunks_strategy_unknown_defaults_to_reverse(self) -> None:
-        from backend.app.repacking import repack_chunks
+    def test_repack_chunks_reverse_reverses(self) -> None:
+        self.assertEqual(repack_chunks_reverse([1, 2, 3]), [3, 2, 1])
 
-        self.assertEqual(repack_chunks(["a", "b", "c"], strategy="???"), ["c", "b", "a"])
+    def test_repack_chunks_strategies(self) -> None:
+        # (strategy, expected order, whether the input list itself comes back)
+        cases = [
+            ("forward", _CHUNKS, True),
+            (" Off ", _CHUNKS, True),
+            ("none", _CHUNKS, True),
+            ("DISABLED", _CHUNKS, True),
+            ("reverse", _REVERSED, False),
+            ("???", _REVERSED, False),  # unknown names default to reverse
+            ("", _REVERSED, False),
+        ]
+        for strategy, expected, same_object in cases:
+            with self.subTest(strategy=strategy):
+                result = repack_chunks(_CHUNKS, strategy=strategy)
+                self.assertEqual(result, expected)
+                self.assertEqual(result is _CHUNKS, same_object)
+
+    def test_resolve_repack_returns_none_for_unknown_names(self) -> None:
+        self.assertIs(resolve_repack(" Reverse"), repack_chunks_reverse)
+        self.assertIs(resolve_repack("off")(_CHUNKS), _CHUNKS)
+        self.assertIsNone(resolve_repack("???"))
 
     def test_apply_repack_strategy_fast_mode_skips(self) -> None:
-        from backend.app.repacking import apply_repack_strategy
-
-        chunks = ["a", "b", "c"]
         self.assertIs(
-            apply_repack_strategy(chunks, fast_mode=True, repack_strategy="reverse"),
-            chunks,
+            apply_repack_strategy(_CHUNKS, fast_mode=True, repack_strategy="reverse"),
+            _CHUNKS,
         )
         self.assertIs(
-            apply_repack_strategy(chunks, fast_mode=True, repack_strategy="forward"),
-            chunks,
+            apply_repack_strategy(_CHUNKS, fast_mode=True, repack_strategy="forward"),
+            _CHUNKS,
         )
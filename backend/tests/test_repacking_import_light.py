@@ -0,0 +1,20 @@
+import sys
+import unittest
+
+
+class TestRepackingImportLight(unittest.TestCase):
+    def test_importing_repacking_adds_no_dependencies(self) -> None:
+        sys.modules.pop("backend.app.repacking", None)
+        before = set(sys.modules)
+
+        __import__("backend.app.repacking")
+
+        self.assertLessEqual(
+            set(sys.modules) - before,
+            {"__future__", "backend", "backend.app", "backend.app.repacking"},
+            msg="`backend.app.repacking` should not import anything beyond its package.",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,20 +1,83 @@
-import importlib
+import contextlib
+import os
+import subprocess
 import sys
 import unittest
+from collections.abc import Iterator
+from pathlib import Path
+
+_HEAVY_MODULES = ("faiss", "torch", "sentence_transformers")
+_REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+@contextlib.contextmanager
+def _sandbox_modules(prefix: str) -> Iterator[None]:
+    """
+    Unload `prefix` and all of its submodules for the duration of the block,
+    then drop whatever the block imported under it and restore the originals.
+    """
+
+    def under(name: str) -> bool:
+        return name == prefix or name.startswith(prefix + ".")
+
+    saved = {name: mod for name, mod in sys.modules.items() if under(name)}
+    for name in saved:
+        del sys.modules[name]
+    try:
+        yield
+    finally:
+        for name in [name for name in sys.modules if under(name)]:
+            del sys.modules[name]
+        sys.modules.update(saved)
 
 
 class TestRetrievalInitImportLight(unittest.TestCase):
     def test_importing_retrieval_does_not_import_hybrid_retriever(self) -> None:
-        # Ensure a clean slate for this module under test.
-        sys.modules.pop("backend.app.retrieval", None)
-        sys.modules.pop("backend.app.retrieval.hybrid_retriever", None)
-
-        importlib.import_module("backend.app.retrieval")
+        with _sandbox_modules("backend.app.retrieval"):
+            before = set(sys.modules)
+            __import__("backend.app.retrieval")
+            newly_imported = set(sys.modules) - before
 
         self.assertNotIn(
             "backend.app.retrieval.hybrid_retriever",
-            sys.modules,
+            newly_imported,
             msg="`backend.app.retrieval` should remain import-light and not import "
             "`hybrid_retriever` implicitly.",
         )
+        # Other tests may already have loaded these, so only flag new imports.
+        for name in _HEAVY_MODULES:
+            self.assertNotIn(name, newly_imported, msg=f"`backend.app.retrieval` imported {name}")
+
+    def test_hybrid_retriever_loads_on_first_attribute_access(self) -> None:
+        with _sandbox_modules("backend.app.retrieval"):
+            __import__("backend.app.retrieval")
+            retrieval = sys.modules["backend.app.retrieval"]
+            self.assertNotIn("backend.app.retrieval.hybrid_retriever", sys.modules)
+
+            with self.assertWarns(DeprecationWarning):
+                cls = retrieval.HybridRetriever
+
+            loaded = sys.modules["backend.app.retrieval.hybrid_retriever"]
+            self.assertIs(cls, loaded.HybridRetriever)
+            # Cached on the package: later lookups skip __getattr__ (and the warning).
+            self.assertIs(vars(retrieval)["ScoredChunk"], loaded.ScoredChunk)
+
+    def test_fresh_interpreter_import_stays_light(self) -> None:
+        # A clean interpreter, so modules loaded by earlier tests cannot mask an
+        # eager import. -X importtime logs every module the import loads.
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import backend.app.retrieval"],
+            cwd=_REPO_ROOT,
+            capture_output=True,
+            env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+            check=True,
+        )
+        imported = {
+            line.rsplit("|", 1)[-1].strip()
+            for line in result.stderr.decode().splitlines()
+            if line.startswith("import time:")
+        }
 
+        self.assertIn("backend.app.retrieval", imported)
+        for name in ("backend.app.retrieval.hybrid_retriever", *_HEAVY_MODULES):
+            self.assertNotIn(name, imported)
@@ -0,0 +1,172 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from backend.app.ingestion.chunker import estimate_tokens
+from backend.app import session_store
+from backend.app.session_store import (
+    LOG_HISTORY_MAX,
+    ChatTurn,
+    SessionState,
+    cleanup_expired_sessions,
+    delete_session,
+    get_or_create_session,
+    get_session,
+    next_expiry,
+)
+
+
+class TestSessionLogSubscribers(unittest.TestCase):
+    def test_log_lines_reach_every_subscriber(self) -> None:
+        async def run() -> None:
+            session = SessionState(session_id="s")
+            await session.log("before")
+            first = session.subscribe_logs()
+            second = session.subscribe_logs()
+
+            await session.log("one")
+            session.unsubscribe_logs(second)
+            await session.log("two")
+
+            self.assertEqual([first.get_nowait(), first.get_nowait()], [(2, "one\n"), (3, "two\n")])
+            self.assertEqual(second.get_nowait(), (2, "one\n"))
+            self.assertTrue(second.empty())
+            self.assertEqual(len(session.log_history), 3)
+
+        asyncio.run(run())
+
+    def test_slow_subscriber_drops_oldest_lines(self) -> None:
+        async def run() -> None:
+            session = SessionState(session_id="s")
+            queue = session.subscribe_logs()
+            for i in range(LOG_HISTORY_MAX + 5):
+                await session.log(f"line {i}")
+
+            self.assertEqual(queue.qsize(), LOG_HISTORY_MAX)
+            self.assertEqual(queue.get_nowait(), (6, "line 5\n"))
+
+        asyncio.run(run())
+
+    def test_log_many_appends_in_order(self) -> None:
+        async def run() -> None:
+            session = SessionState(session_id="s")
+            queue = session.subscribe_logs()
+            await session.log_many(["a", "b\n", "c"])
+
+            self.assertEqual(list(session.log_history), ["a\n", "b\n", "c\n"])
+            self.assertEqual(
+                [queue.get_nowait() for _ in range(3)], [(1, "a\n"), (2, "b\n"), (3, "c\n")]
+            )
+
+        asyncio.run(run())
+
+    def test_iter_logs_since_returns_only_newer_entries(self) -> None:
+        async def run() -> None:
+            session = SessionState(session_id="s")
+            for i in range(5):
+                await session.log(f"line {i}")
+
+            self.assertEqual(session.iter_logs_since(3), [(4, "line 3\n"), (5, "line 4\n")])
+            self.assertEqual(len(session.iter_logs_since(0)), 5)
+            self.assertEqual(session.iter_logs_since(5), [])
+
+        asyncio.run(run())
+
+    def test_iter_logs_since_replays_all_for_id_from_older_session(self) -> None:
+        async def run() -> None:
+            # A Last-Event-ID from before the session was recreated is ahead of log_seq.
+            session = SessionState(session_id="s")
+            for i in range(2):
+                await session.log(f"line {i}")
+
+            self.assertEqual(session.iter_logs_since(40), [(1, "line 0\n"), (2, "line 1\n")])
+
+        asyncio.run(run())
+
+    def test_history_limit_keeps_sequence_numbers(self) -> None:
+        async def run() -> None:
+            with mock.patch.dict(session_store.SESSIONS, clear=True):
+                session = get_or_create_session(session_id="s", ttl_seconds=10, log_history_max=3)
+            for i in range(5):
+                await session.log(f"line {i}")
+
+            self.assertEqual(session.subscribe_logs().maxsize, 3)
+            self.assertEqual(
+                session.iter_logs_since(0), [(3, "line 2\n"), (4, "line 3\n"), (5, "line 4\n")]
+            )
+            self.assertEqual(session.iter_logs_since(4), [(5, "line 4\n")])
+
+        asyncio.run(run())
+
+
+class TestSessionChatHistory(unittest.TestCase):
+    def test_history_tokens_match_rendered_history(self) -> None:
+        session = SessionState(session_id="s")
+        for role, content in [("user", "What is 第一章 about?"), ("assistant", "It covers [1]\nsetup."), ("user", "")]:
+            session.add_chat_turn(ChatTurn(role=role, content=content))
+
+        history_text = "\n".join(f"{t.role}: {t.content}" for t in session.chat_history)
+        self.assertEqual(session.chat_history_tokens, estimate_tokens(history_text))
+
+        session.clear_chat()
+        self.assertEqual((session.chat_history, session.chat_history_tokens), ([], 0))
+
+
+class TestSessionExpiry(unittest.TestCase):
+    def setUp(self) -> None:
+        self._saved = (
+            dict(session_store.SESSIONS),
+            list(session_store._EXPIRY_HEAP),
+            dict(session_store._EXPIRY_SCHEDULED),
+        )
+        session_store.SESSIONS.clear()
+        session_store._EXPIRY_HEAP.clear()
+        session_store._EXPIRY_SCHEDULED.clear()
+
+    def tearDown(self) -> None:
+        sessions, heap, scheduled = self._saved
+        session_store.SESSIONS.clear()
+        session_store.SESSIONS.update(sessions)
+        session_store._EXPIRY_HEAP[:] = heap
+        session_store._EXPIRY_SCHEDULED.clear()
+        session_store._EXPIRY_SCHEDULED.update(scheduled)
+
+    def test_touched_sessions_are_rescheduled_not_removed(self) -> None:
+        with mock.patch.object(session_store.time, "time") as clock:
+            clock.return_value = 1000.0
+            get_or_create_session(session_id="a", ttl_seconds=10)
+            get_or_create_session(session_id="b", ttl_seconds=10)
+            self.assertEqual(next_expiry(), 1010.0)
+
+            clock.return_value = 1005.0
+            get_session(session_id="a", ttl_seconds=10)
+
+            clock.return_value = 1011.0
+            self.assertEqual(cleanup_expired_sessions(), 1)
+            self.assertEqual(set(session_store.SESSIONS), {"a"})
+            self.assertEqual(next_expiry(), 1015.0)
+            self.assertEqual(len(session_store._EXPIRY_HEAP), 1)
+
+            clock.return_value = 1016.0
+            self.assertEqual(cleanup_expired_sessions(), 1)
+            self.assertIsNone(next_expiry())
+
+    def test_deleted_then_recreated_session_keeps_one_schedule(self) -> None:
+        with mock.patch.object(session_store.time, "time") as clock:
+            clock.return_value = 1000.0
+            get_or_create_session(session_id="a", ttl_seconds=10)
+            delete_session("a")
+            self.assertIsNone(next_expiry())
+
+            clock.return_value = 1020.0
+            get_or_create_session(session_id="a", ttl_seconds=10)
+            self.assertEqual(cleanup_expired_sessions(), 0)
+            self.assertEqual(next_expiry(), 1030.0)
+
+            clock.return_value = 1031.0
+            self.assertEqual(cleanup_expired_sessions(), 1)
+            self.assertEqual(session_store.SESSIONS, {})
+
+
+if __name__ == "__main__":
+    unittest.main()